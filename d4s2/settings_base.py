@@ -193,3 +193,72 @@ DIRECTORY_SERVICE_URL = os.getenv('D4S2_DIRECTORY_SERVICE_URL')
 TRANSFER_PIPELINE_URL = os.getenv('D4S2_TRANSFER_PIPELINE_URL')
 AZURE_SAAS_URL = os.getenv('D4S2_SAAS_URL')
 AZURE_SAAS_KEY = os.getenv('D4S2_SAAS_KEY')
+# Size of the connection pool used by each cached S3 resource, increase to allow more parallel S3 requests
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('D4S2_S3_MAX_POOL_CONNECTIONS', 50))
+# Account key used to read Azure Data Lake storage, when unset DefaultAzureCredential is used
+AZURE_STORAGE_ACCOUNT_KEY = os.getenv('D4S2_AZURE_STORAGE_ACCOUNT_KEY')
+# Number of top level directories listed in parallel when summarizing an Azure project
+AZURE_PROJECT_SUMMARY_WORKERS = int(os.getenv('D4S2_AZURE_PROJECT_SUMMARY_WORKERS', 8))
+AZURE_PROJECT_SUMMARY_CACHE_SECONDS = int(os.getenv('D4S2_AZURE_PROJECT_SUMMARY_CACHE_SECONDS', 300))
+# Storage-as-a-Service container lookups are cached in each process
+AZURE_SAAS_TIMEOUT = float(os.getenv('D4S2_SAAS_TIMEOUT', 5))
+AZURE_SAAS_CACHE_SECONDS = int(os.getenv('D4S2_SAAS_CACHE_SECONDS', 300))
+# How long to remember containers that were not found
+AZURE_SAAS_NEGATIVE_CACHE_SECONDS = int(os.getenv('D4S2_SAAS_NEGATIVE_CACHE_SECONDS', 30))
+# How long expired details may still be used when Storage-as-a-Service is unavailable
+AZURE_SAAS_STALE_SECONDS = int(os.getenv('D4S2_SAAS_STALE_SECONDS', 3600))
+# Number of recursive ACL updates run in parallel when giving users access to a delivered Azure project
+AZURE_ACL_WORKERS = int(os.getenv('D4S2_AZURE_ACL_WORKERS', 8))
+# Number of files and directories updated per recursive ACL request (max 2000)
+AZURE_ACL_BATCH_SIZE = int(os.getenv('D4S2_AZURE_ACL_BATCH_SIZE', 2000))
+# Maximum number of manifest chunks the transfer pipeline may upload for one transfer
+AZURE_MAX_MANIFEST_CHUNKS = int(os.getenv('D4S2_AZURE_MAX_MANIFEST_CHUNKS', 10000))
+# Set to 'local' to copy Azure projects between file:// container urls in this process instead of using
+# TRANSFER_PIPELINE_URL, for exercising and benchmarking Azure deliveries offline
+AZURE_TRANSFER_EXECUTOR = os.getenv('D4S2_AZURE_TRANSFER_EXECUTOR', 'pipeline')
+# Transfer webhook (az-transfers) url and the API token of a transfer_poster user used by the local executor
+AZURE_LOCAL_TRANSFER_WEBHOOK_URL = os.getenv('D4S2_AZURE_LOCAL_TRANSFER_WEBHOOK_URL')
+AZURE_LOCAL_TRANSFER_WEBHOOK_TOKEN = os.getenv('D4S2_AZURE_LOCAL_TRANSFER_WEBHOOK_TOKEN')
+AZURE_LOCAL_TRANSFER_WORKERS = int(os.getenv('D4S2_AZURE_LOCAL_TRANSFER_WORKERS', 8))
+# Maximum random delay before each local transfer and the fraction of local transfers that fail
+AZURE_LOCAL_TRANSFER_DELAY_SECONDS = float(os.getenv('D4S2_AZURE_LOCAL_TRANSFER_DELAY_SECONDS', 0))
+AZURE_LOCAL_TRANSFER_FAILURE_RATE = float(os.getenv('D4S2_AZURE_LOCAL_TRANSFER_FAILURE_RATE', 0))
+# Authenticated DukeDS clients are cached per user in each process
+DDS_CLIENT_CACHE_SIZE = int(os.getenv('D4S2_DDS_CLIENT_CACHE_SIZE', 500))
+DDS_CLIENT_CACHE_SECONDS = int(os.getenv('D4S2_DDS_CLIENT_CACHE_SECONDS', 3600))
+# Stop using a cached client this long before its DukeDS api token expires
+DDS_TOKEN_EXPIRATION_MARGIN_SECONDS = int(os.getenv('D4S2_DDS_TOKEN_EXPIRATION_MARGIN_SECONDS', 300))
+# DukeDS user details are cached per process, users that are not found are cached for less time
+DDS_USER_CACHE_SIZE = int(os.getenv('D4S2_DDS_USER_CACHE_SIZE', 5000))
+DDS_USER_CACHE_SECONDS = int(os.getenv('D4S2_DDS_USER_CACHE_SECONDS', 600))
+DDS_USER_NEGATIVE_CACHE_SECONDS = int(os.getenv('D4S2_DDS_USER_NEGATIVE_CACHE_SECONDS', 60))
+# Name of an entry in CACHES used to share DukeDS user details between processes, unset to disable
+DDS_USER_CACHE_BACKEND = os.getenv('D4S2_DDS_USER_CACHE_BACKEND')
+# Number of recent recipients suggested to a sender and how many of their details are fetched at once
+DDS_RECENT_USERS_LIMIT = int(os.getenv('D4S2_DDS_RECENT_USERS_LIMIT', 50))
+DDS_USER_FETCH_WORKERS = int(os.getenv('D4S2_DDS_USER_FETCH_WORKERS', 8))
+# Number of additional users given permission to a delivered DukeDS project at once
+DDS_SHARE_WORKERS = int(os.getenv('D4S2_DDS_SHARE_WORKERS', 8))
+# DukeDS project transfers older than this are refreshed in the background when listed
+DDS_TRANSFER_SYNC_SECONDS = int(os.getenv('D4S2_DDS_TRANSFER_SYNC_SECONDS', 60))
+# A queued DukeDS project transfers sync that has not finished after this long is queued again
+DDS_TRANSFER_SYNC_QUEUED_SECONDS = int(os.getenv('D4S2_DDS_TRANSFER_SYNC_QUEUED_SECONDS', 600))
+# DukeDS project summaries are cached until the project is updated, children are counted a page at a time
+DDS_PROJECT_SUMMARY_CACHE_SECONDS = int(os.getenv('D4S2_DDS_PROJECT_SUMMARY_CACHE_SECONDS', 3600))
+DDS_PROJECT_CHILDREN_PAGE_SIZE = int(os.getenv('D4S2_DDS_PROJECT_CHILDREN_PAGE_SIZE', 500))
+# Name of an entry in CACHES used to share DukeDS project summaries between processes, unset to cache per process
+DDS_PROJECT_SUMMARY_CACHE_BACKEND = os.getenv('D4S2_DDS_PROJECT_SUMMARY_CACHE_BACKEND')
+# Set to 0 to stop summarizing DukeDS projects in the background when a delivery is created,
+# only done when DDS_PROJECT_SUMMARY_CACHE_BACKEND is set so web processes can use the result
+DDS_PROJECT_SUMMARY_PRECOMPUTE = int(os.getenv('D4S2_DDS_PROJECT_SUMMARY_PRECOMPUTE', 1))
+# Number of pages of a DukeDS project's files fetched at once when recording the manifest of a delivery
+DDS_MANIFEST_WORKERS = int(os.getenv('D4S2_DDS_MANIFEST_WORKERS', 4))
+# Requests to DukeDS fail fast for DDS_CIRCUIT_RESET_SECONDS after this many failures in a row
+DDS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('D4S2_DDS_CIRCUIT_FAILURE_THRESHOLD', 5))
+DDS_CIRCUIT_RESET_SECONDS = int(os.getenv('D4S2_DDS_CIRCUIT_RESET_SECONDS', 30))
+# Seconds a DukeDS request may take before it times out and counts as a failure, by method and path
+DDS_LATENCY_BUDGET_SECONDS = int(os.getenv('D4S2_DDS_LATENCY_BUDGET_SECONDS', 10))
+DDS_ENDPOINT_LATENCY_BUDGETS = {
+    'GET /projects/{id}/children': 30,
+    'PUT /project_transfers/{id}/accept': 30,
+}
@@ -2,6 +2,7 @@ from django.contrib import admin
 from d4s2_api.models import *
 from simple_history.admin import SimpleHistoryAdmin
 from switchboard.azure_util import TransferFunctions
+from switchboard.dds_util import DDSTransferFunctions
 
 admin.site.register(EmailTemplate)
 
@@ -13,13 +14,19 @@ class ShareAdmin(SimpleHistoryAdmin):
 admin.site.register(Share, ShareAdmin)
 
 
+def restart_dds_transfer(modeladmin, request, queryset):
+    for delivery in queryset:
+        DDSTransferFunctions.transfer_delivery(delivery.id)
+
+
 class DDSDeliveryAdmin(SimpleHistoryAdmin):
-    pass
+    actions = [restart_dds_transfer]
 
 
 admin.site.register(DDSDelivery, DDSDeliveryAdmin)
 admin.site.register(DDSDeliveryError)
 admin.site.register(DDSDeliveryShareUser)
+admin.site.register(DDSObjectManifest)
 admin.site.register(EmailTemplateSet)
 admin.site.register(EmailTemplateType)
 admin.site.register(UserEmailTemplateSet)
@@ -0,0 +1,153 @@
+import os
+import time
+import uuid
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test import Client
+from rest_framework.test import APIClient
+from background_task.tasks import tasks
+from d4s2_api.models import AzDelivery, State, StorageTypes, EmailTemplateSet, EmailTemplate, EmailTemplateType, \
+    UserEmailTemplateSet
+from switchboard.azure_util import TRANSFER_EXECUTOR_LOCAL
+
+BENCHMARK_EMAIL_TEMPLATE_SET_NAME = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = 'Times many concurrent Azure deliveries through the create, send and accept endpoints using local ' \
+           'directories, stand-in directory users and the local transfer executor. ' \
+           'Requires D4S2_AZURE_TRANSFER_EXECUTOR=local with the webhook url and token of a transfer_poster user ' \
+           'pointing at a running server. Pass --run-tasks when no process_tasks worker is running.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', type=str, help='Local directory to create the source and destination '
+                                                   'containers in')
+        parser.add_argument('--deliveries', type=int, default=100, help='Number of deliveries to run at once')
+        parser.add_argument('--files', type=int, default=10,
+                            help='Number of files in each project, half at the top level and half in a folder')
+        parser.add_argument('--file-size', type=int, default=1024, help='Size of each file in bytes')
+        parser.add_argument('--from-netid', type=str, default='benchmark-sender', help='NetID of the sender')
+        parser.add_argument('--to-netid', type=str, default='benchmark-recipient', help='NetID of the recipient')
+        parser.add_argument('--timeout', type=int, default=600,
+                            help='Seconds to wait for the deliveries to finish')
+        parser.add_argument('--run-tasks', action='store_true',
+                            help='Run the background tasks that complete deliveries in this process')
+
+    def handle(self, *args, **options):
+        if settings.AZURE_TRANSFER_EXECUTOR != TRANSFER_EXECUTOR_LOCAL:
+            raise CommandError('Set D4S2_AZURE_TRANSFER_EXECUTOR={} to run this benchmark.'.format(
+                TRANSFER_EXECUTOR_LOCAL))
+        root = os.path.abspath(options['root'])
+        run_id = uuid.uuid4().hex[:8]
+        sender = self._setup_user(options['from_netid'])
+        recipient = self._setup_user(options['to_netid'])
+        source_container_url = self._make_container(root, sender)
+        sink_container_url = self._make_container(root, recipient)
+        project_paths = [
+            self._make_project(source_container_url, '{}/benchmark-{}-{}'.format(options['from_netid'], run_id, index),
+                               options['files'], options['file_size'])
+            for index in range(options['deliveries'])
+        ]
+        self.stdout.write('Created {} projects for run {}.'.format(len(project_paths), run_id))
+
+        sender_client = APIClient(HTTP_HOST=self._get_host())
+        sender_client.force_authenticate(sender)
+        recipient_client = Client(HTTP_HOST=self._get_host())
+        recipient_client.force_login(recipient)
+        start = time.time()
+        delivery_ids = []
+        for project_path in project_paths:
+            delivery_id = self._create_and_send(sender_client, source_container_url, project_path, options)
+            self._accept(recipient_client, delivery_id, sink_container_url)
+            delivery_ids.append(delivery_id)
+        self.stdout.write('Sent and accepted deliveries in {:.2f} seconds.'.format(time.time() - start))
+
+        counts = self._wait_for_deliveries(delivery_ids, start + options['timeout'], options['run_tasks'])
+        elapsed = time.time() - start
+        self.stdout.write('Accepted: {}  Failed: {}  Unfinished: {}'.format(
+            counts[State.ACCEPTED], counts[State.FAILED], counts['unfinished']))
+        self.stdout.write('Finished in {:.2f} seconds, {:.2f} deliveries per second.'.format(
+            elapsed, (counts[State.ACCEPTED] + counts[State.FAILED]) / elapsed))
+
+    @staticmethod
+    def _get_host():
+        # Requests are handled in this process so they must use a host the server accepts
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.')
+        return 'localhost'
+
+    @staticmethod
+    def _setup_user(netid):
+        """
+        Create the user for netid along with an Azure email template set.
+        """
+        user, _ = User.objects.get_or_create(username='{}@{}'.format(netid, settings.USERNAME_EMAIL_HOST))
+        email_template_set, _ = EmailTemplateSet.objects.get_or_create(name=BENCHMARK_EMAIL_TEMPLATE_SET_NAME,
+                                                                       storage=StorageTypes.AZURE)
+        for template_type in EmailTemplateType.objects.all():
+            EmailTemplate.objects.get_or_create(template_set=email_template_set, template_type=template_type,
+                                                defaults={'owner': user, 'subject': template_type.name,
+                                                          'body': 'Benchmark {} email.'.format(template_type.name)})
+        UserEmailTemplateSet.objects.get_or_create(user=user, storage=StorageTypes.AZURE,
+                                                   defaults={'email_template_set': email_template_set})
+        return user
+
+    @staticmethod
+    def _make_container(root, owner):
+        container_path = os.path.join(root, owner.username)
+        os.makedirs(container_path, exist_ok=True)
+        return 'file://{}'.format(container_path)
+
+    @staticmethod
+    def _make_project(container_url, project_path, file_count, file_size):
+        data = b'x' * file_size
+        for index in range(file_count):
+            folder = '' if index % 2 == 0 else 'data'
+            local_path = os.path.join(container_url[len('file://'):], project_path, folder, 'file{}.dat'.format(index))
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, 'wb') as outfile:
+                outfile.write(data)
+        return project_path
+
+    @staticmethod
+    def _create_and_send(sender_client, source_container_url, project_path, options):
+        response = sender_client.post(reverse('v2-azdeliveries-list'), {
+            'source_project': {'path': project_path, 'container_url': source_container_url},
+            'from_netid': options['from_netid'],
+            'to_netid': options['to_netid'],
+        }, format='json')
+        if response.status_code != 201:
+            raise CommandError('Creating delivery for {} failed: {}'.format(project_path, response.data))
+        delivery_id = response.data['id']
+        response = sender_client.post(reverse('v2-azdeliveries-send', args=[delivery_id]), format='json')
+        if response.status_code != 200:
+            raise CommandError('Sending delivery {} failed: {}'.format(delivery_id, response.data))
+        return delivery_id
+
+    @staticmethod
+    def _accept(recipient_client, delivery_id, sink_container_url):
+        response = recipient_client.post(reverse('ownership-process'), {
+            'transfer_id': delivery_id,
+            'delivery_type': StorageTypes.AZURE,
+            'container_url': sink_container_url,
+        })
+        if response.status_code != 302 or reverse('ownership-accepted') not in response['Location']:
+            raise CommandError('Accepting delivery {} failed with status {}.'.format(delivery_id,
+                                                                                     response.status_code))
+
+    @staticmethod
+    def _wait_for_deliveries(delivery_ids, deadline, run_tasks):
+        while True:
+            states = list(AzDelivery.objects.filter(pk__in=delivery_ids).values_list('state', flat=True))
+            counts = {
+                State.ACCEPTED: states.count(State.ACCEPTED),
+                State.FAILED: states.count(State.FAILED),
+            }
+            counts['unfinished'] = len(states) - counts[State.ACCEPTED] - counts[State.FAILED]
+            if not counts['unfinished'] or time.time() > deadline:
+                return counts
+            if not (run_tasks and tasks.run_next_task()):
+                time.sleep(1)
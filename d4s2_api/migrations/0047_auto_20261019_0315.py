@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0046_auto_20220622_1922'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='S3DeliveryCopiedObject',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Key of the object in the source bucket', max_length=1024)),
+                ('e_tag', models.CharField(help_text='ETag of the source object when it was copied', max_length=255)),
+                ('size', models.BigIntegerField(help_text='Size in bytes of the source object when it was copied')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='historicals3delivery',
+            name='transfer_state',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Granted recipient read permissions'), (2, 'Created destination bucket'), (3, 'Copied objects to destination bucket'), (4, 'Removed source bucket')], default=0, help_text='State within transfer'),
+        ),
+        migrations.AddField(
+            model_name='s3delivery',
+            name='transfer_state',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Granted recipient read permissions'), (2, 'Created destination bucket'), (3, 'Copied objects to destination bucket'), (4, 'Removed source bucket')], default=0, help_text='State within transfer'),
+        ),
+        migrations.AddField(
+            model_name='s3deliverycopiedobject',
+            name='delivery',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copied_objects', to='d4s2_api.S3Delivery'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='s3deliverycopiedobject',
+            unique_together=set([('delivery', 'key')]),
+        ),
+    ]
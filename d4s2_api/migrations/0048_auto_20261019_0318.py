@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0047_auto_20261019_0315'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicals3delivery',
+            name='transfer_mode',
+            field=models.CharField(choices=[('copy', 'Copy to new bucket'), ('handoff', 'Hand off source bucket')], default='copy', help_text='How the bucket contents are transferred to the recipient', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='s3delivery',
+            name='transfer_mode',
+            field=models.CharField(choices=[('copy', 'Copy to new bucket'), ('handoff', 'Hand off source bucket')], default='copy', help_text='How the bucket contents are transferred to the recipient', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='historicals3delivery',
+            name='transfer_state',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Granted recipient read permissions'), (2, 'Created destination bucket'), (3, 'Copied objects to destination bucket'), (4, 'Removed source bucket'), (5, 'Gave recipient control of source bucket')], default=0, help_text='State within transfer'),
+        ),
+        migrations.AlterField(
+            model_name='s3delivery',
+            name='transfer_state',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Granted recipient read permissions'), (2, 'Created destination bucket'), (3, 'Copied objects to destination bucket'), (4, 'Removed source bucket'), (5, 'Gave recipient control of source bucket')], default=0, help_text='State within transfer'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:29
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0048_auto_20261019_0318'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AzObjectManifestChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.IntegerField(help_text='Order of this chunk within the manifest')),
+                ('entry_count', models.IntegerField(help_text='Number of entries in this chunk')),
+                ('content', models.BinaryField(help_text='zlib compressed JSON array of entries')),
+                ('signature', models.CharField(help_text='Signature of the sequence and content of this chunk', max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='S3ObjectManifestChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.IntegerField(help_text='Order of this chunk within the manifest')),
+                ('entry_count', models.IntegerField(help_text='Number of entries in this chunk')),
+                ('content', models.BinaryField(help_text='zlib compressed JSON array of entries')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='azobjectmanifest',
+            name='chunked',
+            field=models.BooleanField(default=False, help_text='Entries are stored in chunks instead of content'),
+        ),
+        migrations.AddField(
+            model_name='azobjectmanifest',
+            name='entry_count',
+            field=models.IntegerField(default=0, help_text='Number of entries in a chunked manifest'),
+        ),
+        migrations.AddField(
+            model_name='s3objectmanifest',
+            name='chunked',
+            field=models.BooleanField(default=False, help_text='Entries are stored in chunks instead of content'),
+        ),
+        migrations.AddField(
+            model_name='s3objectmanifest',
+            name='entry_count',
+            field=models.IntegerField(default=0, help_text='Number of entries in a chunked manifest'),
+        ),
+        migrations.AlterField(
+            model_name='s3objectmanifest',
+            name='content',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, help_text='JSON array of object metadata from bucket at time of sending bucket', null=True),
+        ),
+        migrations.AddField(
+            model_name='s3objectmanifestchunk',
+            name='manifest',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='d4s2_api.S3ObjectManifest'),
+        ),
+        migrations.AddField(
+            model_name='azobjectmanifestchunk',
+            name='manifest',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='d4s2_api.AzObjectManifest'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='s3objectmanifestchunk',
+            unique_together=set([('manifest', 'sequence')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='azobjectmanifestchunk',
+            unique_together=set([('manifest', 'sequence')]),
+        ),
+    ]
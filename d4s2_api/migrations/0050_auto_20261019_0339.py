@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:39
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0049_auto_20261019_0329'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AzTransferNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transfer_uuid', models.UUIDField(help_text='UUID of the transfer attempt this notification is for.')),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(help_text='Data posted by the transfer pipeline.')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('processed', models.BooleanField(default=False, help_text='The delivery has been completed for this notification.')),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_notifications', to='d4s2_api.AzDelivery')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='aztransfernotification',
+            unique_together=set([('delivery', 'transfer_uuid')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0050_auto_20261019_0339'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AzTransferManifestPart',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.IntegerField(help_text='Order of this chunk within the manifest')),
+                ('entry_count', models.IntegerField(help_text='Number of entries in this chunk')),
+                ('content', models.BinaryField(help_text='zlib compressed JSON array of entries')),
+                ('transfer_uuid', models.UUIDField(help_text='UUID of the transfer attempt this manifest is for.')),
+                ('chunk_number', models.IntegerField(help_text='Number of the uploaded chunk this part belongs to')),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_manifest_parts', to='d4s2_api.AzDelivery')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='aztransfermanifestpart',
+            unique_together=set([('delivery', 'transfer_uuid', 'chunk_number', 'sequence')]),
+        ),
+    ]
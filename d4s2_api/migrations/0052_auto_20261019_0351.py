@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0051_auto_20261019_0342'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AzAclUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(help_text='Id of the user being given access', max_length=255)),
+                ('permissions', models.CharField(help_text='Permissions given to the user such as r-x', max_length=16)),
+                ('path', models.CharField(help_text='Path within the destination container', max_length=1024)),
+                ('is_directory', models.BooleanField(default=True)),
+                ('continuation_token', models.TextField(blank=True, default='', help_text='Token used to resume the recursive update')),
+                ('complete', models.BooleanField(default=False)),
+                ('failure_count', models.IntegerField(default=0, help_text='Number of files and directories that failed to update')),
+                ('error_message', models.TextField(blank=True, default='')),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='acl_updates', to='d4s2_api.AzDelivery')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='azaclupdate',
+            unique_together=set([('delivery', 'user_id', 'path')]),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+COPY_SOURCE_PROJECT_SQL = '''
+UPDATE "d4s2_api_azdelivery" SET "source_container_url" = "d4s2_api_azcontainerpath"."container_url",
+  "source_path" = "d4s2_api_azcontainerpath"."path"
+FROM "d4s2_api_azcontainerpath" WHERE "d4s2_api_azdelivery"."source_project_id" = "d4s2_api_azcontainerpath"."id"
+'''
+
+INCOMPLETE_STATES = (0, 1, 5)
+CANCELED = 6
+DUPLICATE_DELIVERY_MSG = 'Canceled because delivery {} of the same project was already in progress.'
+
+
+def cancel_duplicate_incomplete_deliveries(apps, schema_editor):
+    """
+    Cancel all but one incomplete delivery of each source project so the unique index can be created.
+    The delivery furthest along is kept, transferring before notified before new, then the newest.
+    """
+    AzDelivery = apps.get_model('d4s2_api', 'AzDelivery')
+    AzDeliveryError = apps.get_model('d4s2_api', 'AzDeliveryError')
+    kept_delivery_ids = {}
+    deliveries = AzDelivery.objects.filter(state__in=INCOMPLETE_STATES).order_by('-state', '-id')
+    for delivery in deliveries:
+        key = (delivery.from_netid, delivery.source_container_url, delivery.source_path)
+        if key not in kept_delivery_ids:
+            kept_delivery_ids[key] = delivery.id
+            continue
+        delivery.state = CANCELED
+        delivery.save(update_fields=['state'])
+        AzDeliveryError.objects.create(delivery=delivery, message=DUPLICATE_DELIVERY_MSG.format(kept_delivery_ids[key]))
+
+
+# Only one new, notified or transferring delivery is allowed per source project
+CREATE_INCOMPLETE_DELIVERY_INDEX_SQL = '''
+CREATE UNIQUE INDEX "d4s2_api_azdelivery_incomplete_source_uniq" ON "d4s2_api_azdelivery"
+  ("from_netid", "source_container_url", "source_path") WHERE "state" IN (0, 1, 5)
+'''
+
+DROP_INCOMPLETE_DELIVERY_INDEX_SQL = 'DROP INDEX "d4s2_api_azdelivery_incomplete_source_uniq"'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0052_auto_20261019_0351'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='azdelivery',
+            name='source_container_url',
+            field=models.URLField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='azdelivery',
+            name='source_path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='historicalazdelivery',
+            name='source_container_url',
+            field=models.URLField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='historicalazdelivery',
+            name='source_path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunSQL(sql=COPY_SOURCE_PROJECT_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunPython(cancel_duplicate_incomplete_deliveries, reverse_code=migrations.RunPython.noop),
+        migrations.RunSQL(sql=CREATE_INCOMPLETE_DELIVERY_INDEX_SQL, reverse_sql=DROP_INCOMPLETE_DELIVERY_INDEX_SQL),
+    ]
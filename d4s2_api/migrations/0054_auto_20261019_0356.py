@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 03:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+COPY_UPDATED_AT_FROM_HISTORY_SQL = [
+    '''UPDATE "d4s2_api_azdelivery" SET "updated_at" = "latest"."history_date"
+    FROM (SELECT "id", MAX("history_date") AS "history_date" FROM "d4s2_api_historicalazdelivery" GROUP BY "id")
+      AS "latest"
+    WHERE "d4s2_api_azdelivery"."id" = "latest"."id"''',
+    'UPDATE "d4s2_api_historicalazdelivery" SET "updated_at" = "history_date"',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0053_auto_20261019_0354'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='azdelivery',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='historicalazdelivery',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(sql=COPY_UPDATED_AT_FROM_HISTORY_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 04:20
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.contrib.postgres.fields
+import django.contrib.postgres.fields.jsonb
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('d4s2_api', '0054_auto_20261019_0356'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DDSProjectTransferRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transfer_id', models.CharField(help_text='DukeDS uuid of the project transfer', max_length=36, unique=True)),
+                ('status', models.CharField(db_index=True, max_length=255)),
+                ('from_user_id', models.CharField(db_index=True, help_text='DukeDS uuid user sending the project', max_length=255)),
+                ('to_user_ids', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=[], help_text='DukeDS uuids of the users receiving the project', size=None)),
+                ('created_on', models.DateTimeField(db_index=True, null=True)),
+                ('content', django.contrib.postgres.fields.jsonb.JSONField(help_text='project_transfer payload from DukeDS')),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DDSProjectTransferSyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dds_user_id', models.CharField(help_text='DukeDS uuid of the user', max_length=255)),
+                ('synced_at', models.DateTimeField(help_text='When the last complete sync started', null=True)),
+                ('queued_at', models.DateTimeField(help_text='When a background sync was last queued', null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dds_project_transfer_sync_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ddsprojecttransferrecord',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['to_user_ids'], name='d4s2_api_dd_to_user_19c493_gin'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 04:41
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0055_auto_20261019_0420'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ddsdelivery',
+            name='failed_share_users',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=[], help_text='Names of users the project could not be shared with while transferring', size=None),
+        ),
+        migrations.AddField(
+            model_name='ddsdelivery',
+            name='transfer_state',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Accepted project transfer'), (2, 'Shared project with additional users'), (3, 'Gave sender download permissions'), (4, 'Emailed Sender'), (5, 'Emailed Recipient'), (6, 'Delivery Complete')], default=0, help_text='State within transfer'),
+        ),
+        migrations.AddField(
+            model_name='historicalddsdelivery',
+            name='failed_share_users',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=[], help_text='Names of users the project could not be shared with while transferring', size=None),
+        ),
+        migrations.AddField(
+            model_name='historicalddsdelivery',
+            name='transfer_state',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Accepted project transfer'), (2, 'Shared project with additional users'), (3, 'Gave sender download permissions'), (4, 'Emailed Sender'), (5, 'Emailed Recipient'), (6, 'Delivery Complete')], default=0, help_text='State within transfer'),
+        ),
+    ]
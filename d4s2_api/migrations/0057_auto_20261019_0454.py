@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 04:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('d4s2_api', '0056_auto_20261019_0441'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DDSObjectManifest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunked', models.BooleanField(default=False, help_text='Entries are stored in chunks instead of content')),
+                ('entry_count', models.IntegerField(default=0, help_text='Number of entries in a chunked manifest')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DDSObjectManifestChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.IntegerField(help_text='Order of this chunk within the manifest')),
+                ('entry_count', models.IntegerField(help_text='Number of entries in this chunk')),
+                ('content', models.BinaryField(help_text='zlib compressed JSON array of entries')),
+                ('manifest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='d4s2_api.DDSObjectManifest')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ddsdelivery',
+            name='manifest',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='d4s2_api.DDSObjectManifest'),
+        ),
+        migrations.AddField(
+            model_name='historicalddsdelivery',
+            name='manifest',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='d4s2_api.DDSObjectManifest'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ddsobjectmanifestchunk',
+            unique_together=set([('manifest', 'sequence')]),
+        ),
+    ]
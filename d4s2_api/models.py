@@ -2,11 +2,20 @@ from __future__ import unicode_literals
 
 import uuid
 import os.path
+import json
+import zlib
+import hashlib
+import datetime
 from django.db import models
 from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
 from django.contrib.auth.models import User, Group
 from django.contrib.postgres.fields import JSONField, ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.core.signing import Signer, BadSignature
+from django.core.cache import cache
 from simple_history.models import HistoricalRecords
 from gcb_web_auth.utils import get_default_oauth_service, current_user_details, OAuthConfigurationException
 from gcb_web_auth.models import DDSUserCredential, GroupManagerConnection
@@ -14,6 +23,8 @@ from gcb_web_auth.groupmanager import get_users_group_names
 
 
 DEFAULT_EMAIL_TEMPLATE_SET_NAME = 'default'
+MANIFEST_CHUNK_SIZE = 1000
+MANIFEST_SIGNATURE_STATUS_CACHE_SECONDS = 24 * 60 * 60
 
 
 class DDSProjectTransferDetails(object):
@@ -48,6 +59,7 @@ class State(object):
     FAILED = 4
     TRANSFERRING = 5
     CANCELED = 6
+    INCOMPLETE_STATES = (NEW, NOTIFIED, TRANSFERRING)
     STATES = (
         (NEW, 'New'),
         (NOTIFIED, 'Notified'),
@@ -208,6 +220,25 @@ class DeliveryBase(models.Model):
         abstract = True
 
 
+class DDSTransferStates:
+    NEW = 0
+    ACCEPTED_PROJECT_TRANSFER = 1
+    SHARED_WITH_USERS = 2
+    GAVE_SENDER_PERMISSION = 3
+    EMAILED_SENDER = 4
+    EMAILED_RECIPIENT = 5
+    COMPLETE = 6
+    CHOICES = (
+        (NEW, 'New'),
+        (ACCEPTED_PROJECT_TRANSFER, 'Accepted project transfer'),
+        (SHARED_WITH_USERS, 'Shared project with additional users'),
+        (GAVE_SENDER_PERMISSION, 'Gave sender download permissions'),
+        (EMAILED_SENDER, 'Emailed Sender'),
+        (EMAILED_RECIPIENT, 'Emailed Recipient'),
+        (COMPLETE, 'Delivery Complete'),
+    )
+
+
 class DDSDelivery(DeliveryBase):
     """
     Represents a delivery of a project from one user to another
@@ -225,6 +256,11 @@ class DDSDelivery(DeliveryBase):
     from_user_id = models.CharField(max_length=255, help_text='DukeDS uuid user sending delivery')
     to_user_id = models.CharField(max_length=255, help_text='DukeDS uuid user receiving delivery')
     transfer_id = models.CharField(max_length=36, null=False, unique=True)
+    transfer_state = models.IntegerField(choices=DDSTransferStates.CHOICES, default=DDSTransferStates.NEW,
+                                         help_text='State within transfer')
+    failed_share_users = ArrayField(models.CharField(max_length=255), blank=True, default=[],
+                                    help_text='Names of users the project could not be shared with while transferring')
+    manifest = models.OneToOneField('DDSObjectManifest', on_delete=models.CASCADE, null=True, blank=True)
 
     def __str__(self):
         return 'Delivery Project: {} State: {} Performed by: {}'.format(
@@ -246,6 +282,81 @@ class DDSDeliveryShareUser(models.Model):
         unique_together = ('dds_id', 'delivery')
 
 
+class DDSProjectTransferRecord(models.Model):
+    """
+    Local copy of a DukeDS project_transfer so transfers can be listed without fetching them all from DukeDS.
+    """
+    transfer_id = models.CharField(max_length=36, unique=True, help_text='DukeDS uuid of the project transfer')
+    status = models.CharField(max_length=255, db_index=True)
+    from_user_id = models.CharField(max_length=255, db_index=True, help_text='DukeDS uuid user sending the project')
+    to_user_ids = ArrayField(models.CharField(max_length=255), default=[],
+                             help_text='DukeDS uuids of the users receiving the project')
+    created_on = models.DateTimeField(null=True, db_index=True)
+    content = JSONField(help_text='project_transfer payload from DukeDS')
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['to_user_ids']),
+        ]
+
+    @staticmethod
+    def for_dds_user(dds_user_id):
+        """
+        Return transfers sent or received by a DukeDS user.
+        """
+        return DDSProjectTransferRecord.objects.filter(Q(from_user_id=dds_user_id) |
+                                                       Q(to_user_ids__contains=[dds_user_id]))
+
+    @staticmethod
+    def make_fields(transfer_dict):
+        fields = DDSProjectTransferDetails.Fields
+        return {
+            'status': transfer_dict.get(fields.STATUS) or '',
+            'from_user_id': (transfer_dict.get(fields.FROM_USER) or {}).get('id') or '',
+            'to_user_ids': [to_user.get('id') for to_user in transfer_dict.get(fields.TO_USERS) or []],
+            'created_on': parse_datetime(transfer_dict.get('audit', {}).get('created_on') or ''),
+            'content': transfer_dict,
+        }
+
+    @staticmethod
+    def save_transfer(transfer_dict):
+        """
+        Create or update the local copy of a DukeDS project_transfer.
+        :param transfer_dict: dict: project_transfer payload from DukeDS
+        :return: DDSProjectTransferRecord
+        """
+        record, _ = DDSProjectTransferRecord.objects.update_or_create(
+            transfer_id=transfer_dict['id'], defaults=DDSProjectTransferRecord.make_fields(transfer_dict))
+        return record
+
+
+class DDSProjectTransferSyncState(models.Model):
+    """
+    When the DukeDS project_transfers for a user were last copied into DDSProjectTransferRecord.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='dds_project_transfer_sync_state')
+    dds_user_id = models.CharField(max_length=255, help_text='DukeDS uuid of the user')
+    synced_at = models.DateTimeField(null=True, help_text='When the last complete sync started')
+    queued_at = models.DateTimeField(null=True, help_text='When a background sync was last queued')
+
+    def is_stale(self, max_age_seconds):
+        if self.synced_at is None:
+            return True
+        return timezone.now() - self.synced_at > datetime.timedelta(seconds=max_age_seconds)
+
+    def is_sync_queued(self, max_queued_seconds):
+        """
+        :param max_queued_seconds: int: seconds after which a queued sync that never finished is abandoned
+        :return: bool: True when a background sync was queued and may still run
+        """
+        if self.queued_at is None:
+            return False
+        if timezone.now() - self.queued_at > datetime.timedelta(seconds=max_queued_seconds):
+            return False
+        return self.synced_at is None or self.queued_at > self.synced_at
+
+
 class Share(models.Model):
     """
     Represents a non-destructive preview of a project from one user to another.
@@ -433,8 +544,253 @@ class S3Bucket(models.Model):
         unique_together = ('endpoint', 'name')
 
 
-class S3ObjectManifest(models.Model):
-    content = JSONField(help_text='JSON array of object metadata from bucket at time of sending bucket')
+class ManifestSignatureStatus(object):
+    """
+    Result of verifying the signature of a manifest
+    """
+    NONE = 'None'
+    NOT_SIGNED = 'Not Signed'
+    VERIFIED = 'Signature Verified'
+    INVALID = 'Invalid Signature'
+
+
+class ObjectManifestBase(models.Model):
+    """
+    Manifest of object metadata. Manifests are stored either as a single content field (legacy) or,
+    when chunked is True, as ordered compressed chunks that can be written and read incrementally.
+    Subclasses must define a 'chunks' relation to a ObjectManifestChunkBase subclass.
+    """
+    chunked = models.BooleanField(default=False, help_text='Entries are stored in chunks instead of content')
+    entry_count = models.IntegerField(default=0, help_text='Number of entries in a chunked manifest')
+    # name of the field within each entry that holds the path of the object
+    entry_path_field = None
+    is_signed = False
+
+    class Meta:
+        abstract = True
+
+    def add_chunk(self, sequence, entries):
+        """
+        Store entries as the chunk at position sequence.
+        :param sequence: int: order of the chunk within this manifest
+        :param entries: [dict]: manifest entries
+        """
+        return self.chunks.create(sequence=sequence, entry_count=len(entries),
+                                  content=ObjectManifestChunkBase.compress_entries(entries))
+
+    def finalize(self, chunk_count, entry_count):
+        """
+        Called once all chunks have been added to the manifest.
+        :param chunk_count: int: number of chunks added
+        :param entry_count: int: number of entries added
+        """
+        self.entry_count = entry_count
+        self.save()
+
+    def iter_chunks(self):
+        return self.chunks.order_by('sequence').iterator()
+
+    def iter_entries(self):
+        """
+        Iterate over the entries of this manifest loading one chunk at a time.
+        """
+        if self.chunked:
+            for chunk in self.iter_chunks():
+                for entry in self.get_chunk_entries(chunk):
+                    yield entry
+        else:
+            for entry in self.get_legacy_entries():
+                yield entry
+
+    def iter_entries_from(self, sequence=0, index=0, verify=True):
+        """
+        Iterate over (sequence, index, entry) tuples starting at the entry at index within chunk sequence.
+        Only the chunks at or after sequence are loaded. Legacy manifests are treated as a single chunk.
+        :param sequence: int: chunk to start at
+        :param index: int: index of the entry within the first chunk to start at
+        :param verify: bool: verify each chunk as it is read, pass False when the whole manifest was just verified
+        """
+        if self.chunked:
+            for chunk in self.chunks.filter(sequence__gte=sequence).order_by('sequence').iterator():
+                entries = self.get_chunk_entries(chunk, verify=verify)
+                start_index = index if chunk.sequence == sequence else 0
+                for entry_index in range(start_index, len(entries)):
+                    yield chunk.sequence, entry_index, entries[entry_index]
+        elif sequence == 0:
+            entries = self.get_legacy_entries()
+            for entry_index in range(index, len(entries)):
+                yield 0, entry_index, entries[entry_index]
+
+    def get_entry_path(self, entry):
+        return entry.get(self.entry_path_field) or ''
+
+    def get_chunk_entries(self, chunk, verify=True):
+        return chunk.get_entries()
+
+    def get_legacy_entries(self):
+        """
+        Entries of a manifest stored before manifests were chunked, overridden by manifests that have them.
+        """
+        return []
+
+    def save(self, *args, **kwargs):
+        super(ObjectManifestBase, self).save(*args, **kwargs)
+        self.clear_signature_status()
+
+    def verify_signature(self):
+        """
+        Raises BadSignature if the manifest has been altered, overridden by signed manifests.
+        """
+        pass
+
+    def get_signature_status_cache_key(self):
+        return 'manifest-signature-status:{}:{}'.format(self._meta.label_lower, self.id)
+
+    def clear_signature_status(self):
+        """
+        Remove the cached signature status, called whenever the manifest or one of its chunks is saved.
+        """
+        if self.is_signed:
+            cache.delete(self.get_signature_status_cache_key())
+
+    def get_signature_status(self):
+        """
+        Return a ManifestSignatureStatus value for this manifest. The result of verifying a signed manifest
+        is cached until the manifest changes so the full content is not re-verified on every request.
+        """
+        if not self.is_signed:
+            return ManifestSignatureStatus.NOT_SIGNED
+        cache_key = self.get_signature_status_cache_key()
+        status = cache.get(cache_key)
+        if status is None:
+            try:
+                self.verify_signature()
+                status = ManifestSignatureStatus.VERIFIED
+            except BadSignature:
+                status = ManifestSignatureStatus.INVALID
+            cache.set(cache_key, status, MANIFEST_SIGNATURE_STATUS_CACHE_SECONDS)
+        return status
+
+
+class ObjectManifestChunkBase(models.Model):
+    """
+    A zlib compressed JSON array holding an ordered portion of a manifest's entries.
+    """
+    sequence = models.IntegerField(help_text='Order of this chunk within the manifest')
+    entry_count = models.IntegerField(help_text='Number of entries in this chunk')
+    content = models.BinaryField(help_text='zlib compressed JSON array of entries')
+
+    class Meta:
+        abstract = True
+
+    def get_entries(self):
+        return json.loads(zlib.decompress(bytes(self.content)).decode('utf-8'))
+
+    def get_content_digest(self):
+        return hashlib.sha256(bytes(self.content)).hexdigest()
+
+    @staticmethod
+    def compress_entries(entries):
+        return zlib.compress(json.dumps(entries, default=str).encode('utf-8'))
+
+
+class ObjectManifestWriter(object):
+    """
+    Writes entries to a chunked manifest as they are produced, keeping at most chunk_size entries in memory.
+    """
+    def __init__(self, manifest, chunk_size=MANIFEST_CHUNK_SIZE):
+        """
+        :param manifest: ObjectManifestBase: manifest to write chunks to, must have chunked set
+        :param chunk_size: int: max number of entries per chunk
+        """
+        self.manifest = manifest
+        self.chunk_size = chunk_size
+        self.pending_entries = []
+        self.chunk_count = 0
+        self.entry_count = 0
+
+    def write(self, entry):
+        self.pending_entries.append(entry)
+        self.entry_count += 1
+        if len(self.pending_entries) >= self.chunk_size:
+            self.flush()
+
+    def write_all(self, entries):
+        for entry in entries:
+            self.write(entry)
+
+    def flush(self):
+        if self.pending_entries:
+            self.manifest.add_chunk(self.chunk_count, self.pending_entries)
+            self.chunk_count += 1
+            self.pending_entries = []
+
+    def close(self):
+        """
+        Write any pending entries and finalize the manifest.
+        """
+        self.flush()
+        self.manifest.finalize(self.chunk_count, self.entry_count)
+
+
+class DDSObjectManifest(ObjectManifestBase):
+    """
+    Manifest of the files in a DukeDS project at the time the delivery was sent.
+    Always chunked, each entry holds the file's path, size, version and hashes.
+    """
+    entry_path_field = 'path'
+
+
+class DDSObjectManifestChunk(ObjectManifestChunkBase):
+    manifest = models.ForeignKey(DDSObjectManifest, on_delete=models.CASCADE, related_name='chunks')
+
+    class Meta:
+        unique_together = ('manifest', 'sequence')
+
+
+class S3ObjectManifest(ObjectManifestBase):
+    entry_path_field = 'key'
+    content = JSONField(help_text='JSON array of object metadata from bucket at time of sending bucket', null=True,
+                        blank=True)
+
+    def get_legacy_entries(self):
+        return self.content or []
+
+
+class S3ObjectManifestChunk(ObjectManifestChunkBase):
+    manifest = models.ForeignKey(S3ObjectManifest, on_delete=models.CASCADE, related_name='chunks')
+
+    class Meta:
+        unique_together = ('manifest', 'sequence')
+
+
+class S3TransferStates:
+    NEW = 0
+    GRANTED_RECIPIENT_PERMISSIONS = 1
+    CREATED_DESTINATION_BUCKET = 2
+    COPIED_OBJECTS = 3
+    CLEANED_UP_SOURCE_BUCKET = 4
+    HANDED_OFF_SOURCE_BUCKET = 5
+    CHOICES = (
+        (NEW, 'New'),
+        (GRANTED_RECIPIENT_PERMISSIONS, 'Granted recipient read permissions'),
+        (CREATED_DESTINATION_BUCKET, 'Created destination bucket'),
+        (COPIED_OBJECTS, 'Copied objects to destination bucket'),
+        (CLEANED_UP_SOURCE_BUCKET, 'Removed source bucket'),
+        (HANDED_OFF_SOURCE_BUCKET, 'Gave recipient control of source bucket'),
+    )
+
+
+class S3TransferModes(object):
+    """
+    How a s3 delivery moves data to the recipient
+    """
+    COPY = 'copy'          # copy objects into a new bucket owned by the recipient
+    HANDOFF = 'handoff'    # keep objects in place and give the recipient control of the source bucket
+    CHOICES = (
+        (COPY, 'Copy to new bucket'),
+        (HANDOFF, 'Hand off source bucket'),
+    )
 
 
 class S3Delivery(DeliveryBase):
@@ -450,6 +806,10 @@ class S3Delivery(DeliveryBase):
     to_user = models.ForeignKey(S3User, related_name='received_deliveries', on_delete=models.CASCADE)
     transfer_id = models.UUIDField(default=uuid.uuid4)
     manifest = models.OneToOneField(S3ObjectManifest, on_delete=models.CASCADE, null=True)
+    transfer_state = models.IntegerField(choices=S3TransferStates.CHOICES, default=S3TransferStates.NEW,
+                                         help_text='State within transfer')
+    transfer_mode = models.CharField(max_length=32, choices=S3TransferModes.CHOICES, default=S3TransferModes.COPY,
+                                     help_text='How the bucket contents are transferred to the recipient')
 
     def __str__(self):
         return 'S3 Delivery bucket: {} State: {} Performed by: {}'.format(
@@ -466,6 +826,21 @@ class S3DeliveryError(models.Model):
     created = models.DateTimeField(auto_now_add=True)
 
 
+class S3DeliveryCopiedObject(models.Model):
+    """
+    Records an object that has been copied to the destination bucket while transferring a delivery.
+    Allows a retried transfer to skip objects that were already copied.
+    """
+    delivery = models.ForeignKey(S3Delivery, on_delete=models.CASCADE, related_name='copied_objects')
+    key = models.CharField(max_length=1024, help_text='Key of the object in the source bucket')
+    e_tag = models.CharField(max_length=255, help_text='ETag of the source object when it was copied')
+    size = models.BigIntegerField(help_text='Size in bytes of the source object when it was copied')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('delivery', 'key')
+
+
 class AzContainerPath(models.Model):
     """
     Represents a directory(project) within an Azure container/filesystem/bucket
@@ -480,8 +855,117 @@ class AzContainerPath(models.Model):
         return 'Azure Project: {} URL: {} '.format(self.path, self.container_url)
 
 
-class AzObjectManifest(models.Model):
+class AzObjectManifest(ObjectManifestBase):
+    """
+    Signed manifest of the files in an Azure project at the time of delivery.
+    For legacy manifests content is the signed JSON of the delivery details including all files.
+    For chunked manifests content is the signed JSON of the delivery details along with the chunk and entry counts,
+    and each chunk is signed separately so files can be verified as they are read.
+    """
     content = models.TextField(help_text='Signed JSON array of object metadata from project at time of delivery')
+    entry_path_field = 'name'
+    is_signed = True
+
+    def get_header(self):
+        """
+        Return the delivery details recorded in this manifest without the files.
+        Raises BadSignature if the content has been altered.
+        :return: dict
+        """
+        header = json.loads(Signer().unsign(self.content))
+        header.pop('files', None)
+        return header
+
+    def set_header(self, header):
+        self.content = Signer().sign(json.dumps(header, default=str))
+
+    def add_chunk(self, sequence, entries):
+        chunk = AzObjectManifestChunk(manifest=self, sequence=sequence, entry_count=len(entries),
+                                      content=ObjectManifestChunkBase.compress_entries(entries))
+        chunk.signature = self._make_chunk_signature(sequence, chunk.get_content_digest())
+        chunk.save()
+        return chunk
+
+    def finalize(self, chunk_count, entry_count):
+        header = self.get_header()
+        header['chunk_count'] = chunk_count
+        header['entry_count'] = entry_count
+        self.set_header(header)
+        super(AzObjectManifest, self).finalize(chunk_count, entry_count)
+
+    def _make_chunk_signature(self, sequence, content_digest):
+        return Signer().signature('{}:{}:{}'.format(self.id, sequence, content_digest))
+
+    def _get_chunk_count(self):
+        chunk_count = self.get_header().get('chunk_count')
+        if chunk_count is None:
+            raise BadSignature('Manifest was not finalized.')
+        return chunk_count
+
+    def verify_chunk_signature(self, chunk):
+        if chunk.signature != self._make_chunk_signature(chunk.sequence, chunk.get_content_digest()):
+            raise BadSignature('Manifest chunk {} signature does not match.'.format(chunk.sequence))
+
+    def _iter_verified_chunks(self):
+        chunk_count = self._get_chunk_count()
+        sequence = 0
+        for chunk in self.iter_chunks():
+            if chunk.sequence != sequence:
+                raise BadSignature('Manifest chunk {} missing.'.format(sequence))
+            self.verify_chunk_signature(chunk)
+            yield chunk
+            sequence += 1
+        if sequence != chunk_count:
+            raise BadSignature('Manifest has {} chunks expected {}.'.format(sequence, chunk_count))
+
+    def iter_entries(self):
+        """
+        Iterate over the files in this manifest verifying each chunk as it is read.
+        Raises BadSignature if the manifest has been altered.
+        """
+        if self.chunked:
+            for chunk in self._iter_verified_chunks():
+                for entry in chunk.get_entries():
+                    yield entry
+        else:
+            for entry in self.get_legacy_entries():
+                yield entry
+
+    def get_chunk_entries(self, chunk, verify=True):
+        if verify:
+            self.verify_chunk_signature(chunk)
+        return chunk.get_entries()
+
+    def get_legacy_entries(self):
+        return json.loads(Signer().unsign(self.content)).get('files', [])
+
+    def verify_signature(self):
+        """
+        Verify the header and every chunk of this manifest without decompressing the chunks.
+        Raises BadSignature if the manifest has been altered.
+        """
+        if self.chunked:
+            for _ in self._iter_verified_chunks():
+                pass
+        else:
+            Signer().unsign(self.content)
+
+
+class AzObjectManifestChunk(ObjectManifestChunkBase):
+    manifest = models.ForeignKey(AzObjectManifest, on_delete=models.CASCADE, related_name='chunks')
+    signature = models.CharField(max_length=255, help_text='Signature of the sequence and content of this chunk')
+
+    class Meta:
+        unique_together = ('manifest', 'sequence')
+
+    def save(self, *args, **kwargs):
+        super(AzObjectManifestChunk, self).save(*args, **kwargs)
+        self.manifest.clear_signature_status()
+
+    def delete(self, *args, **kwargs):
+        result = super(AzObjectManifestChunk, self).delete(*args, **kwargs)
+        self.manifest.clear_signature_status()
+        return result
 
 
 class AzTransferStates:
@@ -524,6 +1008,22 @@ class AzDelivery(DeliveryBase):
                                          help_text='State within transfer')
     fund_code = models.CharField(max_length=255, help_text='Fund code used to bill storage costs.', blank=True)
     transfer_uuid = models.UUIDField(null=True, help_text='UUID field used with transfer webhook.',)
+    # Copied from source_project so the database can enforce one incomplete delivery per source project
+    source_container_url = models.URLField(blank=True, default='', editable=False)
+    source_path = models.CharField(max_length=255, blank=True, default='', editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __init__(self, *args, **kwargs):
+        super(AzDelivery, self).__init__(*args, **kwargs)
+        # The source project that source_container_url and source_path were copied from
+        self._copied_source_project_id = self.source_project_id if self.source_path else None
+
+    def save(self, *args, **kwargs):
+        if self.source_project_id and self.source_project_id != self._copied_source_project_id:
+            self.source_container_url = self.source_project.container_url
+            self.source_path = self.source_project.path
+            self._copied_source_project_id = self.source_project_id
+        super(AzDelivery, self).save(*args, **kwargs)
 
     def get_simple_project_name(self):
         return os.path.basename(self.source_project.path)
@@ -560,17 +1060,14 @@ class AzDelivery(DeliveryBase):
     def get_incomplete_delivery(from_netid, source_container_url, source_path):
         """
         Return a incomplete delivery for the specified keys or None if not found.
-        There should only be at most one incomplete delivery at a time for a set of keys.
+        A partial unique index ensures there is at most one incomplete delivery at a time for a set of keys.
         """
-        deliveries = AzDelivery.objects.filter(
+        return AzDelivery.objects.filter(
             from_netid=from_netid,
-            source_project__container_url=source_container_url,
-            source_project__path=source_path
-        )
-        for delivery in deliveries:
-            if not delivery.is_complete():
-                return delivery
-        return None
+            source_container_url=source_container_url,
+            source_path=source_path,
+            state__in=State.INCOMPLETE_STATES
+        ).first()
 
 
 class AzDeliveryError(models.Model):
@@ -579,6 +1076,74 @@ class AzDeliveryError(models.Model):
     created = models.DateTimeField(auto_now_add=True)
 
 
+class AzAclUpdate(models.Model):
+    """
+    Progress granting a user access to one top level path within the destination project of a delivery.
+    The continuation token is saved after each batch of a recursive update so a retry resumes where it stopped.
+    """
+    delivery = models.ForeignKey(AzDelivery, on_delete=models.CASCADE, related_name='acl_updates')
+    user_id = models.CharField(max_length=255, help_text='Id of the user being given access')
+    permissions = models.CharField(max_length=16, help_text='Permissions given to the user such as r-x')
+    path = models.CharField(max_length=1024, help_text='Path within the destination container')
+    is_directory = models.BooleanField(default=True)
+    continuation_token = models.TextField(blank=True, default='',
+                                          help_text='Token used to resume the recursive update')
+    complete = models.BooleanField(default=False)
+    failure_count = models.IntegerField(default=0, help_text='Number of files and directories that failed to update')
+    error_message = models.TextField(blank=True, default='')
+
+    class Meta:
+        unique_together = ('delivery', 'user_id', 'path')
+
+    def has_failures(self):
+        return self.failure_count > 0 or bool(self.error_message)
+
+
+class AzTransferNotification(models.Model):
+    """
+    Raw payload posted by the transfer pipeline when a transfer attempt finishes.
+    Stored before the delivery is completed in the background so the pipeline is not kept waiting.
+    """
+    delivery = models.ForeignKey(AzDelivery, on_delete=models.CASCADE, related_name='transfer_notifications')
+    transfer_uuid = models.UUIDField(help_text='UUID of the transfer attempt this notification is for.')
+    payload = JSONField(help_text='Data posted by the transfer pipeline.')
+    created = models.DateTimeField(auto_now_add=True)
+    processed = models.BooleanField(default=False, help_text='The delivery has been completed for this notification.')
+
+    class Meta:
+        unique_together = ('delivery', 'transfer_uuid')
+
+    def get_manifest_parts(self):
+        return AzTransferManifestPart.objects.filter(delivery=self.delivery_id, transfer_uuid=self.transfer_uuid)
+
+    def get_file_manifest(self):
+        """
+        Return the file manifest for this transfer. When the pipeline uploaded the manifest in chunks
+        (manifest_chunk_count in the payload) this is an iterator that reads the uploaded parts in order.
+        """
+        if self.payload.get('manifest_chunk_count') is None:
+            return self.payload.get('manifest')
+        return self._iter_uploaded_manifest_entries()
+
+    def _iter_uploaded_manifest_entries(self):
+        for part in self.get_manifest_parts().order_by('chunk_number', 'sequence').iterator():
+            for entry in part.get_entries():
+                yield entry
+
+
+class AzTransferManifestPart(ObjectManifestChunkBase):
+    """
+    Part of a numbered manifest chunk uploaded by the transfer pipeline before it posts the transfer result.
+    Large chunks are split into several parts so they can be stored without holding the whole chunk in memory.
+    """
+    delivery = models.ForeignKey(AzDelivery, on_delete=models.CASCADE, related_name='transfer_manifest_parts')
+    transfer_uuid = models.UUIDField(help_text='UUID of the transfer attempt this manifest is for.')
+    chunk_number = models.IntegerField(help_text='Number of the uploaded chunk this part belongs to')
+
+    class Meta:
+        unique_together = ('delivery', 'transfer_uuid', 'chunk_number', 'sequence')
+
+
 class AzStorageConfig(models.Model):
     name = models.CharField(max_length=255, help_text='User facing name for these storage config settings.')
     subscription_id = models.CharField(max_length=255,
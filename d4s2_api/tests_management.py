@@ -0,0 +1,61 @@
+import os
+import tempfile
+from io import StringIO
+from mock import patch, Mock
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from d4s2_api.models import AzDelivery, State
+from switchboard.azure_util import get_file_system_client
+from switchboard.azure_local_util import LocalTransferExecutor, clear_local_acls
+
+
+@override_settings(AZURE_TRANSFER_EXECUTOR='local', USERNAME_EMAIL_HOST='duke.edu')
+class BenchmarkAzDeliveriesTestCase(TestCase):
+    def setUp(self):
+        clear_local_acls()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        transfer_poster = User.objects.create_user(username='transfer_poster')
+        Group.objects.create(name='transfer_poster').user_set.add(transfer_poster)
+        self.webhook_client = APIClient()
+        self.webhook_client.force_authenticate(transfer_poster)
+        # Copy each project as it is submitted and post the result to the webhook within this test
+        self.executor = LocalTransferExecutor(get_file_system_client, webhook_url=reverse('v2-az-transfers'),
+                                              webhook_token='')
+        self.executor.submit = self.executor.run
+
+    def post_webhook(self, url, headers, json):
+        response = self.webhook_client.post(url, data=json, format='json')
+        self.assertEqual(response.status_code, 200)
+        return Mock()
+
+    @patch('switchboard.azure_util.print')
+    @patch('switchboard.azure_local_util.requests')
+    @patch('switchboard.azure_util.get_local_transfer_executor')
+    def test_deliveries_are_sent_and_accepted(self, mock_get_local_transfer_executor, mock_requests, mock_print):
+        mock_get_local_transfer_executor.return_value = self.executor
+        mock_requests.post.side_effect = self.post_webhook
+        stdout = StringIO()
+
+        call_command('benchmark_az_deliveries', self.temp_dir.name, '--deliveries', '2', '--files', '3',
+                     '--run-tasks', '--timeout', '30', stdout=stdout)
+
+        self.assertIn('Accepted: 2  Failed: 0  Unfinished: 0', stdout.getvalue())
+        deliveries = AzDelivery.objects.all()
+        self.assertEqual(len(deliveries), 2)
+        for delivery in deliveries:
+            self.assertEqual(delivery.state, State.ACCEPTED)
+            self.assertEqual(delivery.to_netid, 'benchmark-recipient')
+            sink_path = os.path.join(self.temp_dir.name, 'benchmark-recipient@duke.edu',
+                                     delivery.destination_project.path)
+            self.assertEqual(sorted(os.listdir(sink_path)), ['data', 'file0.dat', 'file2.dat'])
+            self.assertEqual(os.listdir(os.path.join(sink_path, 'data')), ['file1.dat'])
+
+    def test_requires_local_executor(self):
+        with self.settings(AZURE_TRANSFER_EXECUTOR='pipeline'):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_az_deliveries', self.temp_dir.name, stdout=StringIO())
@@ -1,10 +1,10 @@
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.core import serializers
 from django.test import TestCase
 from d4s2_api.models import *
 from django.contrib.auth.models import User
 import datetime
-from mock import Mock
+from mock import Mock, patch
 
 
 class TransferBaseTestCase(TestCase):
@@ -628,6 +628,112 @@ class S3ObjectManifestTestCase(S3DeliveryBaseTestCase):
         self.assertEqual(manifests[0].content, [{'state': 'bad', 'value': 0}])
 
 
+class ObjectManifestWriterTestCase(TestCase):
+    def test_write_chunked_s3_manifest(self):
+        manifest = S3ObjectManifest.objects.create(chunked=True)
+        manifest_writer = ObjectManifestWriter(manifest, chunk_size=2)
+        manifest_writer.write_all([{'key': 'file1'}, {'key': 'file2'}, {'key': 'file3'}])
+        manifest_writer.close()
+
+        manifest.refresh_from_db()
+        self.assertEqual(manifest.entry_count, 3)
+        chunks = manifest.chunks.order_by('sequence')
+        self.assertEqual([(chunk.sequence, chunk.entry_count) for chunk in chunks], [(0, 2), (1, 1)])
+        self.assertEqual(list(manifest.iter_entries()), [{'key': 'file1'}, {'key': 'file2'}, {'key': 'file3'}])
+
+    def test_legacy_s3_manifest_entries(self):
+        manifest = S3ObjectManifest.objects.create(content=[{'key': 'file1'}])
+        self.assertEqual(list(manifest.iter_entries()), [{'key': 'file1'}])
+
+
+class AzObjectManifestTestCase(TestCase):
+    def setUp(self):
+        self.manifest = AzObjectManifest(chunked=True)
+        self.manifest.set_header({'delivery': 1})
+        self.manifest.save()
+        manifest_writer = ObjectManifestWriter(self.manifest, chunk_size=2)
+        manifest_writer.write_all([{'name': 'file1'}, {'name': 'file2'}, {'name': 'file3'}])
+        manifest_writer.close()
+
+    def test_header_and_entries(self):
+        self.assertEqual(self.manifest.get_header(), {'delivery': 1, 'chunk_count': 2, 'entry_count': 3})
+        self.assertEqual(list(self.manifest.iter_entries()), [{'name': 'file1'}, {'name': 'file2'}, {'name': 'file3'}])
+        self.manifest.verify_signature()
+
+    def test_altered_chunk_fails_verification(self):
+        chunk = self.manifest.chunks.get(sequence=1)
+        chunk.content = ObjectManifestChunkBase.compress_entries([{'name': 'other'}])
+        chunk.save()
+        with self.assertRaises(BadSignature):
+            self.manifest.verify_signature()
+        with self.assertRaises(BadSignature):
+            list(self.manifest.iter_entries())
+
+    def test_missing_chunk_fails_verification(self):
+        self.manifest.chunks.get(sequence=1).delete()
+        with self.assertRaises(BadSignature):
+            self.manifest.verify_signature()
+
+    def test_altered_header_fails_verification(self):
+        self.manifest.content = self.manifest.content.replace('"delivery": 1', '"delivery": 2')
+        with self.assertRaises(BadSignature):
+            self.manifest.verify_signature()
+
+    def test_legacy_manifest(self):
+        manifest = AzObjectManifest.objects.create(content=Signer().sign('{"delivery": 1, "files": [{"name": "a"}]}'))
+        self.assertEqual(manifest.get_header(), {'delivery': 1})
+        self.assertEqual(list(manifest.iter_entries()), [{'name': 'a'}])
+        manifest.verify_signature()
+
+    def test_iter_entries_from(self):
+        self.assertEqual(list(self.manifest.iter_entries_from(sequence=0, index=1)), [
+            (0, 1, {'name': 'file2'}), (1, 0, {'name': 'file3'})
+        ])
+        self.assertEqual(list(self.manifest.iter_entries_from(sequence=1)), [(1, 0, {'name': 'file3'})])
+        chunk = self.manifest.chunks.get(sequence=1)
+        chunk.content = ObjectManifestChunkBase.compress_entries([{'name': 'other'}])
+        chunk.save()
+        with self.assertRaises(BadSignature):
+            list(self.manifest.iter_entries_from(sequence=1))
+
+    @patch('d4s2_api.models.cache')
+    def test_get_signature_status(self, mock_cache):
+        mock_cache.get.return_value = None
+        self.assertEqual(self.manifest.get_signature_status(), ManifestSignatureStatus.VERIFIED)
+        cache_key = mock_cache.set.call_args[0][0]
+        mock_cache.set.assert_called_with(cache_key, ManifestSignatureStatus.VERIFIED,
+                                          MANIFEST_SIGNATURE_STATUS_CACHE_SECONDS)
+
+        mock_cache.get.return_value = ManifestSignatureStatus.INVALID
+        self.assertEqual(self.manifest.get_signature_status(), ManifestSignatureStatus.INVALID)
+        mock_cache.get.assert_called_with(cache_key)
+
+        self.manifest.content = self.manifest.content.replace('"delivery": 1', '"delivery": 2')
+        self.manifest.save()
+        mock_cache.delete.assert_called_with(cache_key)
+        mock_cache.get.return_value = None
+        self.assertEqual(self.manifest.get_signature_status(), ManifestSignatureStatus.INVALID)
+        self.assertEqual(mock_cache.set.call_args[0][0], cache_key)
+
+    def test_signature_status_cleared_when_chunk_changes(self):
+        self.assertEqual(self.manifest.get_signature_status(), ManifestSignatureStatus.VERIFIED)
+        chunk = self.manifest.chunks.get(sequence=1)
+        chunk.content = ObjectManifestChunkBase.compress_entries([{'name': 'other'}])
+        chunk.save()
+        self.assertEqual(self.manifest.get_signature_status(), ManifestSignatureStatus.INVALID)
+        chunk.delete()
+        self.assertEqual(self.manifest.get_signature_status(), ManifestSignatureStatus.INVALID)
+
+    def test_iter_entries_from_without_verify(self):
+        chunk = self.manifest.chunks.get(sequence=1)
+        chunk.content = ObjectManifestChunkBase.compress_entries([{'name': 'other'}])
+        chunk.save()
+        self.assertEqual(list(self.manifest.iter_entries_from(sequence=1, verify=False)), [(1, 0, {'name': 'other'})])
+
+    def test_get_signature_status_unsigned_manifest(self):
+        self.assertEqual(S3ObjectManifest(content=[]).get_signature_status(), ManifestSignatureStatus.NOT_SIGNED)
+
+
 class ShareRoleTestCase(TestCase):
     def test_email_template_name(self):
         self.assertEqual(ShareRole.email_template_name('somerole'), 'share_somerole')
@@ -684,6 +790,35 @@ class AzDeliveryTestCase(TestCase):
         )
         self.assertEqual(AzDelivery.get_incomplete_delivery(from_netid, source_container_url, source_path), delivery2)
 
+    def test_only_one_incomplete_delivery_per_source_project(self):
+        def create_delivery():
+            return AzDelivery.objects.create(
+                source_project=AzContainerPath.objects.create(path='user1/mouse', container_url='http://127.0.0.1'),
+                from_netid='user1',
+                to_netid='user2',
+            )
+        delivery = create_delivery()
+        self.assertEqual(delivery.source_container_url, 'http://127.0.0.1')
+        self.assertEqual(delivery.source_path, 'user1/mouse')
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                create_delivery()
+        delivery.mark_canceled()
+        create_delivery()
+
+    def test_changing_source_project_updates_source_fields(self):
+        delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path='user1/mouse', container_url='http://127.0.0.1'),
+            from_netid='user1',
+            to_netid='user2',
+        )
+        delivery = AzDelivery.objects.get(pk=delivery.id)
+        delivery.source_project = AzContainerPath.objects.create(path='user1/rat', container_url='http://127.0.0.2')
+        delivery.save()
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.source_container_url, 'http://127.0.0.2')
+        self.assertEqual(delivery.source_path, 'user1/rat')
+
 
 class AzDeliveryErrorTestCase(TestCase):
     def test_create(self):
@@ -42,7 +42,19 @@ class Message(object):
         """
         return str(self._message.message())
 
-    def send(self):
+    @property
+    def to(self):
+        """
+        :return: [str]: email addresses the message is sent to
+        """
+        return self._message.to
+
+    def send(self, connection=None):
+        """
+        :param connection: email backend connection to reuse, a new connection is opened when None
+        """
+        if connection:
+            self._message.connection = connection
         self._message.send()
 
 
@@ -4,7 +4,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from d4s2_api.models import DDSDelivery, Share, State, UserEmailTemplateSet, EmailTemplateSet, StorageTypes
 from d4s2_api_v1.serializers import DeliverySerializer, ShareSerializer
-from switchboard.dds_util import DDSUtil, DDSMessageFactory
+from switchboard.dds_util import DDSUtil, DDSMessageFactory, DDSProjectSummaryFunctions, DDSManifestFunctions
 from django.core.urlresolvers import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
@@ -90,7 +90,10 @@ class DeliveryViewSet(ModelWithEmailTemplateSetMixin, viewsets.ModelViewSet):
         project_transfer = dds_util.create_project_transfer(request.data['project_id'],
                                                             request.data['to_user_id'])
         request.data['transfer_id'] = project_transfer['id']
-        return super(DeliveryViewSet, self).create(request, args, kwargs)
+        response = super(DeliveryViewSet, self).create(request, args, kwargs)
+        if DDSProjectSummaryFunctions.should_precompute():
+            DDSProjectSummaryFunctions.cache_project_summary(request.user.id, request.data['project_id'])
+        return response
 
     @action(detail=True, methods=['POST'])
     def send(self, request, pk=None):
@@ -101,6 +104,9 @@ class DeliveryViewSet(ModelWithEmailTemplateSetMixin, viewsets.ModelViewSet):
         accept_url = build_accept_url(request, delivery.transfer_id, StorageTypes.DDS)
         message_factory = DDSMessageFactory(delivery, request.user)
         message = message_factory.make_delivery_message(accept_url)
+        # Queued before the email is sent so the manifest is recorded before the recipient can accept
+        if not delivery.manifest:
+            DDSManifestFunctions.record_object_manifest(delivery.id, request.user.id)
         message.send()
         delivery.mark_notified(message.email_text)
         return self.retrieve(request)
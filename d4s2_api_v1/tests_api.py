@@ -57,6 +57,29 @@ class DeliveryViewTestCase(AuthenticatedResourceTestCase):
         self.assertTrue(mock_ddsutil.return_value.create_project_transfer.called_with('project-id-2', ['user2']))
         self.assertEqual(dds_delivery.email_template_set, self.email_template_set)
 
+    @patch('d4s2_api_v1.api.DDSProjectSummaryFunctions.cache_project_summary')
+    @patch('d4s2_api_v1.api.DDSUtil')
+    def test_create_delivery_summarizes_project_in_background(self, mock_ddsutil, mock_cache_project_summary):
+        setup_mock_ddsutil(mock_ddsutil)
+        url = reverse('ddsdelivery-list')
+        data = {'project_id': 'project-id-2', 'from_user_id': 'user1', 'to_user_id': 'user2'}
+        with self.settings(DDS_PROJECT_SUMMARY_CACHE_BACKEND='default'):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_cache_project_summary.assert_called_with(self.user.id, 'project-id-2')
+
+        precompute_disabled_settings = [
+            {'DDS_PROJECT_SUMMARY_CACHE_BACKEND': 'default', 'DDS_PROJECT_SUMMARY_PRECOMPUTE': 0},
+            {'DDS_PROJECT_SUMMARY_CACHE_BACKEND': None},
+        ]
+        for precompute_settings in precompute_disabled_settings:
+            mock_cache_project_summary.reset_mock()
+            DDSDelivery.objects.all().delete()
+            with self.settings(**precompute_settings):
+                response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertFalse(mock_cache_project_summary.called)
+
     @patch('d4s2_api_v1.api.DDSUtil')
     def test_create_delivery_fails_when_user_not_setup(self, mock_ddsutil):
         self.user_email_template_set.delete()
@@ -155,6 +178,30 @@ class DeliveryViewTestCase(AuthenticatedResourceTestCase):
         mock_message_factory.return_value.make_delivery_message.assert_called_with(expected_absolute_url)
         self.assertTrue(instance.send.called)
 
+    @patch('d4s2_api_v1.api.DDSManifestFunctions')
+    @patch('d4s2_api_v1.api.DDSMessageFactory')
+    def test_send_delivery_records_manifest_in_background(self, mock_message_factory, mock_manifest_functions):
+        message = mock_message_factory.return_value.make_delivery_message.return_value
+        message.email_text = 'email text'
+        # The manifest is queued before the recipient is emailed
+        message.send.side_effect = lambda: self.assertTrue(mock_manifest_functions.record_object_manifest.called)
+        h = DDSDelivery.objects.create(project_id='project2', from_user_id='user1', to_user_id='user2',
+                                       transfer_id='abcd', email_template_set=self.email_template_set)
+        url = reverse('ddsdelivery-send', args=(h.pk,))
+        response = self.client.post(url, data={}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_manifest_functions.record_object_manifest.assert_called_with(h.pk, self.user.id)
+        self.assertTrue(message.send.called)
+
+        # Resending keeps the manifest recorded the first time
+        mock_manifest_functions.reset_mock()
+        message.send.side_effect = None
+        h.manifest = DDSObjectManifest.objects.create(chunked=True)
+        h.save()
+        response = self.client.post(url + '?force=true', data={}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(mock_manifest_functions.record_object_manifest.called)
+
     @patch('d4s2_api_v1.api.DDSMessageFactory')
     def test_send_delivery_with_null_template(self, mock_message_factory):
         instance = mock_message_factory.return_value.make_delivery_message.return_value
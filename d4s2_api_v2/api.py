@@ -1,12 +1,28 @@
+import base64
+import binascii
+import csv
+import datetime
+import gzip
 import json
+from collections import OrderedDict
+from functools import partial
 from rest_framework import viewsets, permissions, status, generics, mixins
-from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.exceptions import APIException, ValidationError, NotFound
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from django.db.models import Q
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from django.db import transaction, IntegrityError
+from django.db.models import Q, F, Max
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from switchboard.dds_util import DDSUser, DDSProject, DDSProjectTransfer, DDSProjectPermissions, DDSProjectSummary
-from switchboard.dds_util import DDSUtil, DDSMessageFactory, DDSAuthProvider, DDSAffiliate, DataServiceError
+from switchboard.dds_util import DDSUtil, DDSMessageFactory, DDSAuthProvider, DDSAffiliate, DataServiceError, \
+    DDSProjectTransferSync, DDSListFilter, dds_circuit_breaker
 from switchboard.s3_util import S3BucketUtil
 from d4s2_api_v2.serializers import DDSUserSerializer, DDSProjectSerializer, DDSProjectTransferSerializer, \
     UserSerializer, S3EndpointSerializer, S3UserSerializer, S3BucketSerializer, S3DeliverySerializer, \
@@ -14,19 +30,25 @@ from d4s2_api_v2.serializers import DDSUserSerializer, DDSProjectSerializer, DDS
     AddUserSerializer, DDSProjectSummarySerializer, EmailTemplateSetSerializer, EmailTemplateSerializer, \
     DukeUserSerializer, AzDeliverySerializer, AzDeliveryUpdateSerializer, AzStorageConfigSerializer, AzDeliverySummarySerializer, \
     AzDeliveryPreviewSerializer, StorageTypes, AzTransferSerializer
-from d4s2_api.models import DDSDelivery, S3Endpoint, S3User, S3UserTypes, S3Bucket, S3Delivery, EmailTemplateSet, \
-    EmailTemplate
+from d4s2_api.models import DDSDelivery, DDSDeliveryShareUser, S3Endpoint, S3User, S3UserTypes, S3Bucket, S3Delivery, \
+    EmailTemplateSet, EmailTemplate
 from d4s2_api_v1.api import AlreadyNotifiedException, get_force_param, build_accept_url, DeliveryViewSet, \
     ModelWithEmailTemplateSetMixin
 from switchboard.s3_util import S3Exception, S3NoSuchBucket, SendDeliveryOperation
 from d4s2_api_v2.models import DDSDeliveryPreview, AzDeliveryPreview
-from d4s2_api.models import AzDelivery, State, AzStorageConfig
+from d4s2_api.models import AzDelivery, State, AzStorageConfig, ManifestSignatureStatus, AzTransferNotification, \
+    DDSProjectTransferRecord
 from switchboard.userservice import get_users_for_query, get_user_for_netid, get_netid_from_user
-from switchboard.azure_util import AzMessageFactory, create_project_summary, get_container_details
-from django.core.signing import Signer, BadSignature
+from switchboard.azure_util import AzMessageFactory, create_project_summary, get_container_details, \
+    AzSaaSUnavailable
+from django.core.signing import BadSignature
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
-from switchboard.azure_util import AzureTransfer
+from switchboard.azure_util import AzureTransfer, TransferFunctions, AzTransferManifestChunkUpload, \
+    iter_request_lines, iter_ndjson_entries
+
+
+ACTIVE_AZ_DELIVERY_EXISTS_MSG = "Data Delivery Error: An active delivery for this project already exists."
 
 
 class DataServiceUnavailable(APIException):
@@ -34,6 +56,11 @@ class DataServiceUnavailable(APIException):
     default_detail = 'Data Service temporarily unavailable, try again later.'
 
 
+class StorageServiceUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Storage-as-a-Service temporarily unavailable, try again later.'
+
+
 class WrappedDataServiceException(APIException):
     """
     Converts error returned from DukeDS python code into one appropriate for django.
@@ -68,6 +95,158 @@ class InvalidSettingsException(APIException):
         self.detail = detail
 
 
+def parse_datetime_param(query_params, name):
+    """
+    Parse an ISO 8601 date or datetime query parameter, dates are treated as midnight UTC.
+    :param query_params: QueryDict: query parameters of the request
+    :param name: str: name of the parameter
+    :return: datetime: value of the parameter or None when it was not passed
+    """
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        result = parse_datetime(value)
+        if result is None:
+            date = parse_date(value)
+            if date:
+                result = datetime.datetime.combine(date, datetime.time.min)
+    except ValueError:
+        result = None
+    if result is None:
+        raise BadRequestException("Query parameter '{}' must be an ISO 8601 date or datetime.".format(name))
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result, timezone.utc)
+    return result
+
+
+def get_list_filter(query_params):
+    """
+    Create a DDSListFilter from the name_prefix, created_after and created_before query parameters.
+    :param query_params: QueryDict: query parameters of the request
+    :return: DDSListFilter
+    """
+    return DDSListFilter(name_prefix=query_params.get('name_prefix'),
+                         created_after=parse_datetime_param(query_params, 'created_after'),
+                         created_before=parse_datetime_param(query_params, 'created_before'))
+
+
+class DDSResultsPagination(PageNumberPagination):
+    """
+    Paginates DukeDS collections without fetching the whole collection.
+    Results are only paginated when the page_size query parameter is passed.
+    Without a filter page N is DukeDS page N, filtered pages are built by reading DukeDS pages until enough
+    results match. The next link holds a cursor so the following page resumes where this one stopped.
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    # DukeDS page size used when most results may be filtered out
+    filtered_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.request = None
+        self.count = None
+        self.page_number = None
+        self.next_cursor = None
+
+    def paginate_results(self, request, iter_results, item_filter=None):
+        """
+        :param request: Request: request containing the page, page_size and cursor query parameters
+        :param iter_results: func(page_size, page, offset): returns a DDSResultsIterator
+        :param item_filter: func(item): returns True for items to include, None when DukeDS did all filtering
+        :return: [object]: items in the requested page or None when pagination was not requested
+        """
+        page_size = self.get_page_size(request)
+        if page_size is None:
+            return None
+        self.request = request
+        cursor = self.decode_cursor(request)
+        skip = 0
+        if cursor:
+            fetch_size, page, offset = cursor
+        else:
+            self.page_number = self.get_page_number(request)
+            if item_filter:
+                fetch_size, page, offset = max(page_size, self.filtered_page_size), 1, 0
+                skip = (self.page_number - 1) * page_size
+            else:
+                fetch_size, page, offset = page_size, self.page_number, 0
+        results = iter_results(fetch_size, page, offset)
+        items = []
+        position = None
+        for item, position in results:
+            if item_filter and not item_filter(item):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            items.append(item)
+            if len(items) == page_size:
+                break
+        else:
+            position = None
+        self.count = None if item_filter else results.total
+        self.next_cursor = (fetch_size,) + position if position else None
+        return items
+
+    def get_page_number(self, request, paginator=None):
+        try:
+            page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            page_number = 0
+        if page_number < 1:
+            raise NotFound(self.invalid_page_message)
+        return page_number
+
+    def decode_cursor(self, request):
+        """
+        :return: (int, int, int): DukeDS page size, page and offset to resume from or None when no cursor was passed
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            fetch_size, page, offset = [int(part) for part in base64.urlsafe_b64decode(encoded).decode().split('.')]
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if fetch_size < 1 or page < 1 or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return fetch_size, page, offset
+
+    @staticmethod
+    def encode_cursor(cursor):
+        return base64.urlsafe_b64encode('.'.join(str(part) for part in cursor).encode()).decode()
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_cursor))
+
+    def get_previous_link(self):
+        if not self.page_number or self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Lists that are already fully fetched, such as recent users, are not paginated
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
 class DDSViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -76,9 +255,24 @@ class DDSViewSet(viewsets.ReadOnlyModelViewSet):
             return func(*args)
         except DataServiceError as e:
             raise WrappedDataServiceException(e)
+        except APIException:
+            raise
         except Exception as e:
             raise DataServiceUnavailable(e)
 
+    def _paginated_list(self, iter_results, item_filter=None):
+        """
+        Respond with a page of DukeDS results when the page_size query parameter is passed.
+        :param iter_results: func(page_size, page, offset): returns a DDSResultsIterator
+        :param item_filter: func(item): returns True for items to include, None when DukeDS did all filtering
+        :return: Response: page of results or None when pagination was not requested
+        """
+        page = self._ds_operation(self.paginator.paginate_results, self.request, iter_results, item_filter)
+        if page is None:
+            return None
+        serializer = self.get_serializer(page, many=True)
+        return self.paginator.get_paginated_response(serializer.data)
+
 
 class DDSUsersViewSet(DDSViewSet):
     """
@@ -87,48 +281,83 @@ class DDSUsersViewSet(DDSViewSet):
     still works well
     """
     serializer_class = DDSUserSerializer
+    pagination_class = DDSResultsPagination
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('recent'):
+            dds_util = DDSUtil(request.user)
+            full_name_contains, email, username = self._get_search_params()
+            list_filter = self._get_list_filter()
+            item_filter = None if list_filter.is_empty() else self._user_filter(list_filter)
+            response = self._paginated_list(partial(DDSUser.iter_list, dds_util, full_name_contains, email, username),
+                                            item_filter)
+            if response is not None:
+                return response
+        return super(DDSUsersViewSet, self).list(request, *args, **kwargs)
 
     def get_queryset(self):
-        full_name_contains = self.request.query_params.get('full_name_contains', None)
-        email = self.request.query_params.get('email', None)
-        username = self.request.query_params.get('username', None)
+        full_name_contains, email, username = self._get_search_params()
         recent = self.request.query_params.get('recent', None)
 
         dds_util = DDSUtil(self.request.user)
         if recent:
-            if full_name_contains:
+            if self.request.query_params.get('full_name_contains', None):
                 msg = "Query parameter 'full_name_contains' not allowed when specifying the 'recent' query parameter."
                 raise BadRequestException(msg)
             return self._get_recent_delivery_users(dds_util)
         else:
-            return self._ds_operation(DDSUser.fetch_list, dds_util, full_name_contains, email, username)
+            users = self._ds_operation(DDSUser.fetch_list, dds_util, full_name_contains, email, username)
+            list_filter = self._get_list_filter()
+            if list_filter.is_empty():
+                return users
+            return [user for user in users if self._user_filter(list_filter)(user)]
+
+    def _get_search_params(self):
+        """
+        DukeDS can only search for users whose full name contains a value, so name_prefix is searched
+        as a substring and the prefix is checked locally.
+        :return: (str, str, str): full_name_contains, email and username to pass to DukeDS
+        """
+        query_params = self.request.query_params
+        full_name_contains = query_params.get('full_name_contains', None) or query_params.get('name_prefix', None)
+        return full_name_contains, query_params.get('email', None), query_params.get('username', None)
+
+    def _get_list_filter(self):
+        return DDSListFilter(name_prefix=self.request.query_params.get('name_prefix'))
+
+    @staticmethod
+    def _user_filter(list_filter):
+        return lambda user: list_filter.matches(user.full_name)
 
     def _get_recent_delivery_users(self, dds_util):
         """
         Return users that are the recipient of deliveries create by the current user.
         :param dds_util: DDSUtil: connection to DukeDS
-        :return: [DDSUser]: users who received deliveries from the current user
+        :return: [DDSUser]: users who received deliveries from the current user, most recent first
         """
         current_dds_user = dds_util.get_current_user()
-        to_user_ids = set()
-        for delivery in DDSDelivery.objects.filter(from_user_id=current_dds_user.id):
-            to_user_ids.add(delivery.to_user_id)
-            for share_user in delivery.share_users.all():
-                if share_user.dds_id != current_dds_user.id:
-                    to_user_ids.add(share_user.dds_id)
-        return self._ds_operation(self._fetch_users_for_ids, dds_util, to_user_ids)
-
-    def _fetch_users_for_ids(self, dds_util, to_user_ids):
+        to_user_ids = self._get_recent_recipient_ids(current_dds_user.id, settings.DDS_RECENT_USERS_LIMIT)
+        return self._ds_operation(DDSUser.fetch_many, dds_util, to_user_ids, settings.DDS_USER_FETCH_WORKERS)
+
+    @staticmethod
+    def _get_recent_recipient_ids(from_user_id, limit):
         """
-        Given a list of DukeDS user ids fetch user details.
-        :param dds_util: DDSUtil: connection to DukeDS
-        :param to_user_ids: [str]: list of DukeDS user UUIDs
-        :return: [DDSUser]: list of user details fetched from DukeDS
+        Find the users most recently delivered to or shared with by a user in a single query.
+        :param from_user_id: str: DukeDS UUID of the sender
+        :param limit: int: maximum number of user ids to return
+        :return: [str]: DukeDS user UUIDs ordered by their most recent delivery
         """
-        users = []
-        for to_user_id in to_user_ids:
-            users.append(DDSUser.fetch_one(dds_util, to_user_id))
-        return users
+        recipients = DDSDelivery.objects.filter(from_user_id=from_user_id) \
+            .values(user_id=F('to_user_id')).annotate(latest=Max('id'))
+        share_users = DDSDeliveryShareUser.objects.filter(delivery__from_user_id=from_user_id) \
+            .exclude(dds_id=from_user_id).values(user_id=F('dds_id')).annotate(latest=Max('delivery_id'))
+        # A user can be both a recipient and a share user so twice the limit is read before removing duplicates
+        rows = recipients.union(share_users).order_by('-latest', 'user_id')[:limit * 2]
+        user_ids = []
+        for row in rows:
+            if row['user_id'] not in user_ids:
+                user_ids.append(row['user_id'])
+        return user_ids[:limit]
 
     def get_object(self):
         dds_user_id = self.kwargs.get('pk')
@@ -150,10 +379,28 @@ class DDSProjectsViewSet(DDSViewSet):
     still works well
     """
     serializer_class = DDSProjectSerializer
+    pagination_class = DDSResultsPagination
+
+    def list(self, request, *args, **kwargs):
+        dds_util = DDSUtil(request.user)
+        list_filter = get_list_filter(request.query_params)
+        item_filter = None if list_filter.is_empty() else self._project_filter(list_filter)
+        response = self._paginated_list(partial(DDSProject.iter_list, dds_util), item_filter)
+        if response is not None:
+            return response
+        return super(DDSProjectsViewSet, self).list(request, *args, **kwargs)
 
     def get_queryset(self):
         dds_util = DDSUtil(self.request.user)
-        return self._ds_operation(DDSProject.fetch_list, dds_util)
+        projects = self._ds_operation(DDSProject.fetch_list, dds_util)
+        list_filter = get_list_filter(self.request.query_params)
+        if list_filter.is_empty():
+            return projects
+        return [project for project in projects if self._project_filter(list_filter)(project)]
+
+    @staticmethod
+    def _project_filter(list_filter):
+        return lambda project: list_filter.matches(project.name, project.created_on)
 
     def get_object(self):
         dds_project_id = self.kwargs.get('pk')
@@ -176,13 +423,49 @@ class DDSProjectsViewSet(DDSViewSet):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class DDSProjectTransfersViewSet(DDSViewSet):
+class DDSProjectTransferPagination(PageNumberPagination):
+    """
+    Transfers are only paginated when the page_size query parameter is passed.
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
 
+
+class DDSProjectTransfersViewSet(DDSViewSet):
+    """
+    Lists the DukeDS project transfers of the current user from a local copy that is refreshed in the background.
+    Filter by passing the status, name_prefix (project name), created_after or created_before query parameters.
+    The X-Synced-At header is when the copy was last refreshed.
+    """
     serializer_class = DDSProjectTransferSerializer
+    pagination_class = DDSProjectTransferPagination
 
-    def get_queryset(self):
-        dds_util = DDSUtil(self.request.user)
-        return self._ds_operation(DDSProjectTransfer.fetch_list, dds_util)
+    def list(self, request, *args, **kwargs):
+        dds_util = DDSUtil(request.user)
+        sync_state = self._ds_operation(DDSProjectTransferSync.get_sync_state, request.user, dds_util)
+        records = DDSProjectTransferRecord.for_dds_user(sync_state.dds_user_id) \
+            .order_by(F('created_on').desc(nulls_last=True), 'transfer_id')
+        status_filter = request.query_params.get('status')
+        if status_filter:
+            records = records.filter(status=status_filter)
+        list_filter = get_list_filter(request.query_params)
+        if list_filter.name_prefix:
+            records = records.filter(content__project__name__istartswith=list_filter.name_prefix)
+        if list_filter.created_after:
+            records = records.filter(created_on__gte=list_filter.created_after)
+        if list_filter.created_before:
+            records = records.filter(created_on__lt=list_filter.created_before)
+        page = self.paginate_queryset(records)
+        if page is not None:
+            serializer = self.get_serializer(DDSProjectTransfer.from_records(page), many=True)
+            response = self.get_paginated_response(serializer.data)
+            response.data['synced_at'] = sync_state.synced_at
+        else:
+            serializer = self.get_serializer(DDSProjectTransfer.from_records(list(records)), many=True)
+            response = Response(serializer.data)
+        response['X-Synced-At'] = sync_state.synced_at.isoformat()
+        return response
 
     def get_object(self):
         dds_project_transfer_id = self.kwargs.get('pk')
@@ -190,6 +473,16 @@ class DDSProjectTransfersViewSet(DDSViewSet):
         return self._ds_operation(DDSProjectTransfer.fetch_one, dds_util, dds_project_transfer_id)
 
 
+class DDSStatusView(APIView):
+    """
+    Circuit breaker state and per endpoint latency of requests to DukeDS made by this process
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(dds_circuit_breaker.get_metrics())
+
+
 class UserViewSet(viewsets.GenericViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = UserSerializer
@@ -270,7 +563,152 @@ class S3BucketViewSet(viewsets.ModelViewSet):
             raise WrappedS3Exception(e)
 
 
-class S3DeliveryViewSet(ModelWithEmailTemplateSetMixin, viewsets.ModelViewSet):
+MANIFEST_DEFAULT_PAGE_SIZE = 100
+MANIFEST_MAX_PAGE_SIZE = 1000
+MANIFEST_EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+def parse_manifest_cursor(cursor):
+    """
+    Convert a cursor returned by manifest-entries into a (sequence, index) tuple.
+    :param cursor: str: cursor in the form '<chunk sequence>.<entry index>' or None to start at the beginning
+    """
+    if not cursor:
+        return 0, 0
+    try:
+        sequence, index = [int(part) for part in cursor.split('.')]
+    except ValueError:
+        raise BadRequestException('Invalid cursor: {}'.format(cursor))
+    if sequence < 0 or index < 0:
+        raise BadRequestException('Invalid cursor: {}'.format(cursor))
+    return sequence, index
+
+
+def make_manifest_cursor(sequence, index):
+    return '{}.{}'.format(sequence, index)
+
+
+def get_manifest_page_size(request):
+    page_size = request.query_params.get('page_size', MANIFEST_DEFAULT_PAGE_SIZE)
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise BadRequestException('Invalid page_size: {}'.format(page_size))
+    if page_size < 1:
+        raise BadRequestException('Invalid page_size: {}'.format(page_size))
+    return min(page_size, MANIFEST_MAX_PAGE_SIZE)
+
+
+def iter_manifest_entries(manifest, sequence=0, index=0, path_prefix=None):
+    """
+    Iterate over (sequence, index, entry) tuples in manifest whose path starts with path_prefix.
+    Chunks are not re-verified so callers must check the signature of the manifest first.
+    """
+    for entry_sequence, entry_index, entry in manifest.iter_entries_from(sequence, index, verify=False):
+        if not path_prefix or manifest.get_entry_path(entry).startswith(path_prefix):
+            yield entry_sequence, entry_index, entry
+
+
+def format_manifest_csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+class EchoBuffer(object):
+    """
+    File-like object that returns what is written so csv.writer can be used to build streaming responses.
+    """
+    def write(self, value):
+        return value
+
+
+def iter_manifest_csv(entries):
+    writer = None
+    for _, _, entry in entries:
+        if not writer:
+            writer = csv.DictWriter(EchoBuffer(), fieldnames=list(entry.keys()), extrasaction='ignore')
+            yield writer.writeheader()
+        yield writer.writerow({key: format_manifest_csv_value(value) for key, value in entry.items()})
+
+
+def iter_manifest_ndjson(entries):
+    for _, _, entry in entries:
+        yield json.dumps(entry) + '\n'
+
+
+class ManifestEntriesMixin(object):
+    """
+    Adds endpoints to read the object manifest of a delivery a page at a time or as a streamed export.
+    Both endpoints accept a path_prefix query param to only include objects under a path.
+    """
+    def get_delivery_manifest(self):
+        manifest = self.get_object().manifest
+        if not manifest:
+            raise BadRequestException('Delivery has no manifest.')
+        return manifest
+
+    @action(detail=True, methods=['GET'], url_path='manifest-entries')
+    def manifest_entries(self, request, pk=None):
+        """
+        Return a page of manifest entries. Pass the returned next_cursor as the cursor query param to fetch
+        the following page. next_cursor will be null when there are no more entries.
+        """
+        manifest = self.get_delivery_manifest()
+        sequence, index = parse_manifest_cursor(request.query_params.get('cursor'))
+        page_size = get_manifest_page_size(request)
+        signature_status = manifest.get_signature_status()
+        results = []
+        next_cursor = None
+        if signature_status != ManifestSignatureStatus.INVALID:
+            try:
+                entries = iter_manifest_entries(manifest, sequence, index, request.query_params.get('path_prefix'))
+                for entry_sequence, entry_index, entry in entries:
+                    if len(results) == page_size:
+                        next_cursor = make_manifest_cursor(entry_sequence, entry_index)
+                        break
+                    results.append(entry)
+            except BadSignature:
+                signature_status = ManifestSignatureStatus.INVALID
+                results = []
+                next_cursor = None
+        return Response(data={
+            "status": signature_status,
+            "results": results,
+            "next_cursor": next_cursor,
+        })
+
+    @action(detail=True, methods=['GET'], url_path='manifest-export')
+    def manifest_export(self, request, pk=None):
+        """
+        Stream all manifest entries as newline delimited JSON or CSV based on the file_format query param.
+        """
+        manifest = self.get_delivery_manifest()
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in MANIFEST_EXPORT_FORMATS:
+            raise BadRequestException('Invalid file_format: {}'.format(file_format))
+        # Verify every chunk before streaming so an altered manifest is never returned as a truncated 200
+        try:
+            manifest.verify_signature()
+        except BadSignature:
+            raise BadRequestException(ManifestSignatureStatus.INVALID)
+        entries = iter_manifest_entries(manifest, path_prefix=request.query_params.get('path_prefix'))
+        if file_format == 'csv':
+            response = StreamingHttpResponse(iter_manifest_csv(entries), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(iter_manifest_ndjson(entries), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="manifest-{}.{}"'.format(pk, file_format)
+        return response
+
+
+class DDSDeliveryViewSet(ManifestEntriesMixin, DeliveryViewSet):
+    """
+    DukeDS deliveries along with the manifest of project files recorded when each delivery was sent.
+    """
+    pass
+
+
+class S3DeliveryViewSet(ModelWithEmailTemplateSetMixin, ManifestEntriesMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = S3DeliverySerializer
 
@@ -422,7 +860,7 @@ class DukeUserViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class AzDeliveryViewSet(ModelWithEmailTemplateSetMixin, mixins.CreateModelMixin,
+class AzDeliveryViewSet(ModelWithEmailTemplateSetMixin, ManifestEntriesMixin, mixins.CreateModelMixin,
                         mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.UpdateModelMixin,
                         viewsets.GenericViewSet):
     """
@@ -450,12 +888,16 @@ class AzDeliveryViewSet(ModelWithEmailTemplateSetMixin, mixins.CreateModelMixin,
         Users can only see the deliveries they sent or received.
         """
         request_netid = get_user_netid(self.request)
-        return AzDelivery.objects.filter(Q(from_netid=request_netid) | Q(to_netid=request_netid))
+        return AzDelivery.objects.filter(Q(from_netid=request_netid) | Q(to_netid=request_netid)) \
+            .select_related('source_project', 'destination_project', 'email_template_set')
 
     def before_saving_new_model(self, serializer):
         validated_data = serializer.validated_data
         source_container_url = validated_data["source_project"]["container_url"]
-        container_details = get_container_details(container_url=source_container_url)
+        try:
+            container_details = get_container_details(container_url=source_container_url)
+        except AzSaaSUnavailable:
+            raise StorageServiceUnavailable()
         if not container_details:
             raise ValidationError(f"Data Delivery Error: Unable to find project {source_container_url} in Storage-as-a-Service.")
         container_owner = container_details['owner']
@@ -468,7 +910,16 @@ class AzDeliveryViewSet(ModelWithEmailTemplateSetMixin, mixins.CreateModelMixin,
             source_path=validated_data["source_project"]["path"]
         )
         if existing_delivery:
-            raise ValidationError("Data Delivery Error: An active delivery for this project already exists.")
+            raise ValidationError(ACTIVE_AZ_DELIVERY_EXISTS_MSG)
+
+    def create(self, request, *args, **kwargs):
+        # A concurrent create for the same project can pass the check in before_saving_new_model,
+        # the database index on incomplete deliveries rejects the second insert.
+        try:
+            with transaction.atomic():
+                return super(AzDeliveryViewSet, self).create(request, *args, **kwargs)
+        except IntegrityError:
+            raise ValidationError(ACTIVE_AZ_DELIVERY_EXISTS_MSG)
 
     @action(detail=True, methods=['POST'])
     def send(self, request, pk=None):
@@ -499,14 +950,15 @@ class AzDeliveryViewSet(ModelWithEmailTemplateSetMixin, mixins.CreateModelMixin,
     def manifest(self, request, pk=None):
         delivery = self.get_object()
         manifest = None
-        status = "None"
+        status = ManifestSignatureStatus.NONE
         if delivery.manifest:
             try:
-                signer = Signer()
-                manifest = json.loads(signer.unsign(delivery.manifest.content))
-                status = "Signature Verified"
+                header = delivery.manifest.get_header()
+                header['files'] = list(delivery.manifest.iter_entries())
+                manifest = header
+                status = ManifestSignatureStatus.VERIFIED
             except BadSignature:
-                status = "Invalid Signature"
+                status = ManifestSignatureStatus.INVALID
         delivery_serializer = AzDeliverySerializer(delivery, context={'request': request})
         return Response(data={
             "delivery": delivery_serializer.data,
@@ -547,10 +999,23 @@ class AzDeliveryPreviewView(ModelWithEmailTemplateSetMixin, generics.CreateAPIVi
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+class GzipJSONParser(JSONParser):
+    """
+    Parses JSON request bodies that may be sent with gzip content encoding.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        if request.META.get('HTTP_CONTENT_ENCODING') == 'gzip':
+            stream = gzip.GzipFile(fileobj=stream)
+        return super(GzipJSONParser, self).parse(stream, media_type, parser_context)
+
+
 class AzTransferListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    parser_classes = (GzipJSONParser,)
     """
-    Record a transfer result.
+    Record a transfer result. Large manifests can be uploaded in numbered chunks to
+    AzTransferManifestChunkView beforehand, passing manifest_chunk_count instead of manifest.
     """
     def post(self, request, format=None):
         # User must be in the 'transfer_poster' group to post transfers
@@ -561,7 +1026,6 @@ class AzTransferListView(APIView):
             delivery_id = validated_data["delivery_id"]
             transfer_uuid = validated_data["transfer_uuid"]
             error_message = validated_data.get("error_message")
-            file_manifest = validated_data.get("manifest")
             try:
                 # Make sure the transfer_uuid matches our delivery
                 delivery = AzDelivery.objects.get(pk=delivery_id, transfer_uuid=transfer_uuid)
@@ -570,10 +1034,19 @@ class AzTransferListView(APIView):
                     transfer.set_failed_and_record_message(error_message)
                     return Response(serializer.data, status=status.HTTP_200_OK)
                 elif delivery.state == State.TRANSFERRING:
-                    transfer.record_object_manifest(file_manifest)
-                    transfer.mark_complete()
-                    transfer.email_sender()
-                    transfer.email_recipient()
+                    manifest_chunk_count = validated_data.get("manifest_chunk_count")
+                    if manifest_chunk_count is not None:
+                        missing_chunk_numbers = AzTransferManifestChunkUpload.get_missing_chunk_numbers(
+                            delivery, transfer_uuid, manifest_chunk_count)
+                        if missing_chunk_numbers:
+                            return Response(f"Missing manifest chunks: {missing_chunk_numbers}.",
+                                            status=status.HTTP_400_BAD_REQUEST)
+                    # Record the payload and finish the delivery in the background. Retried posts for the same
+                    # transfer are not queued again.
+                    notification, created = AzTransferNotification.objects.get_or_create(
+                        delivery=delivery, transfer_uuid=transfer_uuid, defaults={'payload': request.data})
+                    if created:
+                        TransferFunctions.queue_complete_transfer(notification)
                 else:
                     return Response(f"Delivery {delivery_id} not in TRANSFERRING state.",
                                     status=status.HTTP_400_BAD_REQUEST)
@@ -583,3 +1056,34 @@ class AzTransferListView(APIView):
                 return Response(msg, status=status.HTTP_400_BAD_REQUEST)
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+class AzTransferManifestChunkView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    """
+    Upload a numbered chunk of the file manifest for a transfer as newline delimited JSON.
+    The body may be sent with gzip content encoding. Uploading the same chunk number again replaces it.
+    """
+    def put(self, request, delivery_id, transfer_uuid, chunk_number, format=None):
+        # User must be in the 'transfer_poster' group to post transfers
+        if not request.user.groups.filter(name="transfer_poster"):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            delivery = AzDelivery.objects.get(pk=delivery_id, transfer_uuid=transfer_uuid)
+        except AzDelivery.DoesNotExist:
+            msg = f"Unable to find delivery for delivery_id:{delivery_id} and transfer_uuid:{transfer_uuid}"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+        if delivery.state != State.TRANSFERRING:
+            return Response(f"Delivery {delivery_id} not in TRANSFERRING state.", status=status.HTTP_400_BAD_REQUEST)
+        if int(chunk_number) >= settings.AZURE_MAX_MANIFEST_CHUNKS:
+            return Response(f"Manifest chunk number must be less than {settings.AZURE_MAX_MANIFEST_CHUNKS}.",
+                            status=status.HTTP_400_BAD_REQUEST)
+        chunk_upload = AzTransferManifestChunkUpload(delivery, transfer_uuid, int(chunk_number))
+        try:
+            entry_count = chunk_upload.save(iter_ndjson_entries(iter_request_lines(request)))
+        except (ValueError, OSError) as e:
+            return Response(f"Invalid manifest chunk: {e}", status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "chunk_number": chunk_upload.chunk_number,
+            "entry_count": entry_count,
+        }, status=status.HTTP_200_OK)
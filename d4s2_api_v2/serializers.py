@@ -1,4 +1,6 @@
+from urllib.parse import urlparse
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from switchboard.dds_util import DDSUtil
 from d4s2_api.models import S3Endpoint, S3User, S3Bucket, S3Delivery, EmailTemplateSet, UserEmailTemplateSet, \
@@ -6,6 +8,7 @@ from d4s2_api.models import S3Endpoint, S3User, S3Bucket, S3Delivery, EmailTempl
 from d4s2_api_v2.models import DDSDeliveryPreview
 from d4s2_api.models import AzDelivery, AzContainerPath, AzStorageConfig
 from d4s2_api.utils import get_netid_from_user
+from switchboard.azure_util import TRANSFER_EXECUTOR_LOCAL
 
 
 class DDSUserSerializer(serializers.Serializer):
@@ -135,7 +138,8 @@ class S3DeliverySerializer(serializers.ModelSerializer):
         model = S3Delivery
         resource_name = 's3delivery'
         fields = ('id', 'bucket', 'from_user', 'to_user', 'state', 'user_message',
-                  'decline_reason', 'performed_by', 'delivery_email_text', 'transfer_id', 'email_template_set')
+                  'decline_reason', 'performed_by', 'delivery_email_text', 'transfer_id', 'email_template_set',
+                  'transfer_mode')
         read_only_fields = ('state', 'decline_reason', 'performed_by', 'delivery_email_text', 'transfer_id',
                             'email_template_set')
 
@@ -144,6 +148,11 @@ class S3DeliverySerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(str("You must be the from user of s3 deliveries you create."))
         return from_user
 
+    def validate_transfer_mode(self, transfer_mode):
+        if self.instance and self.instance.transfer_mode != transfer_mode:
+            raise serializers.ValidationError(str("The transfer mode cannot be changed once a delivery is created."))
+        return transfer_mode
+
     def validate(self, data):
         bucket = data['bucket']
         from_user = data['from_user']
@@ -259,6 +268,14 @@ class DukeUserSerializer(serializers.Serializer):
 
 
 class AzContainerPathSerializer(serializers.ModelSerializer):
+    container_url = serializers.CharField(max_length=200)
+
+    def validate_container_url(self, value):
+        # Local runs address containers in local directories with file:// urls
+        if settings.AZURE_TRANSFER_EXECUTOR == TRANSFER_EXECUTOR_LOCAL and urlparse(value).scheme == 'file':
+            return value
+        return serializers.URLField().run_validation(value)
+
     class Meta:
         model = AzContainerPath
         resource_name = 'azcontainerpath'
@@ -287,7 +304,7 @@ class AzDeliverySerializer(serializers.ModelSerializer):
         return obj.from_netid == current_user_netid
 
     def get_last_updated_on(self, obj):
-        return obj.history.latest().history_date
+        return obj.updated_at
 
     def get_url(self, obj):
         return obj.make_project_url()
@@ -358,3 +375,5 @@ class AzTransferSerializer(serializers.Serializer):
     delivery_id = serializers.CharField(required=True)
     error_message = serializers.CharField(required=False)
     manifest = serializers.JSONField(required=False)
+    manifest_chunk_count = serializers.IntegerField(required=False, min_value=0,
+                                                    max_value=settings.AZURE_MAX_MANIFEST_CHUNKS)
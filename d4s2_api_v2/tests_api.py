@@ -9,16 +9,29 @@ from mock import patch, Mock, MagicMock
 from d4s2_api.models import *
 from mock import call
 from switchboard.s3_util import S3Exception, S3NoSuchBucket
-from switchboard.dds_util import DDSAuthProvider, DDSAffiliate, DDSUser, DataServiceError
-from switchboard.azure_util import AzureProjectSummary
+from switchboard.dds_util import DDSAuthProvider, DDSAffiliate, DDSUser, DataServiceError, DDSUnavailable, \
+    dds_user_cache
+from switchboard.azure_util import AzureProjectSummary, AzSaaSUnavailable
 from gcb_web_auth.models import GroupManagerConnection
 from switchboard import userservice
+from django.conf import settings
 from django.core.signing import Signer
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import Group
+from background_task.tasks import tasks
+from django.utils import timezone
 import json
+import gzip
 
 
 class DDSUsersViewSetTestCase(AuthenticatedResourceTestCase):
+    def setUp(self):
+        super(DDSUsersViewSetTestCase, self).setUp()
+        dds_user_cache.clear()
+        cache.clear()
+
     def test_fails_unauthenticated(self):
         self.client.logout()
         url = reverse('v2-dukedsuser-list')
@@ -99,6 +112,28 @@ class DDSUsersViewSetTestCase(AuthenticatedResourceTestCase):
         self.assertEqual(user['full_name'], 'Joseph Smith')
         self.assertEqual(user['email'], 'joe@joe.joe')
 
+    @patch('d4s2_api_v2.api.DDSUtil')
+    def test_list_users_paged_with_name_prefix(self, mock_dds_util):
+        mock_response = Mock(headers={'x-total': '3', 'x-total-pages': '1'})
+        mock_response.json.return_value = {
+            'results': [
+                {'id': 'user1', 'username': 'joe1', 'full_name': 'Joseph Smith'},
+                {'id': 'user2', 'username': 'bob1', 'full_name': 'Bob Josephson'},
+                {'id': 'user3', 'username': 'joe2', 'full_name': 'Joseph Doe'},
+            ]
+        }
+        mock_dds_util.return_value.get_users_page.return_value = mock_response
+        url = reverse('v2-dukedsuser-list')
+        response = self.client.get(url, {'page_size': 10, 'name_prefix': 'joseph'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['id'] for user in response.data['results']], ['user1', 'user3'])
+        self.assertIsNone(response.data['next'])
+        mock_dds_util.return_value.get_users_page.assert_called_with(1, 100, 'joseph', None, None)
+
+        mock_dds_util.return_value.get_users.return_value = mock_response
+        response = self.client.get(url, {'name_prefix': 'joseph'}, format='json')
+        self.assertEqual([user['id'] for user in response.data], ['user1', 'user3'])
+
     @patch('d4s2_api_v2.api.DDSUtil')
     def test_list_users_with_recent_and_full_name_contains(self, mock_dds_util):
         mock_response = Mock()
@@ -136,23 +171,14 @@ class DDSUsersViewSetTestCase(AuthenticatedResourceTestCase):
         mock_current_user = Mock()
         mock_current_user.id = 'user1'
         mock_dds_util.return_value.get_current_user.return_value = mock_current_user
-        mock_user2 = Mock()
-        mock_user2.json.return_value = {'full_name': 'Joe'}
-        mock_user3 = Mock()
-        mock_user3.json.return_value = {'full_name': 'Jim'}
-        mock_user4 = Mock()
-        mock_user4.json.return_value = {'full_name': 'Bob'}
-        mock_user6 = Mock()
-        mock_user6.json.return_value = {'full_name': 'Dan'}
-        mock_share_users = [
-            mock_user2,
-            mock_user3,
-            mock_user4,
-            mock_user6,
-        ]
-        mock_dds_util.return_value.get_user.side_effect = mock_share_users
+        full_names = {'user2': 'Joe', 'user3': 'Jim', 'user4': 'Bob', 'user6': 'Dan'}
+        mock_dds_util.return_value.get_user.side_effect = lambda user_id: Mock(**{
+            'json.return_value': {'id': user_id, 'full_name': full_names[user_id]}
+        })
         url = reverse('v2-dukedsuser-list') + '?recent=true'
-        response = self.client.get(url, format='json')
+        # Two queries authenticate the request and one finds the recipients
+        with self.assertNumQueries(3):
+            response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # We should have fetch user details for only users who we have shared with
@@ -160,9 +186,38 @@ class DDSUsersViewSetTestCase(AuthenticatedResourceTestCase):
             call('user2'),  call('user3'), call('user4'), call('user6'),
         ], any_order=True)
 
+        # Users from the most recent delivery come first
         self.assertEqual(len(response.data), 4)
         full_names = [user['full_name'] for user in response.data]
-        self.assertEqual(full_names, ['Joe', 'Jim', 'Bob', 'Dan'])
+        self.assertEqual(full_names, ['Dan', 'Joe', 'Jim', 'Bob'])
+
+    @patch('d4s2_api_v2.api.DDSUtil')
+    @patch('d4s2_api_v2.api.settings')
+    def test_list_users_with_recent_limit_and_failures(self, mock_settings, mock_dds_util):
+        mock_settings.DDS_RECENT_USERS_LIMIT = 3
+        mock_settings.DDS_USER_FETCH_WORKERS = 2
+        for idx in range(5):
+            delivery = DDSDelivery.objects.create(project_id='project{}'.format(idx), from_user_id='user1',
+                                                  to_user_id='user2', transfer_id='transfer{}'.format(idx))
+            DDSDeliveryShareUser.objects.create(delivery=delivery, dds_id='share{}'.format(idx))
+        mock_dds_util.return_value.get_current_user.return_value.id = 'user1'
+
+        def get_user(user_id):
+            if user_id == 'share4':
+                raise MockDataServiceError(status_code=500)
+            return Mock(**{'json.return_value': {'id': user_id}})
+        mock_dds_util.return_value.get_user.side_effect = get_user
+        url = reverse('v2-dukedsuser-list') + '?recent=true'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # share4 could not be fetched and is left out
+        self.assertEqual([user['id'] for user in response.data], ['user2', 'share3'])
+
+        # Failures for users that are not cached are returned
+        dds_user_cache.clear()
+        mock_dds_util.return_value.get_user.side_effect = MockDataServiceError(status_code=500)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @patch('d4s2_api_v2.api.DDSUtil')
     def test_get_user(self, mock_dds_util):
@@ -222,6 +277,11 @@ class MockDataServiceError(DataServiceError):
 
 
 class DDSProjectsViewSetTestCase(AuthenticatedResourceTestCase):
+    def setUp(self):
+        super(DDSProjectsViewSetTestCase, self).setUp()
+        dds_user_cache.clear()
+        cache.clear()
+
     def test_fails_unauthenticated(self):
         self.client.logout()
         url = reverse('v2-dukedsproject-list')
@@ -242,7 +302,8 @@ class DDSProjectsViewSetTestCase(AuthenticatedResourceTestCase):
 
     @patch('d4s2_api_v2.api.DDSUtil')
     @patch('d4s2_api_v2.api.DDSUtil.get_project_url')
-    def test_list_projects(self, mock_get_project_url, mock_dds_util):
+    @patch('d4s2_api_v2.api.DDSUtil.get_portal_root')
+    def test_list_projects(self, mock_get_portal_root, mock_get_project_url, mock_dds_util):
         mock_response = Mock()
         mock_response.json.return_value = {
             'results': [
@@ -289,6 +350,81 @@ class DDSProjectsViewSetTestCase(AuthenticatedResourceTestCase):
         self.assertEqual(project['created_on'], '2019-01-02')
         self.assertEqual(project['last_updated_on'], '2019-06-02')
 
+    @staticmethod
+    def make_projects_page_func(names, created_on='2019-01-01T10:00:00Z'):
+        """
+        Create a replacement for DDSUtil.get_projects_page that serves projects with names.
+        """
+        def get_projects_page(page, page_size):
+            total_pages = (len(names) + page_size - 1) // page_size
+            page_names = names[(page - 1) * page_size:page * page_size]
+            response = Mock(headers={'x-total': str(len(names)), 'x-total-pages': str(total_pages)})
+            response.json.return_value = {
+                'results': [
+                    {'id': name, 'name': name, 'audit': {'created_on': created_on, 'last_updated_on': None}}
+                    for name in page_names
+                ]
+            }
+            return response
+        return Mock(side_effect=get_projects_page)
+
+    @patch('d4s2_api_v2.api.DDSUtil')
+    @patch('d4s2_api_v2.api.DDSUtil.get_project_url')
+    @patch('d4s2_api_v2.api.DDSUtil.get_portal_root')
+    def test_list_projects_paged(self, mock_get_portal_root, mock_get_project_url, mock_dds_util):
+        mock_get_projects_page = self.make_projects_page_func(['project{}'.format(i) for i in range(5)])
+        mock_dds_util.return_value.get_projects_page = mock_get_projects_page
+        url = reverse('v2-dukedsproject-list')
+        response = self.client.get(url, {'page_size': 2, 'page': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([project['name'] for project in response.data['results']], ['project2', 'project3'])
+        self.assertIsNotNone(response.data['previous'])
+        # Page 2 is fetched from DukeDS page 2 without reading page 1
+        mock_get_projects_page.assert_called_once_with(2, 2)
+        mock_dds_util.return_value.get_projects.assert_not_called()
+
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual([project['name'] for project in response.data['results']], ['project4'])
+        self.assertIsNone(response.data['next'])
+
+    @patch('d4s2_api_v2.api.DDSUtil')
+    @patch('d4s2_api_v2.api.DDSUtil.get_project_url')
+    @patch('d4s2_api_v2.api.DDSUtil.get_portal_root')
+    def test_list_projects_paged_with_filter(self, mock_get_portal_root, mock_get_project_url, mock_dds_util):
+        names = ['{}{}'.format(prefix, i) for i in range(150) for prefix in ['mouse', 'rat']]
+        mock_get_projects_page = self.make_projects_page_func(names)
+        mock_dds_util.return_value.get_projects_page = mock_get_projects_page
+        url = reverse('v2-dukedsproject-list')
+        response = self.client.get(url, {'page_size': 3, 'name_prefix': 'RAT'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], None)
+        self.assertEqual([project['name'] for project in response.data['results']], ['rat0', 'rat1', 'rat2'])
+        self.assertEqual(mock_get_projects_page.call_count, 1)
+
+        # The cursor resumes within the first DukeDS page and later continues onto the next one
+        mock_get_projects_page.reset_mock()
+        response = self.client.get(response.data['next'].replace('page_size=3', 'page_size=60'), format='json')
+        self.assertEqual(len(response.data['results']), 60)
+        self.assertEqual(response.data['results'][0]['name'], 'rat3')
+        self.assertEqual(response.data['results'][-1]['name'], 'rat62')
+        self.assertEqual(mock_get_projects_page.call_args_list, [call(1, 100), call(2, 100)])
+
+        response = self.client.get(url, {'page_size': 3, 'page': 2, 'name_prefix': 'rat'}, format='json')
+        self.assertEqual([project['name'] for project in response.data['results']], ['rat3', 'rat4', 'rat5'])
+
+        response = self.client.get(url, {'page_size': 3, 'created_after': '2019-02-01'}, format='json')
+        self.assertEqual(response.data['results'], [])
+        self.assertIsNone(response.data['next'])
+
+    @patch('d4s2_api_v2.api.DDSUtil')
+    def test_list_projects_bad_params(self, mock_dds_util):
+        url = reverse('v2-dukedsproject-list')
+        response = self.client.get(url, {'page_size': 3, 'cursor': 'bad'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, {'page_size': 3, 'created_before': 'yesterday'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     @patch('d4s2_api_v2.api.DDSUtil')
     @patch('d4s2_api_v2.api.DDSUtil.get_project_url')
     def test_get_project(self, mock_get_project_url, mock_dds_util):
@@ -397,7 +533,8 @@ class DDSProjectsViewSetTestCase(AuthenticatedResourceTestCase):
             ]
         }
         mock_dds_util.return_value.get_project.return_value = mock_project_response
-        mock_dds_util.return_value.get_project_children.return_value = mock_children_response
+        mock_children_response.headers = {'x-total': '5', 'x-total-pages': '1'}
+        mock_dds_util.return_value.get_project_children_page.return_value = mock_children_response
         url = reverse('v2-dukedsproject-list') + 'project1/summary/'
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -408,7 +545,8 @@ class DDSProjectsViewSetTestCase(AuthenticatedResourceTestCase):
         self.assertEqual(summary['root_folder_count'], 1)
         self.assertEqual(summary['total_size'], 600)
         self.assertEqual(mock_dds_util.return_value.get_project.call_args, call('project1'))
-        self.assertEqual(mock_dds_util.return_value.get_project_children.call_args, call('project1'))
+        self.assertEqual(mock_dds_util.return_value.get_project_children_page.call_args,
+                         call('project1', 1, settings.DDS_PROJECT_CHILDREN_PAGE_SIZE))
 
     @patch('d4s2_api_v2.api.DDSProjectSummary.fetch_one')
     def test_get_summary_wraps_error(self, mock_fetch_one):
@@ -439,7 +577,8 @@ class DDSProjectTransfersViewSetTestCase(AuthenticatedResourceTestCase):
 
     @patch('d4s2_api_v2.api.DDSUtil')
     @patch('d4s2_api_v2.api.DDSUtil.get_project_url')
-    def test_list_transfers(self, mock_get_project_url, mock_dds_util):
+    @patch('d4s2_api_v2.api.DDSUtil.get_portal_root')
+    def test_list_transfers(self, mock_get_portal_root, mock_get_project_url, mock_dds_util):
         mock_response = Mock()
         email_template_set = EmailTemplateSet.objects.create(name='someset')
         delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='user1', to_user_id='user2',
@@ -498,6 +637,7 @@ class DDSProjectTransfersViewSetTestCase(AuthenticatedResourceTestCase):
             ]
         }
         mock_dds_util.return_value.get_project_transfers.return_value = mock_response
+        mock_dds_util.return_value.get_current_user.return_value.id = 'user1'
         url = reverse('v2-dukedsprojecttransfer-list')
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -528,6 +668,41 @@ class DDSProjectTransfersViewSetTestCase(AuthenticatedResourceTestCase):
         self.assertEqual(transfer['created_on'], '2019-01-01')
         self.assertEqual(transfer['last_updated_on'], '2019-06-01')
 
+    @patch('d4s2_api_v2.api.DDSUtil')
+    @patch('d4s2_api_v2.api.DDSUtil.get_portal_root')
+    def test_list_transfers_from_local_copy(self, mock_get_portal_root, mock_dds_util):
+        mock_get_portal_root.return_value = 'https://portal.example.com'
+        DDSProjectTransferSyncState.objects.create(user=self.user, dds_user_id='user1', synced_at=timezone.now())
+        for idx, transfer_status in enumerate(['pending', 'accepted', 'pending']):
+            DDSProjectTransferRecord.save_transfer({
+                'id': 'transfer{}'.format(idx),
+                'status': transfer_status,
+                'from_user': {'id': 'user1'},
+                'to_users': [{'id': 'user2'}],
+                'audit': {'created_on': '2019-01-0{}T10:00:00Z'.format(idx + 1), 'last_updated_on': None},
+                'project': {'id': 'project{}'.format(idx), 'name': 'Mouse'},
+            })
+        url = reverse('v2-dukedsprojecttransfer-list')
+
+        response = self.client.get(url, {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([transfer['id'] for transfer in response.data], ['transfer2', 'transfer0'])
+        self.assertIn('X-Synced-At', response)
+
+        response = self.client.get(url, {'page_size': 2, 'page': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([transfer['id'] for transfer in response.data['results']], ['transfer0'])
+        self.assertIsNotNone(response.data['synced_at'])
+        mock_dds_util.return_value.get_project_transfers.assert_not_called()
+
+        response = self.client.get(url, {'created_after': '2019-01-02', 'created_before': '2019-01-03'}, format='json')
+        self.assertEqual([transfer['id'] for transfer in response.data], ['transfer1'])
+        response = self.client.get(url, {'name_prefix': 'mou', 'status': 'accepted'}, format='json')
+        self.assertEqual([transfer['id'] for transfer in response.data], ['transfer1'])
+        response = self.client.get(url, {'name_prefix': 'rat'}, format='json')
+        self.assertEqual(response.data, [])
+
     @patch('d4s2_api_v2.api.DDSUtil')
     @patch('d4s2_api_v2.api.DDSUtil.get_project_url')
     def test_get_project(self, mock_get_project_url, mock_dds_util):
@@ -575,6 +750,27 @@ class DDSProjectTransfersViewSetTestCase(AuthenticatedResourceTestCase):
         self.assertEqual(transfer['last_updated_on'], '2019-06-01')
 
 
+class DDSStatusViewTestCase(AuthenticatedResourceTestCase):
+    def test_requires_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(reverse('v2-duke-ds-status'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch('d4s2_api_v2.api.dds_circuit_breaker')
+    def test_get(self, mock_dds_circuit_breaker):
+        mock_dds_circuit_breaker.get_metrics.return_value = {'state': 'open', 'endpoints': {}}
+        response = self.client.get(reverse('v2-duke-ds-status'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'state': 'open', 'endpoints': {}})
+
+    @patch('d4s2_api_v2.api.DDSUtil')
+    def test_unavailable_responds_service_unavailable(self, mock_dds_util):
+        mock_dds_util.return_value.get_project.side_effect = DDSUnavailable()
+        response = self.client.get(reverse('v2-dukedsproject-detail', args=['project1']))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 class UserLogin(object):
     """
     Wraps up different user states for tests.
@@ -1074,6 +1270,7 @@ class S3DeliveryViewSetTestCase(APITestCase):
         self.assertEqual(len(s3_deliveries), 1)
         self.assertEqual(s3_deliveries[0].bucket, self.mouse1_bucket)
         self.assertEqual(s3_deliveries[0].email_template_set, self.user1_email_template_set)
+        self.assertEqual(s3_deliveries[0].transfer_mode, S3TransferModes.COPY)
 
         data = {
             'bucket': self.mouse1_bucket.id,
@@ -1083,6 +1280,42 @@ class S3DeliveryViewSetTestCase(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_delivery_with_handoff_transfer_mode(self):
+        self.login_user1()
+        url = reverse('v2-s3delivery-list')
+        data = {
+            'bucket': self.mouse1_bucket.id,
+            'from_user': self.s3_user1.id,
+            'to_user': self.s3_user2.id,
+            'transfer_mode': S3TransferModes.HANDOFF,
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['transfer_mode'], S3TransferModes.HANDOFF)
+        self.assertEqual(S3Delivery.objects.get().transfer_mode, S3TransferModes.HANDOFF)
+
+    def test_transfer_mode_cannot_be_changed_after_create(self):
+        self.login_user1()
+        url = reverse('v2-s3delivery-list')
+        data = {
+            'bucket': self.mouse1_bucket.id,
+            'from_user': self.s3_user1.id,
+            'to_user': self.s3_user2.id,
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        delivery_url = url + str(response.data['id']) + '/'
+
+        data['transfer_mode'] = S3TransferModes.HANDOFF
+        response = self.client.put(delivery_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(S3Delivery.objects.get().transfer_mode, S3TransferModes.COPY)
+
+        data['transfer_mode'] = S3TransferModes.COPY
+        data['user_message'] = 'Updated'
+        response = self.client.put(delivery_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_create_delivery_fails_when_user_not_setup(self):
         UserEmailTemplateSet.objects.get(user=self.normal_user1).delete()
         self.login_user1()
@@ -1145,6 +1378,65 @@ class S3DeliveryViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data, [ITEM_EMAIL_TEMPLATES_NOT_SETUP_MSG])
 
+    def test_manifest_entries(self):
+        manifest = S3ObjectManifest.objects.create(chunked=True)
+        manifest_writer = ObjectManifestWriter(manifest, chunk_size=2)
+        manifest_writer.write_all([{'key': 'data/file1.txt'}, {'key': 'other/file2.txt'}, {'key': 'data/file3.txt'}])
+        manifest_writer.close()
+        delivery = S3Delivery.objects.create(bucket=self.mouse1_bucket, from_user=self.s3_user1, to_user=self.s3_user2,
+                                             email_template_set=self.user1_email_template_set, manifest=manifest)
+        self.login_user2()
+        url = reverse('v2-s3delivery-list') + str(delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, {'path_prefix': 'data/', 'page_size': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'Not Signed')
+        self.assertEqual(response.data['results'], [{'key': 'data/file1.txt'}])
+        self.assertEqual(response.data['next_cursor'], '1.0')
+
+        url = reverse('v2-s3delivery-list') + str(delivery.id) + '/manifest-export/'
+        response = self.client.get(url, {'file_format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines, ['key', 'data/file1.txt', 'other/file2.txt', 'data/file3.txt'])
+
+    def test_manifest_entries_legacy_manifest(self):
+        manifest = S3ObjectManifest.objects.create(content=[{'key': 'file1.txt'}, {'key': 'file2.txt'}])
+        delivery = S3Delivery.objects.create(bucket=self.mouse1_bucket, from_user=self.s3_user1, to_user=self.s3_user2,
+                                             email_template_set=self.user1_email_template_set, manifest=manifest)
+        self.login_user1()
+        url = reverse('v2-s3delivery-list') + str(delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, {'cursor': '0.1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'key': 'file2.txt'}])
+        self.assertEqual(response.data['next_cursor'], None)
+
+
+class DDSDeliveryViewSetTestCase(AuthenticatedResourceTestCase):
+    def test_manifest_entries(self):
+        manifest = DDSObjectManifest.objects.create(chunked=True)
+        manifest_writer = ObjectManifestWriter(manifest, chunk_size=2)
+        manifest_writer.write_all([
+            {'id': 'file1', 'path': 'data/file1.txt', 'size': 100, 'version': 1, 'hashes': {'md5': 'abc'}},
+            {'id': 'file2', 'path': 'other/file2.txt', 'size': 200, 'version': 2, 'hashes': {'md5': 'def'}},
+            {'id': 'file3', 'path': 'data/file3.txt', 'size': 300, 'version': 1, 'hashes': {'md5': 'ghi'}},
+        ])
+        manifest_writer.close()
+        delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='user1', to_user_id='user2',
+                                              transfer_id='transfer1', manifest=manifest)
+        url = reverse('v2-delivery-list') + str(delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, {'path_prefix': 'data/'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'Not Signed')
+        self.assertEqual([entry['path'] for entry in response.data['results']], ['data/file1.txt', 'data/file3.txt'])
+        self.assertEqual(response.data['next_cursor'], None)
+
+    def test_manifest_entries_without_manifest(self):
+        delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='user1', to_user_id='user2',
+                                              transfer_id='transfer1')
+        url = reverse('v2-delivery-list') + str(delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class DeliveryPreviewViewTestCase(APITestCase):
 
@@ -1617,6 +1909,44 @@ class AzDeliveryViewSetTestCase(EmailTemplateSetSetup, AuthenticatedResourceTest
         paths = set([item["source_project"]["path"] for item in response.data])
         self.assertEqual(paths, set(["api_user/mouse", 'user2/cat']))
 
+    def create_my_deliveries(self, count):
+        for i in range(count):
+            AzDelivery.objects.create(
+                source_project=AzContainerPath.objects.create(
+                    path="api_user/mouse{}".format(i),
+                    container_url="http://127.0.0.1"),
+                destination_project=AzContainerPath.objects.create(
+                    path="user2/mouse{}".format(i),
+                    container_url="http://127.0.0.2"),
+                from_netid=self.user.username,
+                to_netid='user2',
+                state=State.ACCEPTED,
+            )
+
+    def test_get_list_query_count_independent_of_deliveries(self):
+        url = reverse('v2-azdeliveries-list')
+        self.create_my_deliveries(1)
+        with CaptureQueriesContext(connection) as single_delivery_queries:
+            response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 1)
+        self.create_my_deliveries(4)
+        with CaptureQueriesContext(connection) as many_delivery_queries:
+            response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(many_delivery_queries), len(single_delivery_queries))
+
+    def test_get_list_last_updated_on(self):
+        self.create_my_deliveries(1)
+        delivery = AzDelivery.objects.get()
+        url = reverse('v2-azdeliveries-list')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['last_updated_on'], delivery.updated_at)
+        delivery.mark_notified('email text')
+        delivery.refresh_from_db()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data[0]['last_updated_on'], delivery.updated_at)
+
     def test_create_required_fields(self):
         url = reverse('v2-azdeliveries-list')
         response = self.client.post(url, {}, format='json')
@@ -1659,6 +1989,22 @@ class AzDeliveryViewSetTestCase(EmailTemplateSetSetup, AuthenticatedResourceTest
         self.assertEqual(str(response.data[0]),
                          f'Data Delivery Error: Unable to find project {container_url} in Storage-as-a-Service.')
 
+    @patch('d4s2_api_v2.api.get_container_details')
+    def test_create_storage_service_unavailable(self, mock_get_container_details):
+        mock_get_container_details.side_effect = AzSaaSUnavailable('timeout')
+        url = reverse('v2-azdeliveries-list')
+        response = self.client.post(url, {
+            'source_project': {
+                'path': 'api_user/mouse',
+                'container_url': 'http://127.0.0.1'
+            },
+            'from_netid': self.user.username,
+            'to_netid': 'user2',
+            'share_user_ids': ['user3', 'user4']
+        }, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(AzDelivery.objects.count(), 0)
+
     @patch('d4s2_api_v2.api.get_container_details')
     def test_create_wrong_user(self, mock_get_container_details):
         mock_get_container_details.return_value = {"owner": "userZ"}
@@ -1699,6 +2045,33 @@ class AzDeliveryViewSetTestCase(EmailTemplateSetSetup, AuthenticatedResourceTest
         self.assertEqual(response.status_code, 400)
         self.assertEqual(str(response.data[0]), 'Data Delivery Error: An active delivery for this project already exists.')
 
+    @patch('d4s2_api_v2.api.AzDelivery.get_incomplete_delivery')
+    @patch('d4s2_api_v2.api.get_container_details')
+    def test_create_concurrent_delivery_rejected(self, mock_get_container_details, mock_get_incomplete_delivery):
+        # simulates another request creating a delivery after the incomplete delivery check ran
+        mock_get_incomplete_delivery.return_value = None
+        mock_get_container_details.return_value = {"owner": self.user.username}
+        AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(
+                path="api_user/mouse",
+                container_url="http://127.0.0.1"),
+            from_netid=self.user.username,
+            to_netid='user2',
+        )
+        url = reverse('v2-azdeliveries-list')
+        response = self.client.post(url, {
+            'source_project': {
+                'path': 'api_user/mouse',
+                'container_url': 'http://127.0.0.1'
+            },
+            'from_netid': self.user.username,
+            'to_netid': 'user2',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(response.data[0]), 'Data Delivery Error: An active delivery for this project already exists.')
+        self.assertEqual(AzDelivery.objects.count(), 1)
+        self.assertEqual(AzContainerPath.objects.count(), 1)
+
     def test_put(self):
         delivery = AzDelivery.objects.create(
             source_project=AzContainerPath.objects.create(
@@ -1758,7 +2131,7 @@ class AzDeliveryViewSetTestCase(EmailTemplateSetSetup, AuthenticatedResourceTest
         self.assertEqual(az_delivery.state, State.CANCELED)
 
     def test_manifest(self):
-        signed_manifest = Signer().sign('{"A":1}')
+        signed_manifest = Signer().sign('{"A":1,"files":[{"name":"file1.txt"}]}')
         az_delivery = AzDelivery.objects.create(
             source_project=AzContainerPath.objects.create(
                 path="api_user/mouse",
@@ -1772,8 +2145,160 @@ class AzDeliveryViewSetTestCase(EmailTemplateSetSetup, AuthenticatedResourceTest
         url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest/'
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data['manifest'], {'A': 1})
+        self.assertEqual(response.data['manifest'], {'A': 1, 'files': [{'name': 'file1.txt'}]})
+        self.assertEqual(response.data['status'], 'Signature Verified')
+
+    def test_manifest_chunked(self):
+        manifest = AzObjectManifest(chunked=True)
+        manifest.set_header({'delivery': 1})
+        manifest.save()
+        manifest_writer = ObjectManifestWriter(manifest, chunk_size=1)
+        manifest_writer.write_all([{'name': 'file1.txt'}, {'name': 'file2.txt'}])
+        manifest_writer.close()
+        az_delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(
+                path="api_user/mouse",
+                container_url="http://127.0.0.1"),
+            from_netid='user2',
+            to_netid=self.user.username,
+            email_template_set=self.core2ts,
+            manifest=manifest
+        )
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest/'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['manifest'], {
+            'delivery': 1, 'chunk_count': 2, 'entry_count': 2,
+            'files': [{'name': 'file1.txt'}, {'name': 'file2.txt'}]
+        })
+        self.assertEqual(response.data['status'], 'Signature Verified')
+
+        AzObjectManifestChunk.objects.filter(manifest=manifest, sequence=1).delete()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['manifest'], None)
+        self.assertEqual(response.data['status'], 'Invalid Signature')
+
+    def create_delivery_with_chunked_manifest(self, entries, chunk_size):
+        manifest = AzObjectManifest(chunked=True)
+        manifest.set_header({'delivery': 1})
+        manifest.save()
+        manifest_writer = ObjectManifestWriter(manifest, chunk_size=chunk_size)
+        manifest_writer.write_all(entries)
+        manifest_writer.close()
+        return AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(
+                path="api_user/mouse",
+                container_url="http://127.0.0.1"),
+            from_netid='user2',
+            to_netid=self.user.username,
+            email_template_set=self.core2ts,
+            manifest=manifest
+        )
+
+    def test_manifest_entries(self):
+        az_delivery = self.create_delivery_with_chunked_manifest([
+            {'name': 'data/file1.txt'}, {'name': 'data/file2.txt'}, {'name': 'other/file3.txt'},
+            {'name': 'data/file4.txt'}, {'name': 'data/file5.txt'}
+        ], chunk_size=2)
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-entries/'
+
+        response = self.client.get(url, {'page_size': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'Signature Verified')
+        self.assertEqual(response.data['results'], [{'name': 'data/file1.txt'}, {'name': 'data/file2.txt'}])
+        self.assertEqual(response.data['next_cursor'], '1.0')
+
+        response = self.client.get(url, {'page_size': 2, 'cursor': '1.0'}, format='json')
+        self.assertEqual(response.data['results'], [{'name': 'other/file3.txt'}, {'name': 'data/file4.txt'}])
+        self.assertEqual(response.data['next_cursor'], '2.0')
+
+        response = self.client.get(url, {'page_size': 2, 'cursor': '2.0'}, format='json')
+        self.assertEqual(response.data['results'], [{'name': 'data/file5.txt'}])
+        self.assertEqual(response.data['next_cursor'], None)
+
+        response = self.client.get(url, {'page_size': 3, 'path_prefix': 'data/'}, format='json')
+        self.assertEqual(response.data['results'], [
+            {'name': 'data/file1.txt'}, {'name': 'data/file2.txt'}, {'name': 'data/file4.txt'}
+        ])
+        self.assertEqual(response.data['next_cursor'], '2.0')
+
+    def test_manifest_entries_bad_params(self):
+        az_delivery = self.create_delivery_with_chunked_manifest([{'name': 'file1.txt'}], chunk_size=2)
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, {'cursor': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'page_size': '0'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_manifest_entries_tampered_chunk(self):
+        az_delivery = self.create_delivery_with_chunked_manifest([{'name': 'file1.txt'}, {'name': 'file2.txt'}],
+                                                                 chunk_size=1)
+        chunk = AzObjectManifestChunk.objects.get(manifest=az_delivery.manifest, sequence=1)
+        chunk.content = AzObjectManifestChunk.compress_entries([{'name': 'bad.txt'}])
+        chunk.save()
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, {'cursor': '1.0'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'Invalid Signature')
+        self.assertEqual(response.data['results'], [])
+
+    @patch('d4s2_api.models.AzObjectManifest.verify_chunk_signature')
+    def test_manifest_entries_verifies_chunks_once(self, mock_verify_chunk_signature):
+        az_delivery = self.create_delivery_with_chunked_manifest([{'name': 'file1.txt'}, {'name': 'file2.txt'}],
+                                                                 chunk_size=1)
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, {'page_size': 1}, format='json')
         self.assertEqual(response.data['status'], 'Signature Verified')
+        self.assertEqual(mock_verify_chunk_signature.call_count, 2)
+        response = self.client.get(url, {'page_size': 1, 'cursor': response.data['next_cursor']}, format='json')
+        self.assertEqual(response.data['results'], [{'name': 'file2.txt'}])
+        self.assertEqual(mock_verify_chunk_signature.call_count, 2)
+
+    def test_manifest_entries_no_manifest(self):
+        az_delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(
+                path="api_user/mouse",
+                container_url="http://127.0.0.1"),
+            from_netid='user2',
+            to_netid=self.user.username,
+            email_template_set=self.core2ts,
+        )
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-entries/'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_manifest_export(self):
+        az_delivery = self.create_delivery_with_chunked_manifest([
+            {'name': 'data/file1.txt', 'content_length': 10}, {'name': 'other/file2.txt', 'content_length': 20},
+        ], chunk_size=1)
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-export/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'name': 'data/file1.txt', 'content_length': 10}, {'name': 'other/file2.txt', 'content_length': 20},
+        ])
+
+        response = self.client.get(url, {'file_format': 'csv', 'path_prefix': 'data/'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines, ['name,content_length', 'data/file1.txt,10'])
+
+        response = self.client.get(url, {'file_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_manifest_export_tampered_chunk(self):
+        az_delivery = self.create_delivery_with_chunked_manifest([{'name': 'file1.txt'}, {'name': 'file2.txt'}],
+                                                                 chunk_size=1)
+        chunk = AzObjectManifestChunk.objects.get(manifest=az_delivery.manifest, sequence=1)
+        chunk.content = AzObjectManifestChunk.compress_entries([{'name': 'bad.txt'}])
+        chunk.save()
+        url = reverse('v2-azdeliveries-list') + str(az_delivery.id) + '/manifest-export/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 400)
 
     @patch('d4s2_api_v2.api.create_project_summary')
     def test_summary(self, mock_create_project_summary):
@@ -1925,9 +2450,14 @@ class AzTransferListViewTestCase(APITestCase):
         self.delivery.refresh_from_db()
         self.assertEqual(self.delivery.state, State.FAILED)
 
+    @patch('switchboard.azure_util.get_user_object_id')
+    @patch('switchboard.azure_util.DefaultAzureCredential')
+    @patch('switchboard.azure_util.get_file_system_client')
+    @patch('switchboard.azure_util.AzureAclPropagation')
     @patch('switchboard.azure_util.AzMessageFactory')
     @patch('switchboard.azure_util.settings')
-    def test_post_delivery(self, mock_settings, mock_az_message_factory):
+    def test_post_delivery(self, mock_settings, mock_az_message_factory, mock_acl_propagation,
+                           mock_get_file_system_client, mock_default_azure_credential, mock_get_user_object_id):
         self.add_user_to_transfer_poster_group()
         mock_az_message_factory.return_value.make_processed_message.return_value = Mock(email_text='sometext')
         my_uuid = str(uuid.uuid4())
@@ -1938,11 +2468,124 @@ class AzTransferListViewTestCase(APITestCase):
         data = {
             'transfer_uuid': my_uuid,
             'delivery_id': self.delivery.id,
-            'manifest': 'something'
+            'manifest': [{'name': 'something'}]
         }
         mock_settings.USERNAME_EMAIL_HOST = 'sample.com'
         response = self.client.post(url, data=data, format='json')
         self.assertEqual(response.status_code, 200)
         self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.TRANSFERRING)
+        notification = AzTransferNotification.objects.get(delivery=self.delivery)
+        self.assertEqual(notification.payload['manifest'], [{'name': 'something'}])
+
+        # retried posts for the same transfer are not queued again
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AzTransferNotification.objects.filter(delivery=self.delivery).count(), 1)
+
+        tasks.run_next_task()
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.ACCEPTED)
+        self.assertEqual(list(self.delivery.manifest.iter_entries()), [{'name': 'something'}])
+        notification.refresh_from_db()
+        self.assertEqual(notification.processed, True)
+
+    def setup_transferring_delivery(self):
+        self.add_user_to_transfer_poster_group()
+        my_uuid = str(uuid.uuid4())
+        self.delivery.transfer_uuid = my_uuid
+        self.delivery.state = State.TRANSFERRING
+        self.delivery.save()
+        return my_uuid
+
+    def manifest_chunk_url(self, my_uuid, chunk_number):
+        return reverse('v2-az-transfer-manifest-chunks', kwargs={
+            'delivery_id': self.delivery.id, 'transfer_uuid': my_uuid, 'chunk_number': chunk_number
+        })
+
+    def test_put_manifest_chunk(self):
+        my_uuid = self.setup_transferring_delivery()
+        body = b'{"name": "file1.txt"}\n\n{"name": "file2.txt"}\n'
+        response = self.client.put(self.manifest_chunk_url(my_uuid, 0), data=body,
+                                   content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'chunk_number': 0, 'entry_count': 2})
+
+        response = self.client.put(self.manifest_chunk_url(my_uuid, 1), data=gzip.compress(b'{"name": "file3.txt"}'),
+                                   content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'chunk_number': 1, 'entry_count': 1})
+
+        # uploading a chunk again replaces it
+        response = self.client.put(self.manifest_chunk_url(my_uuid, 1), data=b'{"name": "file4.txt"}',
+                                   content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        parts = AzTransferManifestPart.objects.filter(delivery=self.delivery).order_by('chunk_number')
+        self.assertEqual([part.get_entries() for part in parts], [
+            [{'name': 'file1.txt'}, {'name': 'file2.txt'}],
+            [{'name': 'file4.txt'}],
+        ])
+
+    def test_put_manifest_chunk_invalid(self):
+        my_uuid = self.setup_transferring_delivery()
+        response = self.client.put(self.manifest_chunk_url(my_uuid, 0), data=b'{"name": "file1.txt"}\n{bad',
+                                   content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, 'Invalid manifest chunk: Invalid JSON on line 2.')
+        self.assertEqual(AzTransferManifestPart.objects.count(), 0)
+
+        response = self.client.put(self.manifest_chunk_url(str(uuid.uuid4()), 0), data=b'',
+                                   content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+        with self.settings(AZURE_MAX_MANIFEST_CHUNKS=5):
+            response = self.client.put(self.manifest_chunk_url(my_uuid, 5), data=b'',
+                                       content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, 'Manifest chunk number must be less than 5.')
+
+    def test_put_manifest_chunk_not_in_group(self):
+        my_uuid = str(uuid.uuid4())
+        self.user = User.objects.create_user(username='user1@sample.com', password='12345')
+        self.client.login(username='user1@sample.com', password='12345')
+        response = self.client.put(self.manifest_chunk_url(my_uuid, 0), data=b'', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 401)
+
+    @patch('switchboard.azure_util.get_user_object_id')
+    @patch('switchboard.azure_util.DefaultAzureCredential')
+    @patch('switchboard.azure_util.get_file_system_client')
+    @patch('switchboard.azure_util.AzureAclPropagation')
+    @patch('switchboard.azure_util.AzMessageFactory')
+    @patch('switchboard.azure_util.settings')
+    def test_post_delivery_with_manifest_chunks(self, mock_settings, mock_az_message_factory, mock_acl_propagation,
+                                                mock_get_file_system_client, mock_default_azure_credential,
+                                                mock_get_user_object_id):
+        mock_settings.USERNAME_EMAIL_HOST = 'sample.com'
+        mock_az_message_factory.return_value.make_processed_message.return_value = Mock(email_text='sometext')
+        my_uuid = self.setup_transferring_delivery()
+        self.client.put(self.manifest_chunk_url(my_uuid, 0), data=b'{"name": "file1.txt"}',
+                        content_type='application/x-ndjson')
+        url = reverse('v2-az-transfers')
+        data = {
+            'transfer_uuid': my_uuid,
+            'delivery_id': self.delivery.id,
+            'manifest_chunk_count': 2
+        }
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, 'Missing manifest chunks: [1].')
+
+        response = self.client.post(url, data=dict(data, manifest_chunk_count=10 ** 10), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('manifest_chunk_count', response.data)
+
+        self.client.put(self.manifest_chunk_url(my_uuid, 1), data=b'{"name": "file2.txt"}',
+                        content_type='application/x-ndjson')
+        response = self.client.post(url, data=gzip.compress(json.dumps(data).encode('utf-8')),
+                                    content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        tasks.run_next_task()
+        self.delivery.refresh_from_db()
         self.assertEqual(self.delivery.state, State.ACCEPTED)
-        self.assertIn('"files": "something"', self.delivery.manifest.content)
+        self.assertEqual(list(self.delivery.manifest.iter_entries()), [{'name': 'file1.txt'}, {'name': 'file2.txt'}])
+        self.assertEqual(AzTransferManifestPart.objects.filter(delivery=self.delivery).count(), 0)
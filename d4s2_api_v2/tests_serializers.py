@@ -1,5 +1,5 @@
 from django.test import TestCase
-from d4s2_api_v2.serializers import DDSDeliveryPreviewSerializer, UserSerializer
+from d4s2_api_v2.serializers import DDSDeliveryPreviewSerializer, UserSerializer, AzContainerPathSerializer
 from django.contrib.auth.models import User as django_user
 from mock import patch, call
 
@@ -50,3 +50,16 @@ class UserSerializerSerializerTestCase(TestCase):
             call(user, 'dds'),
             call(user, 'azure'),
         ])
+
+
+class AzContainerPathSerializerTestCase(TestCase):
+    def test_valid_https_container_url(self):
+        serializer = AzContainerPathSerializer(data={
+            'path': 'user1/mouse', 'container_url': 'https://acct.blob.core.windows.net/container'})
+        self.assertTrue(serializer.is_valid())
+
+    def test_file_container_url_only_valid_for_local_executor(self):
+        data = {'path': 'user1/mouse', 'container_url': 'file:///tmp/user1@duke.edu'}
+        self.assertFalse(AzContainerPathSerializer(data=data).is_valid())
+        with self.settings(AZURE_TRANSFER_EXECUTOR='local'):
+            self.assertTrue(AzContainerPathSerializer(data=data).is_valid())
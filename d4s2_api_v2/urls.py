@@ -3,7 +3,7 @@ from rest_framework import routers
 from d4s2_api_v2 import api
 
 router = routers.DefaultRouter()
-router.register(r'deliveries', api.DeliveryViewSet, 'v2-delivery')
+router.register(r'deliveries', api.DDSDeliveryViewSet, 'v2-delivery')
 router.register(r'duke-ds-users', api.DDSUsersViewSet, 'v2-dukedsuser')
 router.register(r'duke-ds-auth-providers', api.DDSAuthProviderViewSet, 'v2-dukedsauthprovider')
 router.register(r'duke-ds-auth-provider-affiliates', api.DDSAuthProviderAffiliatesViewSet, 'v2-dukedsauthprovideraffiliates')
@@ -21,7 +21,10 @@ router.register(r'az-deliveries', api.AzDeliveryViewSet, 'v2-azdeliveries')
 
 urlpatterns = [
     url(r'^', include(router.urls)),
+    url(r'az-transfers/(?P<delivery_id>\d+)/(?P<transfer_uuid>[-0-9a-fA-F]+)/manifest-chunks/(?P<chunk_number>\d+)/$',
+        api.AzTransferManifestChunkView.as_view(), name='v2-az-transfer-manifest-chunks'),
     url(r'az-transfers/', api.AzTransferListView.as_view(), name='v2-az-transfers'),
     url(r'az-delivery-previews', api.AzDeliveryPreviewView.as_view(), name='v2-az-delivery_previews'),
     url(r'delivery-previews', api.DeliveryPreviewView.as_view(), name='v2-delivery_previews'),
+    url(r'duke-ds-status/$', api.DDSStatusView.as_view(), name='v2-duke-ds-status'),
 ]
@@ -2,6 +2,7 @@ from django.core.urlresolvers import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from mock import patch, Mock, call, ANY
+from background_task.tasks import tasks
 from d4s2_api.models import *
 from gcb_web_auth.models import DDSEndpoint, DDSUserCredential
 from django.contrib.auth.models import User as django_user
@@ -83,6 +84,14 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
             return Mock(full_name='Recipient', email=self.recipient_user.email)
         raise ValueError("Invalid user id:" + user_id)
 
+    @staticmethod
+    def setup_empty_project(mock_data_service):
+        """
+        Projects are summarized and their files recorded in the background, make them empty.
+        """
+        mock_data_service.get_project_by_id.return_value.json.return_value = {'id': 'project-1'}
+        mock_data_service._get_single_page.return_value = Mock(headers={}, json=Mock(return_value={'results': []}))
+
     @patch('d4s2_api_v1.api.DDSUtil', autospec=True)
     @patch('switchboard.dds_util.DDSUser', autospec=True)
     @patch('switchboard.dds_util.DDSProjectTransfer', autospec=True)
@@ -93,6 +102,7 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         mock_dds_util.return_value.create_project_transfer.return_value = {'id': 'transfer_1'}
         mock_dds_user.fetch_one = self.dds_user_fetch_one
         mock_remote_store.return_value.data_service = Mock()
+        self.setup_empty_project(mock_remote_store.return_value.data_service)
         mock_message.return_value = Mock(email_text='')
         mock_project_transfer.fetch_one.return_value.project_dict = {'name': 'MouseRNA'}
 
@@ -134,6 +144,11 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         url = reverse('ownership-process')
         response = self.client.post(url, {'transfer_id': 'transfer_1'})
         self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(DDSDelivery.objects.get().state, State.TRANSFERRING)
+
+        # Acceptance is completed by a background task, queued after summarizing the project on creation
+        while tasks.run_next_task():
+            pass
         dds_delivery = DDSDelivery.objects.get()
         self.assertEqual(dds_delivery.state, State.ACCEPTED)
         self.assertEqual(dds_delivery.project_name, 'MouseRNA')
@@ -145,9 +160,9 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         self.assertEqual(mock_message.mock_calls, [
             call(self.recipient_email, self.sender_email, 'Sender Delivery Accepted Subject',
                  'Sender Delivery Accepted Body', ANY, None),
+            call().send(),
             call(self.sender_email, self.recipient_email, 'Sender Delivery Accepted To Recipient Subject',
                  'Sender Delivery Accepted To Recipient Body', ANY, None),
-            call().send(),
             call().send()
         ])
 
@@ -162,6 +177,7 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         mock_dds_user.fetch_one = self.dds_user_fetch_one
         mock_message.return_value = Mock(email_text='')
         mock_remote_store.return_value.data_service = Mock()
+        self.setup_empty_project(mock_remote_store.return_value.data_service)
 
         self.login_as_sender()
 
@@ -227,6 +243,7 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         mock_dds_util.return_value.create_project_transfer.return_value = {'id': 'transfer_1'}
         mock_dds_user.fetch_one = self.dds_user_fetch_one
         mock_remote_store.return_value.data_service = Mock()
+        self.setup_empty_project(mock_remote_store.return_value.data_service)
         mock_message.return_value = Mock(email_text='')
 
         self.login_as_sender()
@@ -274,6 +291,7 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         mock_dds_util.return_value.create_project_transfer.return_value = {'id': 'transfer_1'}
         mock_dds_user.fetch_one = self.dds_user_fetch_one
         mock_remote_store.return_value.data_service = Mock()
+        self.setup_empty_project(mock_remote_store.return_value.data_service)
         mock_message.return_value = Mock(email_text='')
         mock_project_transfer.fetch_one.return_value.project_dict = {'name': 'MouseRNA'}
 
@@ -315,6 +333,11 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         url = reverse('ownership-process')
         response = self.client.post(url, {'transfer_id': 'transfer_1'})
         self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(DDSDelivery.objects.get().state, State.TRANSFERRING)
+
+        # Acceptance is completed by a background task, queued after summarizing the project on creation
+        while tasks.run_next_task():
+            pass
         dds_delivery = DDSDelivery.objects.get()
         self.assertEqual(dds_delivery.state, State.ACCEPTED)
         self.assertEqual(dds_delivery.project_name, 'MouseRNA')
@@ -326,8 +349,8 @@ class DeliveryIntegrationTestCase(APITestCase, ResponseStatusCodeTestCase):
         self.assertEqual(mock_message.mock_calls, [
             call(self.recipient_email, self.sender_email, 'Sender Delivery Accepted Subject',
                  'Sender Delivery Accepted Body', ANY, self.cc_email),
+            call().send(),
             call(self.sender_email, self.recipient_email, 'Sender Delivery Accepted To Recipient Subject',
                  'Sender Delivery Accepted To Recipient Body', ANY, self.cc_email),
-            call().send(),
             call().send()
         ])
@@ -7,7 +7,8 @@ from switchboard.dds_util import SHARE_IN_RESPONSE_TO_DELIVERY_MSG
 from ownership.views import DDSDeliveryType, S3DeliveryType, S3NotRecipientException, DDSNotRecipientException, \
     DataServiceError, S3Exception
 from d4s2_api.models import DDSDelivery, S3Delivery, State, ShareRole, EmailTemplateSet, UserEmailTemplateSet, \
-    EmailTemplate, EmailTemplateType
+    EmailTemplate, EmailTemplateType, AzDelivery, AzContainerPath, DDSTransferStates, DDSDeliveryError
+from switchboard.azure_util import AzDeliveryType, AzSaaSUnavailable
 from d4s2_api.utils import MessageDirection
 from switchboard.mocks_ddsutil import MockDDSUser
 from django.contrib.auth.models import User as django_user
@@ -16,6 +17,7 @@ try:
 except ImportError:
     from urllib import urlencode
 from mock import patch, Mock, call, ANY
+from background_task.tasks import tasks
 
 
 def url_with_transfer_id(name, transfer_id=None):
@@ -247,6 +249,26 @@ class ProcessTestCase(AuthenticatedTestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @patch('switchboard.azure_util.get_user_for_netid')
+    @patch('ownership.views.get_container_owner')
+    @patch('ownership.views.DeliveryViewBase.get_delivery_type')
+    def test_azure_accept_when_storage_service_unavailable(self, mock_get_delivery_type, mock_get_container_owner,
+                                                           mock_get_user_for_netid):
+        mock_get_delivery_type.return_value = AzDeliveryType
+        mock_get_container_owner.side_effect = AzSaaSUnavailable('timeout')
+        delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path='user1/mouse', container_url='https://acct1/container1'),
+            from_netid='user1', to_netid='ownership_user', email_template_set=self.email_template_set)
+        url = reverse('ownership-process')
+        response = self.client.post(url, {'transfer_id': delivery.transfer_id,
+                                          'container_url': 'https://acct2/container2'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIn(reverse('ownership-prompt'), response['Location'])
+        self.assertIn(urlencode({'error_message': 'Unable to verify the owner of https://acct2/container2, '
+                                                  'please try again later.'}), response['Location'])
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.destination_project, None)
+
     @patch('switchboard.dds_util.DDSUtil', autospec=True)
     @patch('switchboard.dds_util.DDSProjectTransfer', autospec=True)
     @patch('d4s2_api.utils.Message', autospec=True)
@@ -281,6 +303,7 @@ class ProcessTestCase(AuthenticatedTestCase):
         url = reverse('ownership-process')
         response = self.client.post(url, {'transfer_id': transfer_id}, follow=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tasks.run_next_task()
 
         delivery.refresh_from_db()
         self.assertEqual(delivery.state, State.ACCEPTED)
@@ -317,12 +340,13 @@ class ProcessTestCase(AuthenticatedTestCase):
         url = reverse('ownership-process')
         response = self.client.post(url, {'transfer_id': transfer_id}, follow=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tasks.run_next_task()
 
         # check that the sender template subject/body was used to render the email
         self.assertEqual(mock_message.mock_calls, [
             call(ANY, ANY, sender_template1.subject, sender_template1.body, ANY, None),
-            call(ANY, ANY, sender_template2.subject, sender_template2.body, ANY, None),
             call().send(),
+            call(ANY, ANY, sender_template2.subject, sender_template2.body, ANY, None),
             call().send(),
         ])
 
@@ -449,6 +473,31 @@ class AcceptedPageTestCase(AuthenticatedTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('View this data', str(response.content))
 
+    @patch('ownership.views.DDSDeliveryType.make_delivery_details')
+    def test_renders_progress_while_transferring(self, mock_make_delivery_details):
+        mock_make_delivery_details.return_value.get_context.return_value = {'project_title': 'MouseRNA'}
+        delivery = self.create_delivery()
+        delivery.performed_by = self.user.username
+        delivery.transfer_state = DDSTransferStates.SHARED_WITH_USERS
+        delivery.mark_transferring()
+        response = self.client.get(reverse('ownership-accepted'), {'transfer_id': delivery.transfer_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('is being accepted', str(response.content))
+        self.assertIn('Shared project with additional users', str(response.content))
+        self.assertIn(reverse('ownership-status'), str(response.content))
+        self.assertNotIn('View this data', str(response.content))
+
+    @patch('ownership.views.DDSDeliveryType.make_delivery_details')
+    def test_renders_warning_when_transfer_complete(self, mock_make_delivery_details):
+        mock_make_delivery_details.return_value.get_context.return_value = {'project_title': 'MouseRNA'}
+        delivery = self.create_delivery()
+        delivery.failed_share_users = ['Joe']
+        delivery.mark_accepted(self.user.username, 'email text')
+        response = self.client.get(reverse('ownership-accepted'), {'transfer_id': delivery.transfer_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('View this data', str(response.content))
+        self.assertIn('Failed to share with the following user(s): Joe', str(response.content))
+
     def test_renders_error_with_bad_transfer_id(self):
         url = reverse('ownership-accepted')
         response = self.client.get(url, {'transfer_id': 'garbage'})
@@ -460,6 +509,54 @@ class AcceptedPageTestCase(AuthenticatedTestCase):
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+class StatusTestCase(AuthenticatedTestCase):
+
+    def test_returns_transfer_progress(self):
+        delivery = self.create_delivery()
+        delivery.performed_by = self.user.username
+        delivery.transfer_state = DDSTransferStates.ACCEPTED_PROJECT_TRANSFER
+        delivery.failed_share_users = ['Joe']
+        delivery.mark_transferring()
+        DDSDeliveryError.objects.create(delivery=delivery, message='Failed to email to joe@joe.com: Timeout')
+        response = self.client.get(reverse('ownership-status'), {'transfer_id': delivery.transfer_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'state': 'Transferring',
+            'transfer_state': 'Accepted project transfer',
+            'complete': False,
+            'failed': False,
+            'warning_message': 'Failed to share with the following user(s): Joe',
+            'errors': ['Failed to email to joe@joe.com: Timeout'],
+        })
+
+    def test_returns_complete_when_accepted(self):
+        delivery = self.create_delivery()
+        delivery.transfer_state = DDSTransferStates.COMPLETE
+        delivery.mark_accepted(self.user.username, 'email text')
+        response = self.client.get(reverse('ownership-status'), {'transfer_id': delivery.transfer_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['complete'])
+
+    def test_errors_for_missing_or_bad_transfer_id(self):
+        response = self.client.get(reverse('ownership-status'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('ownership-status'), {'transfer_id': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_forbidden_for_other_users(self):
+        delivery = self.create_delivery()
+        delivery.performed_by = 'someone_else'
+        delivery.mark_transferring()
+        response = self.client.get(reverse('ownership-status'), {'transfer_id': delivery.transfer_id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_redirects_for_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('ownership-status'), {'transfer_id': 'abc123'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIn('login', response['Location'])
+
+
 class DeclinedPageTestCase(AuthenticatedTestCase):
 
     @patch('ownership.views.DeliveryViewBase.get_delivery_type')
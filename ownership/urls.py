@@ -19,4 +19,5 @@ urlpatterns = [
     url(r'^decline/$', decorate(views.DeclineView.as_view()), name='ownership-decline'),
     url(r'^accepted/$',decorate(views.AcceptedView.as_view()), name='ownership-accepted'),
     url(r'^declined/$', decorate(views.DeclinedView.as_view()), name='ownership-declined'),
+    url(r'^status/$', decorate(views.StatusView.as_view()), name='ownership-status'),
 ]
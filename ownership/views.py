@@ -1,16 +1,17 @@
 from ddsc.core.ddsapi import DataServiceError
 from django.core.urlresolvers import reverse
+from django.http import JsonResponse
 from django.shortcuts import redirect, render_to_response
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 try:
     from urllib.parse import urlencode
 except ImportError:
     from urllib import urlencode
-from d4s2_api.models import State, AzDelivery
+from d4s2_api.models import State, AzDelivery, DDSDelivery, DDSTransferStates
 from switchboard.s3_util import S3Exception, S3DeliveryType, S3NotRecipientException
-from switchboard.dds_util import DDSDeliveryType, DDSNotRecipientException
+from switchboard.dds_util import DDSDeliveryType, DDSNotRecipientException, DeliveryUtil
 from switchboard.azure_util import AzDeliveryType, AzNotRecipientException, AzDestinationProjectNotSetup, \
-    get_container_owner
+    get_container_owner, AzSaaSUnavailable
 from d4s2_api.utils import MessageDirection
 
 
@@ -212,7 +213,16 @@ class ProcessView(DeliveryViewBase):
         else:
             if self.delivery_type == AzDeliveryType:
                 container_url = self.get_container_url()
-                owner = get_container_owner(container_url)
+                try:
+                    owner = get_container_owner(container_url)
+                except AzSaaSUnavailable:
+                    self.redirect_query_params = {
+                        "error_message": "Unable to verify the owner of {}, please try again later.".format(
+                            container_url),
+                        "container_url": container_url
+                    }
+                    self.set_redirect('ownership-prompt')
+                    return
                 if self.request.user.username == owner:
                     self.delivery.update_destination(container_url)
                     self.set_redirect('ownership-accepted')
@@ -276,10 +286,49 @@ class DeclineView(DeliveryViewBase):
 class AcceptedView(DeliveryViewBase):
     """
     Handles GET to show a message that the delivery was accepted
+    DukeDS deliveries are accepted in the background so the page polls StatusView until they finish.
     """
     http_method_names = ['get']
     template_name = 'ownership/accepted.html'
 
+    def get_context_data(self, **kwargs):
+        context = super(AcceptedView, self).get_context_data(**kwargs)
+        delivery = self.delivery
+        if delivery and self.delivery_type == DDSDeliveryType:
+            context['transfer_complete'] = delivery.state == State.ACCEPTED
+            context['transfer_failed'] = delivery.state == State.FAILED
+            context['transfer_step'] = dict(DDSTransferStates.CHOICES)[delivery.transfer_state]
+            context['warning_message'] = DeliveryUtil.make_warning_message(delivery.failed_share_users)
+            context['status_url'] = reverse('ownership-status') + '?' + urlencode({'transfer_id': delivery.transfer_id})
+        return context
+
+
+class StatusView(View):
+    """
+    Handles GET returning the progress of accepting a DukeDS delivery as JSON.
+    Only reads the delivery so it can be polled while the delivery is transferred in the background.
+    """
+    http_method_names = ['get']
+
+    def get(self, request):
+        transfer_id = request.GET.get('transfer_id')
+        if not transfer_id:
+            return JsonResponse({'message': MISSING_TRANSFER_ID_MSG}, status=400)
+        try:
+            delivery = DDSDelivery.objects.get(transfer_id=transfer_id)
+        except DDSDelivery.DoesNotExist:
+            return JsonResponse({'message': TRANSFER_ID_NOT_FOUND}, status=404)
+        if delivery.performed_by != request.user.get_username():
+            return JsonResponse({'message': NOT_RECIPIENT_MSG}, status=403)
+        return JsonResponse({
+            'state': State.DELIVERY_CHOICES[delivery.state][1],
+            'transfer_state': dict(DDSTransferStates.CHOICES)[delivery.transfer_state],
+            'complete': delivery.state == State.ACCEPTED,
+            'failed': delivery.state == State.FAILED,
+            'warning_message': DeliveryUtil.make_warning_message(delivery.failed_share_users),
+            'errors': [error.message for error in delivery.errors.order_by('created')],
+        })
+
 
 class DeclinedView(DeliveryViewBase):
     """
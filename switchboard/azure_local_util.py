@@ -0,0 +1,236 @@
+"""
+Local stand-ins for the Azure transfer pipeline used to exercise and benchmark Azure deliveries offline.
+Projects live in local directories addressed by file:// container urls, e.g. file:///srv/benchmark/container1.
+The owner of a local container is the name of its directory, e.g. file:///srv/benchmark/user1@duke.edu is
+owned by the user with username user1@duke.edu.
+"""
+import os
+import time
+import random
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from switchboard.azure_util import merge_acl
+from switchboard.userservice import create_email_from_netid
+
+LOCAL_TRANSFER_FAILURE_MESSAGE = 'Simulated transfer failure.'
+
+# Access control lists of every local file system keyed by root directory, kept for the life of the process
+# since a new LocalFileSystemClient is created for each step of a delivery
+_acls_by_root = {}
+_acls_lock = threading.Lock()
+
+
+def clear_local_acls():
+    with _acls_lock:
+        _acls_by_root.clear()
+
+
+class LocalDirectoryUser(object):
+    """
+    Stand-in for a directory service user, local runs have no directory service so users are named by netid.
+    """
+    def __init__(self, netid):
+        self.id = netid
+        self.username = netid
+        self.full_name = netid
+        self.first_name = netid
+        self.last_name = ''
+        self.email = create_email_from_netid(netid) or '{}@localhost'.format(netid)
+
+
+def get_local_container_details(root):
+    """
+    Stand-in for the Storage-as-a-Service container details of a local container.
+    :param root: str: directory of the container
+    :return: dict: container details or None if the directory does not exist
+    """
+    if not os.path.isdir(root):
+        return None
+    return {'owner': os.path.basename(root.rstrip('/'))}
+
+
+class LocalPathProperties(object):
+    """
+    Properties of a path in a LocalFileSystemClient, matching the fields used from Data Lake PathProperties.
+    """
+    def __init__(self, name, is_directory, content_length):
+        self.name = name
+        self.is_directory = is_directory
+        self.content_length = content_length
+
+
+class LocalDownload(object):
+    def __init__(self, data):
+        self.data = data
+
+    def readall(self):
+        return self.data
+
+
+class LocalPathClient(object):
+    """
+    Data Lake directory/file client for a path within a LocalFileSystemClient.
+    Access control lists are kept in memory for each local file system since local files have no ACLs.
+    """
+    def __init__(self, file_system_client, path):
+        self.file_system_client = file_system_client
+        self.path = path.strip('/')
+        self.local_path = file_system_client.get_local_path(path)
+
+    def create_directory(self):
+        os.makedirs(self.local_path, exist_ok=True)
+
+    def upload_data(self, data, overwrite=False):
+        if os.path.exists(self.local_path) and not overwrite:
+            raise FileExistsError(self.local_path)
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+        with open(self.local_path, 'wb') as outfile:
+            outfile.write(data)
+
+    def download_file(self):
+        with open(self.local_path, 'rb') as infile:
+            return LocalDownload(infile.read())
+
+    def get_access_control(self):
+        return {'acl': self.file_system_client.acls.get(self.path, '')}
+
+    def set_access_control(self, acl):
+        with self.file_system_client.lock:
+            self.file_system_client.acls[self.path] = acl
+
+    def update_access_control_recursive(self, acl, continuation_token=None, batch_size=None, max_batches=None,
+                                        continue_on_failure=False):
+        paths = [self.path]
+        if os.path.isdir(self.local_path):
+            paths += [path.name for path in self.file_system_client.get_paths(self.path, recursive=True)]
+        with self.file_system_client.lock:
+            for path in paths:
+                # Like Data Lake, entries for other users are kept
+                self.file_system_client.acls[path] = merge_acl(self.file_system_client.acls.get(path, ''), acl)
+        return SimpleNamespace(continuation=None, counters=SimpleNamespace(failure_count=0))
+
+
+class LocalFileSystemClient(object):
+    """
+    Implements the parts of the Data Lake FileSystemClient used by Azure deliveries on top of a local directory.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.lock = _acls_lock
+        with _acls_lock:
+            self.acls = _acls_by_root.setdefault(root, {})
+
+    def get_local_path(self, path):
+        return os.path.join(self.root, path.strip('/'))
+
+    def get_paths(self, path, recursive=True):
+        local_path = self.get_local_path(path)
+        if not os.path.isdir(local_path):
+            raise FileNotFoundError(local_path)
+        for dirpath, dirnames, filenames in os.walk(local_path):
+            dirnames.sort()
+            for name in dirnames + sorted(filenames):
+                child_local_path = os.path.join(dirpath, name)
+                is_directory = os.path.isdir(child_local_path)
+                yield LocalPathProperties(
+                    name=os.path.relpath(child_local_path, self.root),
+                    is_directory=is_directory,
+                    content_length=0 if is_directory else os.path.getsize(child_local_path))
+            if not recursive:
+                break
+
+    def get_directory_client(self, path):
+        return LocalPathClient(self, path)
+
+    def get_file_client(self, path):
+        return LocalPathClient(self, path)
+
+
+def copy_project(source_client, source_path, sink_client, sink_path):
+    """
+    Copy the contents of a project between two file system clients.
+    :param source_client: FileSystemClient: file system containing the source project
+    :param source_path: str: path of the source project
+    :param sink_client: FileSystemClient: file system to copy the project into
+    :param sink_path: str: path of the destination project
+    :return: [dict]: manifest entries for the copied files
+    """
+    manifest = []
+    source_prefix = source_path.strip('/') + '/'
+    sink_client.get_directory_client(sink_path).create_directory()
+    for path_properties in source_client.get_paths(path=source_path, recursive=True):
+        destination_path = sink_path.strip('/') + '/' + path_properties.name[len(source_prefix):]
+        if path_properties.is_directory:
+            sink_client.get_directory_client(destination_path).create_directory()
+        else:
+            data = source_client.get_file_client(path_properties.name).download_file().readall()
+            sink_client.get_file_client(destination_path).upload_data(data, overwrite=True)
+            manifest.append({'name': destination_path, 'size': len(data)})
+    return manifest
+
+
+class LocalTransferExecutor(object):
+    """
+    Stand-in for the transfer pipeline. Copies each project in a worker thread and then posts the result
+    to the transfer webhook just like the pipeline. A delay and a failure rate can be configured to
+    simulate a slow or unreliable pipeline.
+    """
+    def __init__(self, file_system_client_factory, webhook_url, webhook_token, max_workers=8,
+                 delay_seconds=0, failure_rate=0, rand=None):
+        """
+        :param file_system_client_factory: func(container_url): creates a FileSystemClient for a container url
+        :param webhook_url: str: url of the az-transfers endpoint
+        :param webhook_token: str: API token of a user in the transfer_poster group
+        :param max_workers: int: number of transfers to run at once
+        :param delay_seconds: float: maximum time each transfer waits before copying, picked uniformly at random
+        :param failure_rate: float: fraction of transfers that report an error instead of copying
+        :param rand: random.Random: random number generator, allows delays and failures to be reproduced
+        """
+        self.file_system_client_factory = file_system_client_factory
+        self.webhook_url = webhook_url
+        self.webhook_token = webhook_token
+        self.delay_seconds = delay_seconds
+        self.failure_rate = failure_rate
+        self.rand = rand or random.Random()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, delivery_id, transfer_uuid, source_container_url, source_path, sink_container_url, sink_path):
+        """
+        Start copying a project in the background.
+        :return: Future: resolves to the webhook response
+        """
+        delay = self.rand.uniform(0, self.delay_seconds)
+        fail = self.rand.random() < self.failure_rate
+        return self.executor.submit(self.run, delivery_id, transfer_uuid, source_container_url, source_path,
+                                    sink_container_url, sink_path, delay, fail)
+
+    def run(self, delivery_id, transfer_uuid, source_container_url, source_path, sink_container_url, sink_path,
+            delay=0, fail=False):
+        payload = {
+            'delivery_id': str(delivery_id),
+            'transfer_uuid': transfer_uuid,
+        }
+        time.sleep(delay)
+        try:
+            if fail:
+                raise ValueError(LOCAL_TRANSFER_FAILURE_MESSAGE)
+            payload['manifest'] = copy_project(
+                self.file_system_client_factory(source_container_url), source_path,
+                self.file_system_client_factory(sink_container_url), sink_path)
+        except Exception as e:
+            payload['error_message'] = str(e)
+        return self.post_webhook(payload)
+
+    def post_webhook(self, payload):
+        headers = {
+            'user-agent': 'duke-data-delivery/2.0.0',
+            'Authorization': 'Token {}'.format(self.webhook_token),
+        }
+        response = requests.post(self.webhook_url, headers=headers, json=payload)
+        response.raise_for_status()
+        return response
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -1,20 +1,42 @@
 import uuid
+import itertools
 import json
+import gzip
+import time
+import threading
 import traceback
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
 import requests.exceptions
 from d4s2_api.utils import MessageFactory, MessageDirection
 import urllib.parse
 from switchboard.userservice import get_user_for_netid
-from d4s2_api.models import AzDelivery, State, AzObjectManifest, AzDeliveryError, AzTransferStates, StorageTypes
+from background_task import background
+from d4s2_api.models import AzDelivery, State, AzObjectManifest, AzDeliveryError, AzTransferStates, StorageTypes, \
+    ObjectManifestWriter, AzTransferNotification, AzTransferManifestPart, MANIFEST_CHUNK_SIZE, AzAclUpdate
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from azure.core.exceptions import AzureError, HttpResponseError
+from azure.identity import DefaultAzureCredential
+from azure.storage.filedatalake import DataLakeServiceClient
+from msgraph.core import GraphClient
 from django.contrib.auth.models import User
-from django.core.signing import Signer
 
 
 AZURE_SERVICE_NAME = 'Azure Blob Storage'
 DESTINATION_ALREADY_EXISTS_MSG = "Error: The transfer destination directory '{}' already exists."
+INCOMPLETE_DELIVERY_EXISTS_MSG = "Error: Another delivery of '{}' is in progress."
+DOWNLOAD_USER_PERMISSIONS = 'r-x'
+RECIPIENT_PERMISSIONS = 'rwx'
+TRANSFER_EXECUTOR_LOCAL = 'local'
+SAAS_MAX_POOL_CONNECTIONS = 20
+# Fraction of the cache time after which a used container details entry is refreshed in the background
+CONTAINER_DETAILS_REFRESH_FRACTION = 0.75
+# Most missing manifest chunk numbers reported when a transfer result is posted before all chunks are uploaded
+MISSING_CHUNK_NUMBERS_LIMIT = 100
 
 
 class AzNotRecipientException(Exception):
@@ -25,12 +47,35 @@ class AzDestinationProjectNotSetup(Exception):
     pass
 
 
+class AzSaaSUnavailable(Exception):
+    pass
+
+
+class AzUserNotFound(Exception):
+    pass
+
+
+class AzIncompleteDeliveryExists(Exception):
+    pass
+
+
 def get_netid_for_django_user(user):
     if user.username.endswith(settings.USERNAME_EMAIL_HOST):
         return user.username.split("@")[0]
     return None
 
 
+def get_directory_user(netid):
+    """
+    Look up a user in the directory service. Local runs have no directory service so a stand-in is returned.
+    :param netid: str: netid of the user
+    :return: userservice.User
+    """
+    if settings.AZURE_TRANSFER_EXECUTOR == TRANSFER_EXECUTOR_LOCAL:
+        return get_local_util().LocalDirectoryUser(netid)
+    return get_user_for_netid(netid)
+
+
 def get_details_from_container_url(container_url):
     split_result = urllib.parse.urlsplit(container_url)
     storage_account = split_result.netloc.split(".")[0]
@@ -38,6 +83,20 @@ def get_details_from_container_url(container_url):
     return storage_account, file_system_name
 
 
+def merge_acl(acl, new_acl):
+    """
+    Add the entries in new_acl to acl replacing any entries for the same scope, type and id.
+    :param acl: str: comma separated access control entries
+    :param new_acl: str: comma separated access control entries to add
+    :return: str: merged access control entries
+    """
+    entries = {}
+    for entry in acl.split(',') + new_acl.split(','):
+        if entry:
+            entries[entry.rsplit(':', 1)[0]] = entry
+    return ','.join(entries.values())
+
+
 def make_acl(user_id, permissions=None, apply_default=True):
     if permissions:
         acl = f"user:{user_id}:{permissions}"
@@ -49,18 +108,43 @@ def make_acl(user_id, permissions=None, apply_default=True):
         return acl
 
 
+def get_user_object_id(netid, credential):
+    """
+    Look up the Azure Active Directory object id for a netid. Data Lake ACL entries name users by object id.
+    :param netid: str: duke netid of the user
+    :param credential: azure credential used to read users from Microsoft Graph
+    :return: str: object id of the user
+    :raises AzUserNotFound: when there is no user for netid
+    """
+    user_principal_name = '{}@{}'.format(netid, settings.USERNAME_EMAIL_HOST)
+    graph_client = GraphClient(credential=credential)
+    response = graph_client.get('/users/{}'.format(urllib.parse.quote(user_principal_name, safe='@')),
+                                params={'$select': 'id'})
+    if response.status_code == 404:
+        raise AzUserNotFound('No Azure user found for netid {}'.format(netid))
+    response.raise_for_status()
+    return response.json()['id']
+
+
 class AzDeliveryDetails(object):
     def __init__(self, delivery, user):
         self.storage = StorageTypes.AZURE
         self.delivery = delivery
         self.email_template_set = delivery.email_template_set
         self.user = user
+        # Users fetched from the directory service are kept so every message built for this delivery fetches them once
+        self._from_user = None
+        self._to_user = None
 
     def get_from_user(self):
-        return get_user_for_netid(self.delivery.from_netid)
+        if self._from_user is None:
+            self._from_user = get_directory_user(self.delivery.from_netid)
+        return self._from_user
 
     def get_to_user(self):
-        return get_user_for_netid(self.delivery.to_netid)
+        if self._to_user is None:
+            self._to_user = get_directory_user(self.delivery.to_netid)
+        return self._to_user
 
     def get_context(self):
         from_user = self.get_from_user()
@@ -159,14 +243,50 @@ class TransferFunctions(object):
             print(f"Transfer {delivery_id} failed.")
             print(str(e))
 
+    @staticmethod
+    def queue_complete_transfer(notification):
+        TransferFunctions.complete_transfer(notification.id)
+
+    @staticmethod
+    @background
+    def complete_transfer(notification_id):
+        """
+        Complete a delivery after the transfer pipeline has posted a notification that the transfer finished.
+        Steps already recorded in the delivery's transfer_state are skipped so a failed attempt can be retried.
+        :param notification_id: int: id of the AzTransferNotification to process
+        """
+        notification = AzTransferNotification.objects.get(pk=notification_id)
+        transfer = AzureTransfer(notification.delivery_id)
+        try:
+            transfer.ensure_transferring_state()
+            transfer.complete_transfer(notification.get_file_manifest())
+            notification.processed = True
+            notification.save()
+            notification.get_manifest_parts().delete()
+        except AzIncompleteDeliveryExists as e:
+            # Retrying can not succeed while the other delivery is incomplete
+            transfer.set_failed_and_record_exception(e)
+        except Exception as e:
+            transfer.set_failed_and_record_exception(e)
+            raise
+
 
 class AzureTransfer(object):
     def __init__(self, delivery_id):
         self.delivery = AzDelivery.objects.get(pk=delivery_id)
+        self._message_factory = None
 
     def ensure_transferring_state(self):
+        """
+        Return a failed delivery to the transferring state.
+        :raises AzIncompleteDeliveryExists: when a newer delivery of the same source project is incomplete
+        """
         if self.delivery.state != State.TRANSFERRING:
-            self.delivery.mark_transferring()
+            try:
+                with transaction.atomic():
+                    self.delivery.mark_transferring()
+            except IntegrityError:
+                raise AzIncompleteDeliveryExists(INCOMPLETE_DELIVERY_EXISTS_MSG.format(self.delivery.source_path))
 
     def create_delivery_data_dict(self):
         return {
@@ -182,6 +302,13 @@ class AzureTransfer(object):
         self.delivery.transfer_uuid = str(uuid.uuid4())
         self.delivery.save()
 
+        if settings.AZURE_TRANSFER_EXECUTOR == TRANSFER_EXECUTOR_LOCAL:
+            get_local_transfer_executor().submit(
+                self.delivery.id, self.delivery.transfer_uuid,
+                self.delivery.source_project.container_url, self.delivery.source_project.path,
+                self.delivery.destination_project.container_url, self.delivery.destination_project.path)
+            return
+
         # Notify the LogicApp to transfer the project
         source_storage_account, source_file_system_name = get_details_from_container_url(
             self.delivery.source_project.container_url)
@@ -204,16 +331,74 @@ class AzureTransfer(object):
         response.raise_for_status()
 
     def record_object_manifest(self, file_manifest):
-        manifest = self.create_delivery_data_dict()
-        manifest['files'] = file_manifest
-        signer = Signer()
-        signed_manifest_str = signer.sign(json.dumps(manifest, default=str))
-        manifest = AzObjectManifest.objects.create(content=signed_manifest_str)
+        manifest = AzObjectManifest(chunked=True)
+        manifest.set_header(self.create_delivery_data_dict())
+        manifest.save()
+        manifest_writer = ObjectManifestWriter(manifest)
+        manifest_writer.write_all(file_manifest or [])
+        manifest_writer.close()
         self.delivery.manifest = manifest
         self.delivery.transfer_state = AzTransferStates.CREATED_MANIFEST
         self.delivery.save()
         print("Recorded object manifest for {}.".format(self.delivery.id))
 
+    def complete_transfer(self, file_manifest):
+        """
+        Run the remaining steps to complete a transferred delivery based on transfer_state.
+        :param file_manifest: [dict]: metadata about files transferred
+        """
+        if self.delivery.transfer_state < AzTransferStates.CREATED_MANIFEST:
+            self.record_object_manifest(file_manifest)
+        if self.delivery.transfer_state < AzTransferStates.ADDED_DOWNLOAD_USERS:
+            self.give_download_users_permissions()
+        if self.delivery.transfer_state < AzTransferStates.EMAILED_SENDER:
+            self.email_sender(self.get_permissions_warning_message())
+        if self.delivery.transfer_state < AzTransferStates.EMAILED_RECIPIENT:
+            self.email_recipient()
+        if self.delivery.transfer_state < AzTransferStates.COMPLETE:
+            self.mark_complete()
+
+    def give_download_users_permissions(self):
+        """
+        Give the recipient and download users access to every file in the destination project.
+        """
+        print("Giving users access to delivery {}.".format(self.delivery.id))
+        netid_permissions = [(self.delivery.to_netid, RECIPIENT_PERMISSIONS)]
+        for share_user_id in self.delivery.share_user_ids:
+            netid_permissions.append((share_user_id, DOWNLOAD_USER_PERMISSIONS))
+        if settings.AZURE_TRANSFER_EXECUTOR == TRANSFER_EXECUTOR_LOCAL:
+            # Local stand-in storage has no Azure users so its ACLs name users by netid
+            user_permissions = [(netid, netid, permissions) for netid, permissions in netid_permissions]
+        else:
+            credential = DefaultAzureCredential()
+            user_permissions = []
+            for netid, permissions in netid_permissions:
+                try:
+                    user_permissions.append((netid, get_user_object_id(netid, credential), permissions))
+                except AzUserNotFound as e:
+                    # Record the failure so the completion emails name this user and give access to the others
+                    print(str(e))
+                    AzAclUpdate.objects.update_or_create(
+                        delivery=self.delivery, user_id=netid, path=self.delivery.destination_project.path,
+                        defaults={'permissions': permissions, 'is_directory': True, 'complete': True,
+                                  'error_message': str(e)})
+        file_system_client = get_file_system_client(self.delivery.destination_project.container_url)
+        acl_propagation = AzureAclPropagation(self.delivery, file_system_client,
+                                              max_workers=settings.AZURE_ACL_WORKERS,
+                                              batch_size=settings.AZURE_ACL_BATCH_SIZE)
+        acl_propagation.run(user_permissions)
+        self.delivery.transfer_state = AzTransferStates.ADDED_DOWNLOAD_USERS
+        self.delivery.save()
+
+    def get_permissions_warning_message(self):
+        failed_user_ids = set()
+        for acl_update in self.delivery.acl_updates.all():
+            if acl_update.has_failures():
+                failed_user_ids.add(acl_update.user_id)
+        if failed_user_ids:
+            return 'Failed to give access to {}'.format(', '.join(sorted(failed_user_ids)))
+        return ''
+
     def email_sender(self, warning_message=''):
         print("Notifying sender delivery {} has been accepted.".format(self.delivery.id))
         message = self.make_processed_message('accepted', warning_message, direction=MessageDirection.ToSender)
@@ -232,10 +417,18 @@ class AzureTransfer(object):
         self.delivery.save()
 
     def make_processed_message(self, process_type, warning_message, direction):
-        username = '{}@{}'.format(self.delivery.from_netid, settings.USERNAME_EMAIL_HOST)
-        from_user = User.objects.get(username=username)
-        message_factory = AzMessageFactory(self.delivery, from_user)
-        return message_factory.make_processed_message(process_type, direction, warning_message=warning_message)
+        return self.get_message_factory().make_processed_message(process_type, direction,
+                                                                 warning_message=warning_message)
+
+    def get_message_factory(self):
+        """
+        Return the message factory shared by the sender and recipient emails so users are only looked up once.
+        """
+        if self._message_factory is None:
+            username = '{}@{}'.format(self.delivery.from_netid, settings.USERNAME_EMAIL_HOST)
+            from_user = User.objects.get(username=username)
+            self._message_factory = AzMessageFactory(self.delivery, from_user)
+        return self._message_factory
 
     def mark_complete(self):
         print("Marking delivery {} complete.".format(self.delivery.id))
@@ -253,6 +446,91 @@ class AzureTransfer(object):
         traceback.print_exc()
 
 
+def iter_request_lines(request):
+    """
+    Iterate over the lines in the body of request, decompressing it when sent with gzip content encoding.
+    :param request: rest_framework.request.Request: request to read without loading the whole body
+    """
+    stream = request.stream
+    if stream is None:
+        return iter([])
+    if request.META.get('HTTP_CONTENT_ENCODING') == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream)
+    return iter(stream)
+
+
+def iter_ndjson_entries(lines):
+    """
+    Parse newline delimited JSON, skipping blank lines.
+    :param lines: iterable of bytes: lines to parse
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line.decode('utf-8'))
+            except ValueError:
+                raise ValueError('Invalid JSON on line {}.'.format(line_number))
+
+
+class AzTransferManifestChunkUpload(object):
+    """
+    Stores a numbered manifest chunk uploaded by the transfer pipeline as AzTransferManifestParts.
+    Used as the manifest for an ObjectManifestWriter so entries are stored as they are parsed.
+    """
+    def __init__(self, delivery, transfer_uuid, chunk_number, part_size=MANIFEST_CHUNK_SIZE):
+        self.delivery = delivery
+        self.transfer_uuid = transfer_uuid
+        self.chunk_number = chunk_number
+        self.part_size = part_size
+
+    def add_chunk(self, sequence, entries):
+        AzTransferManifestPart.objects.create(
+            delivery=self.delivery, transfer_uuid=self.transfer_uuid, chunk_number=self.chunk_number,
+            sequence=sequence, entry_count=len(entries),
+            content=AzTransferManifestPart.compress_entries(entries))
+
+    def finalize(self, chunk_count, entry_count):
+        # Record empty chunks so the chunk still counts as uploaded
+        if not chunk_count:
+            self.add_chunk(0, [])
+
+    def save(self, entries):
+        """
+        Replace any previously uploaded parts for this chunk with entries.
+        :param entries: iterable of dict: manifest entries
+        :return: int: number of entries saved
+        """
+        with transaction.atomic():
+            AzTransferManifestPart.objects.filter(delivery=self.delivery, transfer_uuid=self.transfer_uuid,
+                                                  chunk_number=self.chunk_number).delete()
+            manifest_writer = ObjectManifestWriter(self, chunk_size=self.part_size)
+            manifest_writer.write_all(entries)
+            manifest_writer.close()
+        return manifest_writer.entry_count
+
+    @staticmethod
+    def get_missing_chunk_numbers(delivery, transfer_uuid, chunk_count, limit=MISSING_CHUNK_NUMBERS_LIMIT):
+        """
+        Find chunk numbers below chunk_count that have not been uploaded. The uploaded chunks are counted
+        in the database so a complete upload is checked without listing every chunk number.
+        :return: [int]: the first limit missing chunk numbers
+        """
+        uploaded_chunk_numbers = AzTransferManifestPart.objects.filter(
+            delivery=delivery, transfer_uuid=transfer_uuid, chunk_number__lt=chunk_count) \
+            .values_list('chunk_number', flat=True).distinct().order_by('chunk_number')
+        if uploaded_chunk_numbers.count() == chunk_count:
+            return []
+        missing_chunk_numbers = []
+        next_chunk_number = 0
+        for chunk_number in itertools.chain(uploaded_chunk_numbers.iterator(), [chunk_count]):
+            missing_chunk_numbers.extend(range(next_chunk_number, chunk_number)[:limit - len(missing_chunk_numbers)])
+            if len(missing_chunk_numbers) >= limit:
+                break
+            next_chunk_number = chunk_number + 1
+        return missing_chunk_numbers
+
+
 class AzureProjectSummary(object):
     def __init__(self, id, based_on):
         self.id = id
@@ -276,10 +554,227 @@ class AzureProjectSummary(object):
             self.total_size += path_dict["content_length"]
             self.file_count += 1
 
+    def add(self, other):
+        """
+        Add the counts from a summary of part of the same project.
+        :param other: AzureProjectSummary: summary to add
+        """
+        self.total_size += other.total_size
+        self.file_count += other.file_count
+        self.folder_count += other.folder_count
+        self.root_folder_count += other.root_folder_count
+        self.sub_folder_count += other.sub_folder_count
+
+
+def make_path_dict(path_properties):
+    return {
+        "name": path_properties.name,
+        "is_directory": bool(path_properties.is_directory),
+        "content_length": path_properties.content_length or 0,
+    }
+
+
+def get_file_system_client(container_url):
+    """
+    Create a Data Lake file system client for container_url. Path style urls used by local
+    storage emulators (http://127.0.0.1:10000/<account>/<container>) are also supported as are
+    file:// urls of local directories.
+    :param container_url: str: url of the container (file system)
+    :return: FileSystemClient
+    """
+    parts = urlparse(container_url)
+    if parts.scheme == 'file':
+        return get_local_util().LocalFileSystemClient(parts.path)
+    path_parts = parts.path.strip('/').split('/')
+    file_system_name = path_parts[-1]
+    netloc = parts.netloc.replace('.blob.', '.dfs.')
+    account_url = '/'.join([f"{parts.scheme}://{netloc}"] + path_parts[:-1])
+    credential = settings.AZURE_STORAGE_ACCOUNT_KEY or DefaultAzureCredential()
+    service_client = DataLakeServiceClient(account_url, credential=credential)
+    return service_client.get_file_system_client(file_system_name)
+
+
+def get_local_util():
+    """
+    Import the local stand-ins for Azure storage and the transfer pipeline. They are only used for offline runs
+    so they are only available when AZURE_TRANSFER_EXECUTOR is 'local'.
+    :return: module: switchboard.azure_local_util
+    """
+    if settings.AZURE_TRANSFER_EXECUTOR != TRANSFER_EXECUTOR_LOCAL:
+        raise ValueError("Local Azure storage requires D4S2_AZURE_TRANSFER_EXECUTOR={}.".format(
+            TRANSFER_EXECUTOR_LOCAL))
+    from switchboard import azure_local_util
+    return azure_local_util
+
+
+_local_transfer_executor = None
+_local_transfer_executor_lock = threading.Lock()
+
+
+def get_local_transfer_executor():
+    """
+    Return the LocalTransferExecutor for this process, creating it from settings on first use.
+    :return: LocalTransferExecutor
+    """
+    global _local_transfer_executor
+    with _local_transfer_executor_lock:
+        if not _local_transfer_executor:
+            _local_transfer_executor = get_local_util().LocalTransferExecutor(
+                get_file_system_client,
+                webhook_url=settings.AZURE_LOCAL_TRANSFER_WEBHOOK_URL,
+                webhook_token=settings.AZURE_LOCAL_TRANSFER_WEBHOOK_TOKEN,
+                max_workers=settings.AZURE_LOCAL_TRANSFER_WORKERS,
+                delay_seconds=settings.AZURE_LOCAL_TRANSFER_DELAY_SECONDS,
+                failure_rate=settings.AZURE_LOCAL_TRANSFER_FAILURE_RATE)
+        return _local_transfer_executor
+
+
+class AzureProjectSummaryBuilder(object):
+    """
+    Builds an AzureProjectSummary by listing the contents of a project.
+    Each top level directory is listed recursively in a separate thread and its counts are added to the
+    summary as each listing finishes.
+    """
+    def __init__(self, file_system_client, max_workers):
+        self.file_system_client = file_system_client
+        self.max_workers = max_workers
+
+    def build(self, summary_id, path):
+        summary = AzureProjectSummary(id=summary_id, based_on="project contents")
+        directory_names = []
+        for path_properties in self.file_system_client.get_paths(path=path, recursive=False):
+            path_dict = make_path_dict(path_properties)
+            summary.apply_path_dict(path_dict)
+            if path_dict["is_directory"]:
+                directory_names.append(path_dict["name"])
+        if directory_names:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.summarize_directory, summary_id, name) for name in directory_names]
+                for future in as_completed(futures):
+                    summary.add(future.result())
+        return summary
+
+    def summarize_directory(self, summary_id, path):
+        summary = AzureProjectSummary(id=summary_id, based_on="project contents")
+        for path_properties in self.file_system_client.get_paths(path=path, recursive=True):
+            summary.apply_path_dict(make_path_dict(path_properties))
+        return summary
+
+
+class AzureAclPropagation(object):
+    """
+    Gives users access to the destination project of a delivery. The project directory is updated directly
+    and each top level file and directory is updated recursively in batches. Batches for different paths run
+    concurrently and the continuation token is saved in an AzAclUpdate after each batch.
+    AzAclUpdates record the netid of each user while the ACL entries use their Azure object id.
+    """
+    def __init__(self, delivery, file_system_client, max_workers, batch_size):
+        self.delivery = delivery
+        self.file_system_client = file_system_client
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.object_ids = {}
+
+    def run(self, user_permissions):
+        """
+        :param user_permissions: [(str, str, str)]: list of netid, Azure object id and permissions to give each user
+        """
+        self.object_ids = {netid: object_id for netid, object_id, _ in user_permissions}
+        acl_updates = [acl_update for acl_update in self.get_acl_updates(user_permissions) if not acl_update.complete]
+        if not acl_updates:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self.run_batch, acl_update): acl_update for acl_update in acl_updates}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    acl_update = pending.pop(future)
+                    if self.record_batch_result(acl_update, future):
+                        pending[executor.submit(self.run_batch, acl_update)] = acl_update
+
+    def get_acl_updates(self, user_permissions):
+        project_path = self.delivery.destination_project.path
+        paths = [(project_path, True)]
+        for path_properties in self.file_system_client.get_paths(path=project_path, recursive=False):
+            paths.append((path_properties.name, bool(path_properties.is_directory)))
+        acl_updates = []
+        for user_id, _, permissions in user_permissions:
+            for path, is_directory in paths:
+                acl_update, _ = AzAclUpdate.objects.get_or_create(
+                    delivery=self.delivery, user_id=user_id, path=path,
+                    defaults={'permissions': permissions, 'is_directory': is_directory})
+                acl_updates.append(acl_update)
+        return acl_updates
+
+    def run_batch(self, acl_update):
+        """
+        Update the ACL for one batch of paths. Runs in a worker thread so it must not use the database.
+        :return: (str, int): continuation token or None when complete, number of paths that failed to update
+        """
+        acl = make_acl(self.object_ids[acl_update.user_id], acl_update.permissions,
+                       apply_default=acl_update.is_directory)
+        if acl_update.path == self.delivery.destination_project.path:
+            # Only the project directory itself, its contents are updated recursively in other batches
+            directory_client = self.file_system_client.get_directory_client(acl_update.path)
+            current_acl = directory_client.get_access_control()['acl']
+            directory_client.set_access_control(acl=merge_acl(current_acl, acl))
+            return None, 0
+        if acl_update.is_directory:
+            path_client = self.file_system_client.get_directory_client(acl_update.path)
+        else:
+            path_client = self.file_system_client.get_file_client(acl_update.path)
+        result = path_client.update_access_control_recursive(
+            acl=acl, continuation_token=acl_update.continuation_token or None, batch_size=self.batch_size,
+            max_batches=1, continue_on_failure=True)
+        return result.continuation, result.counters.failure_count
 
-def create_project_summary(delivery):
-    summary = AzureProjectSummary(id=delivery.id, based_on="project contents")
-    summary.error_msg = "Unable to determine due to permission limitations."
+    @staticmethod
+    def record_batch_result(acl_update, future):
+        """
+        Save the result of a batch.
+        :return: bool: True when there are more batches to run for acl_update
+        """
+        try:
+            continuation_token, failure_count = future.result()
+        except HttpResponseError as e:
+            if e.status_code != 400:
+                raise
+            # The service rejected the ACL for this user, such as an unknown user id
+            acl_update.error_message = str(e)
+            continuation_token, failure_count = None, 0
+        acl_update.continuation_token = continuation_token or ''
+        acl_update.failure_count += failure_count
+        acl_update.complete = not continuation_token
+        acl_update.save()
+        return not acl_update.complete
+
+
+def get_project_summary_cache_key(delivery):
+    # The delivery state is part of the key so a cached summary is not used after the delivery changes state
+    return 'az-project-summary:{}:{}'.format(delivery.id, delivery.state)
+
+
+def create_project_summary(delivery, file_system_client=None):
+    """
+    Summarize the files in the source project of delivery. Summaries are cached per delivery state.
+    :param delivery: AzDelivery: delivery to summarize
+    :param file_system_client: FileSystemClient: client to list the project with, defaults to one for the source
+    container
+    :return: AzureProjectSummary
+    """
+    cache_key = get_project_summary_cache_key(delivery)
+    summary = cache.get(cache_key)
+    if summary is None:
+        try:
+            if not file_system_client:
+                file_system_client = get_file_system_client(delivery.source_project.container_url)
+            builder = AzureProjectSummaryBuilder(file_system_client, settings.AZURE_PROJECT_SUMMARY_WORKERS)
+            summary = builder.build(delivery.id, delivery.source_project.path)
+            cache.set(cache_key, summary, settings.AZURE_PROJECT_SUMMARY_CACHE_SECONDS)
+        except AzureError:
+            traceback.print_exc()
+            summary = AzureProjectSummary(id=delivery.id, based_on="project contents")
+            summary.error_msg = "Unable to determine due to permission limitations."
     return summary
 
 
@@ -290,18 +785,121 @@ def decompose_dfs_url(url):
     return account, container
 
 
-def get_container_details(container_url):
-    try:
-        headers = { "Saas-FileSystems-Api-Key": settings.AZURE_SAAS_KEY }
-        account,container = decompose_dfs_url(container_url)
-        url = f"{settings.AZURE_SAAS_URL}/api/FileSystems/{account}/{container}"
-        response = requests.get(url, headers=headers, timeout=1)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.ReadTimeout as ex:
-        return None
-    except requests.exceptions.HTTPError as ex:
+def fetch_container_details(session, account, container):
+    """
+    Look up container details in Storage-as-a-Service.
+    :return: dict: container details or None if the container was not found
+    :raises requests.exceptions.RequestException: when Storage-as-a-Service could not be reached or failed
+    """
+    headers = {"Saas-FileSystems-Api-Key": settings.AZURE_SAAS_KEY}
+    url = f"{settings.AZURE_SAAS_URL}/api/FileSystems/{account}/{container}"
+    response = session.get(url, headers=headers, timeout=settings.AZURE_SAAS_TIMEOUT)
+    if 400 <= response.status_code < 500:
         return None
+    response.raise_for_status()
+    return response.json()
+
+
+class ContainerDetailsCacheEntry(object):
+    def __init__(self, details, fetched_at, ttl):
+        self.details = details
+        self.fetched_at = fetched_at
+        self.expires_at = fetched_at + ttl
+        self.refresh_at = fetched_at + ttl * CONTAINER_DETAILS_REFRESH_FRACTION
+        self.refreshing = False
+
+
+class ContainerDetailsCache(object):
+    """
+    Process-wide cache of Storage-as-a-Service container details keyed by account and container.
+    Containers that are not found are cached for a shorter time. Concurrent lookups of the same container
+    share a single request, entries used close to expiring are refreshed in the background, and the last
+    known details are used when Storage-as-a-Service is unavailable.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.key_locks = {}
+        self.session = None
+        self.clock = clock
+
+    def get(self, container_url):
+        """
+        Return details for container_url or None if the container does not exist.
+        :raises AzSaaSUnavailable: when details could not be fetched and none are cached
+        """
+        key = decompose_dfs_url(container_url)
+        entry = self.entries.get(key)
+        now = self.clock()
+        if entry and now < entry.expires_at:
+            if now >= entry.refresh_at and entry.details is not None:
+                self._start_refresh(key, entry)
+            return entry.details
+        with self._get_key_lock(key):
+            # Another thread may have fetched the details while we waited
+            entry = self.entries.get(key)
+            if entry and self.clock() < entry.expires_at:
+                return entry.details
+            return self._fetch(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.key_locks = {}
+
+    def _get_session(self):
+        with self.lock:
+            if self.session is None:
+                self.session = requests.Session()
+                self.session.mount('https://', HTTPAdapter(pool_maxsize=SAAS_MAX_POOL_CONNECTIONS))
+                self.session.mount('http://', HTTPAdapter(pool_maxsize=SAAS_MAX_POOL_CONNECTIONS))
+            return self.session
+
+    def _get_key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _fetch(self, key):
+        try:
+            details = fetch_container_details(self._get_session(), *key)
+        except requests.exceptions.RequestException as ex:
+            entry = self.entries.get(key)
+            if entry and entry.details is not None and \
+                    self.clock() < entry.fetched_at + settings.AZURE_SAAS_STALE_SECONDS:
+                return entry.details
+            raise AzSaaSUnavailable(f"Unable to look up container {key[0]}/{key[1]}: {ex}")
+        if details is None:
+            ttl = settings.AZURE_SAAS_NEGATIVE_CACHE_SECONDS
+        else:
+            ttl = settings.AZURE_SAAS_CACHE_SECONDS
+        self.entries[key] = ContainerDetailsCacheEntry(details, self.clock(), ttl)
+        return details
+
+    def _start_refresh(self, key, entry):
+        with self.lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+        threading.Thread(target=self._refresh, args=(key, entry), daemon=True).start()
+
+    def _refresh(self, key, entry):
+        try:
+            with self._get_key_lock(key):
+                self._fetch(key)
+        except AzSaaSUnavailable:
+            traceback.print_exc()
+        finally:
+            entry.refreshing = False
+
+
+container_details_cache = ContainerDetailsCache()
+
+
+def get_container_details(container_url):
+    parts = urlparse(container_url)
+    if parts.scheme == 'file' and settings.AZURE_TRANSFER_EXECUTOR == TRANSFER_EXECUTOR_LOCAL:
+        return get_local_util().get_local_container_details(parts.path)
+    return container_details_cache.get(container_url)
 
 
 def get_container_owner(container_url):
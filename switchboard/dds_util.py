@@ -1,10 +1,32 @@
 from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.core.cache import cache, caches
+from django.core.mail import get_connection
+import re
 import socket
+import threading
+import time
+import jwt
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from ddsc.core.remotestore import RemoteStore
-from d4s2_api.models import EmailTemplate, DDSDelivery, ShareRole, Share, UserEmailTemplateSet, StorageTypes
+from ddsc.core.ddsapi import DataServiceApi, DataServiceAuth
+from d4s2_api.models import EmailTemplate, DDSDelivery, ShareRole, Share, UserEmailTemplateSet, StorageTypes, \
+    DDSProjectTransferRecord, DDSProjectTransferSyncState, DDSTransferStates, DDSDeliveryError, State, \
+    DDSObjectManifest, ObjectManifestWriter
+from background_task import background
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from gcb_web_auth.backends.dukeds import make_auth_config
 from gcb_web_auth.utils import get_dds_token, get_dds_config_for_credentials, get_default_dds_endpoint
-from gcb_web_auth.models import DDSUserCredential
+from gcb_web_auth.models import DDSUserCredential, DukeDSAPIToken
 from ddsc.core.ddsapi import DataServiceError
 from d4s2_api.utils import MessageFactory, MessageDirection
 
@@ -13,6 +35,11 @@ SHARE_IN_RESPONSE_TO_DELIVERY_MSG = 'Shared in response to project delivery.'
 DDS_SERVICE_NAME = 'Duke Data Service'
 PROJECT_ADMIN_ID = 'project_admin'
 DDS_PERMISSIONS_ID_SEP = '_'
+DDS_MAX_POOL_CONNECTIONS = 50
+# Fields of project children not needed to summarize a project, leaving them out keeps each page small
+PROJECT_CHILDREN_EXCLUDE_FIELDS = ['audit', 'ancestors', 'project']
+# The manifest needs ancestors to build the path of each file
+PROJECT_MANIFEST_EXCLUDE_FIELDS = ['audit', 'project']
 
 
 def create_email_from_username(username):
@@ -23,6 +50,451 @@ def create_email_from_username(username):
     return None
 
 
+def get_token_expiration(token_key):
+    """
+    Return when a DukeDS api token expires based on its JWT exp claim.
+    :param token_key: str: DukeDS api token
+    :return: float: expiration as seconds since the epoch or None if unknown
+    """
+    try:
+        return jwt.decode(token_key, verify=False).get('exp')
+    except jwt.InvalidTokenError:
+        return None
+
+
+class DDSUnavailable(Exception):
+    """
+    Raised instead of contacting DukeDS while the circuit breaker is open.
+    Not a requests exception so ddsclient does not retry it.
+    """
+    pass
+
+
+# Path segments of DukeDS urls that identify a resource, replaced with {id} to name endpoints
+DDS_ID_SEGMENT_RE = re.compile(r'^([0-9a-fA-F-]{32,36}|\d+)$')
+
+
+def get_dds_endpoint_name(method, url):
+    """
+    Name a DukeDS request by its method and path with the api prefix removed and ids replaced by {id}.
+    :param method: str: http method
+    :param url: str: url of the request
+    :return: str: endpoint name, e.g. 'GET /projects/{id}/children'
+    """
+    segments = urlparse(url).path.strip('/').split('/')
+    if segments[:1] == ['api'] and len(segments) > 1:
+        segments = segments[2:]
+    segments = ['{id}' if DDS_ID_SEGMENT_RE.match(segment) else segment for segment in segments]
+    return '{} /{}'.format(method.upper(), '/'.join(segments))
+
+
+def get_dds_latency_budget(endpoint):
+    """
+    :param endpoint: str: endpoint name from get_dds_endpoint_name
+    :return: float: seconds a request to endpoint may take
+    """
+    return settings.DDS_ENDPOINT_LATENCY_BUDGETS.get(endpoint, settings.DDS_LATENCY_BUDGET_SECONDS)
+
+
+class DDSEndpointMetrics(object):
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'slow_calls': self.slow_calls,
+            'rejected': self.rejected,
+            'average_seconds': self.total_seconds / self.calls if self.calls else 0.0,
+            'max_seconds': self.max_seconds,
+        }
+
+
+class DDSCircuitBreaker(object):
+    """
+    Process-wide circuit breaker shared by all requests to DukeDS.
+    After DDS_CIRCUIT_FAILURE_THRESHOLD failures in a row the circuit opens and requests raise DDSUnavailable
+    without contacting DukeDS. After DDS_CIRCUIT_RESET_SECONDS a single probe request is let through,
+    the circuit closes if it succeeds and opens again if it fails. A failure is an exception, a 5xx response
+    or a response that took longer than the endpoint's latency budget.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, clock=time.monotonic):
+        self.lock = threading.Lock()
+        self.clock = clock
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.open_count = 0
+        self.probing = False
+        self.endpoint_metrics = {}
+
+    def call(self, endpoint, latency_budget, func, *args, **kwargs):
+        """
+        Call func unless the circuit is open, recording whether it succeeded.
+        :param endpoint: str: name of the DukeDS endpoint being called
+        :param latency_budget: float: seconds the call may take before it counts as a failure
+        :param func: func(*args, **kwargs): makes the request, returns a requests.Response
+        :raises DDSUnavailable: when the circuit is open
+        """
+        is_probe = self._before_call(endpoint)
+        start = self.clock()
+        try:
+            response = func(*args, **kwargs)
+        except Exception:
+            self._after_call(endpoint, is_probe, self.clock() - start, failed=True, slow=False)
+            raise
+        elapsed = self.clock() - start
+        slow = elapsed > latency_budget
+        self._after_call(endpoint, is_probe, elapsed, failed=response.status_code >= 500 or slow, slow=slow)
+        return response
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_count': self.open_count,
+                'endpoints': {endpoint: metrics.as_dict() for endpoint, metrics in self.endpoint_metrics.items()},
+            }
+
+    def reset(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.open_count = 0
+            self.probing = False
+            self.endpoint_metrics = {}
+
+    def _before_call(self, endpoint):
+        """
+        :return: bool: True when this call is the probe of a half-open circuit
+        :raises DDSUnavailable: when the circuit is open
+        """
+        with self.lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= settings.DDS_CIRCUIT_RESET_SECONDS:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            if self.state != self.CLOSED:
+                self._get_endpoint_metrics(endpoint).rejected += 1
+                raise DDSUnavailable('Duke Data Service is not responding, try again later.')
+            return False
+
+    def _after_call(self, endpoint, is_probe, elapsed, failed, slow):
+        with self.lock:
+            metrics = self._get_endpoint_metrics(endpoint)
+            metrics.calls += 1
+            metrics.total_seconds += elapsed
+            metrics.max_seconds = max(metrics.max_seconds, elapsed)
+            if slow:
+                metrics.slow_calls += 1
+            if failed:
+                metrics.failures += 1
+            if is_probe:
+                self.probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self.consecutive_failures = 0
+            elif self.state == self.CLOSED:
+                # Calls that started before the circuit opened do not change its state
+                if failed:
+                    self.consecutive_failures += 1
+                    if self.consecutive_failures >= settings.DDS_CIRCUIT_FAILURE_THRESHOLD:
+                        self._open()
+                else:
+                    self.consecutive_failures = 0
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self.open_count += 1
+
+    def _get_endpoint_metrics(self, endpoint):
+        return self.endpoint_metrics.setdefault(endpoint, DDSEndpointMetrics())
+
+
+dds_circuit_breaker = DDSCircuitBreaker()
+
+
+class DDSCircuitBreakerSession(requests.Session):
+    """
+    Session that sends each DukeDS request through dds_circuit_breaker with a timeout of the endpoint's
+    latency budget.
+    """
+    def request(self, method, url, **kwargs):
+        endpoint = get_dds_endpoint_name(method, url)
+        latency_budget = get_dds_latency_budget(endpoint)
+        kwargs.setdefault('timeout', latency_budget)
+        return dds_circuit_breaker.call(endpoint, latency_budget,
+                                        super(DDSCircuitBreakerSession, self).request, method, url, **kwargs)
+
+
+class RemoteStoreCacheEntry(object):
+    def __init__(self, remote_store, expires_at):
+        self.remote_store = remote_store
+        self.expires_at = expires_at
+
+
+class RemoteStoreCache(object):
+    """
+    Process-wide, size limited cache of authenticated DukeDS RemoteStores keyed by django user id.
+    Entries for OAuth users expire shortly before their DukeDS api token does. Entries for users with a
+    DDSUserCredential are refreshed by ddsclient so they are only limited by DDS_CLIENT_CACHE_SECONDS.
+    All RemoteStores share one pooled requests session that does not store cookies and sends requests through
+    the DukeDS circuit breaker.
+    """
+    def __init__(self, clock=time.time):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.key_locks = {}
+        self.session = None
+        self.clock = clock
+
+    def get(self, user):
+        """
+        Return an authenticated RemoteStore for user, creating one if there is no current cache entry.
+        :param user: User: django user
+        :return: RemoteStore
+        """
+        remote_store = self._get_current(user.id)
+        if remote_store:
+            return remote_store
+        with self._get_key_lock(user.id):
+            # Another thread may have created the RemoteStore while we waited
+            remote_store = self._get_current(user.id)
+            if remote_store:
+                return remote_store
+            remote_store, expires_at = self._create_remote_store(user)
+            self._add(user.id, RemoteStoreCacheEntry(remote_store, expires_at))
+            return remote_store
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.key_locks = {}
+
+    def _get_current(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry and self.clock() < entry.expires_at:
+                self.entries.move_to_end(user_id)
+                return entry.remote_store
+            return None
+
+    def _add(self, user_id, entry):
+        with self.lock:
+            self.entries[user_id] = entry
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.DDS_CLIENT_CACHE_SIZE:
+                evicted_user_id, _ = self.entries.popitem(last=False)
+                self.key_locks.pop(evicted_user_id, None)
+
+    def _get_key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _get_session(self):
+        with self.lock:
+            if self.session is None:
+                self.session = DDSCircuitBreakerSession()
+                # The session is shared by all users so never send cookies set by one user's responses
+                self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                self.session.mount('https://', HTTPAdapter(pool_maxsize=DDS_MAX_POOL_CONNECTIONS))
+                self.session.mount('http://', HTTPAdapter(pool_maxsize=DDS_MAX_POOL_CONNECTIONS))
+            return self.session
+
+    def _create_remote_store(self, user):
+        """
+        :return: (RemoteStore, float): RemoteStore for user and when it should no longer be used
+        """
+        expires_at = self.clock() + settings.DDS_CLIENT_CACHE_SECONDS
+        # First need to resolve DukeDS Credential.
+        # For simplicity and development ease, we first check if a DDSUserCredential exists for the requesting user
+        try:
+            dds_credential = DDSUserCredential.objects.get(user=user)
+            config = get_dds_config_for_credentials(dds_credential)
+        except DDSUserCredential.DoesNotExist:
+            # No DDSUserCredential configured for this user, fall back to OAuth
+            # May raise an OAuthConfigurationException
+            dds_token = get_dds_token(user)
+            config = make_auth_config(dds_token.key)
+            token_expiration = get_token_expiration(dds_token.key)
+            if token_expiration:
+                expires_at = min(expires_at, token_expiration - settings.DDS_TOKEN_EXPIRATION_MARGIN_SECONDS)
+        data_service = DataServiceApi(DataServiceAuth(config), config.url, http=self._get_session())
+        return RemoteStore(config, data_service=data_service), expires_at
+
+
+remote_store_cache = RemoteStoreCache()
+
+
+@receiver(post_save, sender=DDSUserCredential)
+@receiver(post_delete, sender=DDSUserCredential)
+@receiver(post_save, sender=DukeDSAPIToken)
+@receiver(post_delete, sender=DukeDSAPIToken)
+def invalidate_cached_remote_store(sender, instance, **kwargs):
+    remote_store_cache.invalidate(instance.user_id)
+
+
+class CachedErrorResponse(object):
+    """
+    Stands in for the requests.Response of a cached DataServiceError so the error can be raised again.
+    """
+    def __init__(self, status_code, response_json):
+        self.status_code = status_code
+        self.response_json = response_json
+
+    def json(self):
+        return self.response_json
+
+
+class DDSUserCacheEntry(object):
+    def __init__(self, user_dict, error, expires_at):
+        """
+        :param user_dict: dict: DukeDS user details or None when the user was not found
+        :param error: (dict, str): response and url suffix of the not found error
+        :param expires_at: float: time after which the entry is no longer used
+        """
+        self.user_dict = user_dict
+        self.error = error
+        self.expires_at = expires_at
+
+    def get_user_dict(self):
+        if self.error:
+            response_json, url_suffix = self.error
+            raise DataServiceError(CachedErrorResponse(404, response_json), url_suffix, None)
+        return self.user_dict
+
+
+class DDSUserCache(object):
+    """
+    Process-wide, size limited cache of DukeDS user details keyed by DukeDS user id.
+    Users that are not found are cached for a shorter time and raise the same DataServiceError again.
+    Concurrent lookups of the same user share a single request. When DDS_USER_CACHE_BACKEND names one of the
+    django CACHES the details are also shared with other processes through that cache.
+    Expired details are used while the DukeDS circuit breaker is open.
+    """
+    def __init__(self, clock=time.time):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.key_locks = {}
+        self.clock = clock
+
+    def get(self, dds_user_id, fetch_user_dict):
+        """
+        Return details for a DukeDS user, calling fetch_user_dict if they are not cached.
+        :param dds_user_id: str: DukeDS user id
+        :param fetch_user_dict: func(): returns the DukeDS user details dict
+        :return: dict: DukeDS user details
+        :raises DataServiceError: when the user could not be fetched
+        :raises DDSUnavailable: when DukeDS is unavailable and the user was never fetched
+        """
+        entry = self._get_current(dds_user_id)
+        if not entry:
+            with self._get_key_lock(dds_user_id):
+                # Another thread may have fetched the user while we waited
+                entry = self._get_current(dds_user_id) or self._fetch(dds_user_id, fetch_user_dict)
+        return entry.get_user_dict()
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.key_locks = {}
+
+    def _get_current(self, dds_user_id):
+        with self.lock:
+            entry = self.entries.get(dds_user_id)
+            if entry and self.clock() < entry.expires_at:
+                self.entries.move_to_end(dds_user_id)
+                return entry
+        shared_cache = self._get_shared_cache()
+        if shared_cache:
+            shared_value = shared_cache.get(self._make_shared_key(dds_user_id))
+            if shared_value:
+                user_dict, error = shared_value
+                return self._add(dds_user_id, user_dict, error)
+        return None
+
+    def _fetch(self, dds_user_id, fetch_user_dict):
+        user_dict, error = None, None
+        try:
+            user_dict = fetch_user_dict()
+        except DDSUnavailable:
+            # Use expired details while DukeDS is unavailable
+            stale_entry = self._get_stale(dds_user_id)
+            if stale_entry:
+                return stale_entry
+            raise
+        except DataServiceError as e:
+            if e.status_code != 404:
+                raise
+            error = (e.response, e.url_suffix)
+        entry = self._add(dds_user_id, user_dict, error)
+        shared_cache = self._get_shared_cache()
+        if shared_cache:
+            shared_cache.set(self._make_shared_key(dds_user_id), (user_dict, error),
+                             self._get_cache_seconds(error))
+        return entry
+
+    def _get_stale(self, dds_user_id):
+        with self.lock:
+            entry = self.entries.get(dds_user_id)
+            if entry and entry.user_dict:
+                return entry
+        return None
+
+    def _add(self, dds_user_id, user_dict, error):
+        entry = DDSUserCacheEntry(user_dict, error, self.clock() + self._get_cache_seconds(error))
+        with self.lock:
+            self.entries[dds_user_id] = entry
+            self.entries.move_to_end(dds_user_id)
+            while len(self.entries) > settings.DDS_USER_CACHE_SIZE:
+                evicted_dds_user_id, _ = self.entries.popitem(last=False)
+                self.key_locks.pop(evicted_dds_user_id, None)
+        return entry
+
+    def _get_key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _get_cache_seconds(error):
+        if error:
+            return settings.DDS_USER_NEGATIVE_CACHE_SECONDS
+        return settings.DDS_USER_CACHE_SECONDS
+
+    @staticmethod
+    def _get_shared_cache():
+        if settings.DDS_USER_CACHE_BACKEND:
+            return caches[settings.DDS_USER_CACHE_BACKEND]
+        return None
+
+    @staticmethod
+    def _make_shared_key(dds_user_id):
+        return 'dds-user-{}'.format(dds_user_id)
+
+
+dds_user_cache = DDSUserCache()
+
+
 class DDSUtil(object):
     def __init__(self, user):
         if not user:
@@ -33,19 +505,16 @@ class DDSUtil(object):
     @property
     def remote_store(self):
         if self._remote_store is None:
-            # First need to resolve DukeDS Credential.
-            # For simplicity and development ease, we first check if a DDSUserCredential exists for the requesting user
-            try:
-                dds_credential = DDSUserCredential.objects.get(user=self.user)
-                config = get_dds_config_for_credentials(dds_credential)
-            except DDSUserCredential.DoesNotExist:
-                # No DDSUserCredential configured for this user, fall back to OAuth
-                # May raise an OAuthConfigurationException
-                dds_token = get_dds_token(self.user)
-                config = make_auth_config(dds_token.key)
-            self._remote_store = RemoteStore(config)
+            self._remote_store = remote_store_cache.get(self.user)
         return self._remote_store
 
+    def connect(self):
+        """
+        Look up the user's credentials and connect to DukeDS if not already connected.
+        Call before sharing this DDSUtil between threads so the credentials are only looked up once.
+        """
+        return self.remote_store
+
     def get_remote_user(self, user_id):
         return self.remote_store.fetch_user(user_id)
 
@@ -57,9 +526,19 @@ class DDSUtil(object):
         return self.remote_store.fetch_remote_project(project.name, must_exist=True)
 
     @staticmethod
-    def get_project_url(project_id):
-        endpoint = get_default_dds_endpoint()
-        return '{}/#/project/{}'.format(endpoint.portal_root, project_id)
+    def get_portal_root():
+        return get_default_dds_endpoint().portal_root
+
+    @staticmethod
+    def get_project_url(project_id, portal_root=None):
+        """
+        :param project_id: str: DukeDS project id
+        :param portal_root: str: portal url to use instead of looking up the default endpoint
+        :return: str: url of the project in the DukeDS portal
+        """
+        if portal_root is None:
+            portal_root = DDSUtil.get_portal_root()
+        return '{}/#/project/{}'.format(portal_root, project_id)
 
     def add_user(self, user_id, project_id, auth_role):
         project = self.remote_store.fetch_remote_project_by_id(project_id)
@@ -82,17 +561,38 @@ class DDSUtil(object):
     def get_project_transfers(self):
         return self.remote_store.data_service.get_all_project_transfers()
 
+    @staticmethod
+    def _record_project_transfer(transfer_dict):
+        """
+        Update the local copy of a project transfer DukeDS returned after changing it.
+        Responses without a transfer are left for the next DDSProjectTransferSync to pick up.
+        :param transfer_dict: dict: project_transfer from DukeDS
+        """
+        if isinstance(transfer_dict, dict) and 'id' in transfer_dict:
+            DDSProjectTransferRecord.save_transfer(transfer_dict)
+
     def create_project_transfer(self, project_id, to_user_ids):
-        return self.remote_store.data_service.create_project_transfer(project_id, to_user_ids).json()
+        transfer_dict = self.remote_store.data_service.create_project_transfer(project_id, to_user_ids).json()
+        self._record_project_transfer(transfer_dict)
+        return transfer_dict
 
     def accept_project_transfer(self, transfer_id):
-        return self.remote_store.data_service.accept_project_transfer(transfer_id).json()
+        transfer_dict = self.remote_store.data_service.accept_project_transfer(transfer_id).json()
+        self._record_project_transfer(transfer_dict)
+        return transfer_dict
 
     def decline_project_transfer(self, transfer_id, reason):
-        return self.remote_store.data_service.reject_project_transfer(transfer_id, reason).json()
+        transfer_dict = self.remote_store.data_service.reject_project_transfer(transfer_id, reason).json()
+        self._record_project_transfer(transfer_dict)
+        return transfer_dict
 
     def cancel_project_transfer(self, transfer_id):
-        return self.remote_store.data_service.cancel_project_transfer(transfer_id)
+        response = self.remote_store.data_service.cancel_project_transfer(transfer_id)
+        try:
+            self._record_project_transfer(response.json())
+        except ValueError:
+            pass  # response has no body
+        return response
 
     def share_project_with_user(self, project_id, dds_user_id, auth_role):
         return self.remote_store.data_service.set_user_project_permission(project_id, dds_user_id, auth_role)
@@ -103,15 +603,41 @@ class DDSUtil(object):
     def get_user(self, user_id):
         return self.remote_store.data_service.get_user_by_id(user_id)
 
+    def get_users_page(self, page, page_size, full_name_contains=None, email=None, username=None):
+        data = {}
+        if full_name_contains:
+            data['full_name_contains'] = full_name_contains
+        if email:
+            data['email'] = email
+        if username:
+            data['username'] = username
+        return self._get_single_page('/users', data, page, page_size)
+
     def get_projects(self):
         return self.remote_store.data_service.get_projects()
 
+    def get_projects_page(self, page, page_size):
+        return self._get_single_page('/projects', {}, page, page_size)
+
     def get_project(self, project_id):
         return self.remote_store.data_service.get_project_by_id(project_id)
 
     def get_project_children(self, project_id):
         return self.remote_store.data_service.get_project_children(project_id, '')
 
+    def get_project_children_page(self, project_id, page, page_size,
+                                  exclude_response_fields=PROJECT_CHILDREN_EXCLUDE_FIELDS):
+        # An empty name_contains returns every file and folder in the project instead of only the top level
+        data = {'name_contains': '', 'exclude_response_fields': ' '.join(exclude_response_fields)}
+        url_suffix = '/projects/{}/children'.format(project_id)
+        return self._get_single_page(url_suffix, data, page, page_size)
+
+    def _get_single_page(self, url_suffix, data, page, page_size):
+        # DataServiceApi has no public method to fetch one page. Its private _get_single_page is used so
+        # requests keep DukeDSClient's auth headers, error handling and retries. DukeDSClient is pinned to an
+        # exact version in requirements.txt and tests_ddsutil checks this call against the installed version.
+        return self.remote_store.data_service._get_single_page(url_suffix, data, page, page_size)
+
     def get_current_user(self):
         return self.remote_store.get_current_user()
 
@@ -153,6 +679,84 @@ class DDSBase(object):
         return [cls(p) for p in project_dicts]
 
 
+class DDSResultsIterator(object):
+    """
+    Iterates the results of a paged DukeDS collection, fetching each page only when it is reached.
+    Each item is returned with the position of the item after it so iteration can be resumed later.
+    """
+    def __init__(self, fetch_page, make_item, page_size, page=1, offset=0):
+        """
+        :param fetch_page: func(page, page_size): returns the requests.Response for one page of the collection
+        :param make_item: func(dict): converts a result from DukeDS into the item to return
+        :param page_size: int: number of results to request per page
+        :param page: int: page to start on
+        :param offset: int: index of the first result to return from page
+        """
+        self.fetch_page = fetch_page
+        self.make_item = make_item
+        self.page_size = page_size
+        self.page = page
+        self.offset = offset
+        self.total = None
+
+    def __iter__(self):
+        """
+        :return: generator of (item, (page, offset)), position is None after the last item of the collection
+        """
+        page, offset = self.page, self.offset
+        while True:
+            response = self.fetch_page(page, self.page_size)
+            results = response.json()['results']
+            if self.total is None:
+                self.total = int(response.headers.get('x-total', len(results)))
+            last_page = page >= int(response.headers.get('x-total-pages') or 1)
+            for idx in range(offset, len(results)):
+                if idx + 1 < len(results):
+                    position = (page, idx + 1)
+                else:
+                    position = None if last_page else (page + 1, 0)
+                yield self.make_item(results[idx]), position
+            if last_page or not results:
+                return
+            page, offset = page + 1, 0
+
+
+class DDSListFilter(object):
+    """
+    Filters DukeDS list results by fields DukeDS itself cannot filter on.
+    """
+    def __init__(self, name_prefix=None, created_after=None, created_before=None):
+        """
+        :param name_prefix: str: case insensitive start of the name
+        :param created_after: datetime: earliest creation time to include
+        :param created_before: datetime: creation time to include results up to (exclusive)
+        """
+        self.name_prefix = name_prefix
+        self.created_after = created_after
+        self.created_before = created_before
+
+    def is_empty(self):
+        return not (self.name_prefix or self.created_after or self.created_before)
+
+    def matches(self, name, created_on=None):
+        """
+        :param name: str: name of the result
+        :param created_on: str: ISO 8601 creation time from the DukeDS audit
+        :return: bool: True when the result passes the filter
+        """
+        if self.name_prefix and not (name or '').lower().startswith(self.name_prefix.lower()):
+            return False
+        if self.created_after or self.created_before:
+            created = parse_datetime(created_on or '')
+            if created is None:
+                return False
+            if self.created_after and created < self.created_after:
+                return False
+            if self.created_before and created >= self.created_before:
+                return False
+        return True
+
+
 class DDSUser(DDSBase):
     """
     A simple object to represent a DDSUser
@@ -173,10 +777,46 @@ class DDSUser(DDSBase):
         response = dds_util.get_users(full_name_contains, email, username).json()
         return DDSUser.from_list(response['results'])
 
+    @staticmethod
+    def iter_list(dds_util, full_name_contains, email, username, page_size, page=1, offset=0):
+        """
+        Iterate DDSUsers one DukeDS page at a time.
+        :return: DDSResultsIterator
+        """
+        def fetch_page(page_num, per_page):
+            return dds_util.get_users_page(page_num, per_page, full_name_contains, email, username)
+        return DDSResultsIterator(fetch_page, DDSUser, page_size, page, offset)
+
     @staticmethod
     def fetch_one(dds_util, dds_user_id):
-        response = dds_util.get_user(dds_user_id).json()
-        return DDSUser(response)
+        user_dict = dds_user_cache.get(dds_user_id, lambda: dds_util.get_user(dds_user_id).json())
+        return DDSUser(user_dict)
+
+    @staticmethod
+    def fetch_many(dds_util, dds_user_ids, max_workers):
+        """
+        Fetch the details of several users concurrently. Users whose details cannot be fetched are
+        left out unless every lookup fails.
+        :param dds_util: DDSUtil: connection to DukeDS
+        :param dds_user_ids: [str]: DukeDS user UUIDs
+        :param max_workers: int: number of users to fetch at once
+        :return: [DDSUser]: users in the order of dds_user_ids
+        """
+        if not dds_user_ids:
+            return []
+        dds_util.connect()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(DDSUser.fetch_one, dds_util, dds_user_id) for dds_user_id in dds_user_ids]
+        users = []
+        errors = []
+        for future in futures:
+            try:
+                users.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        if errors and not users:
+            raise errors[0]
+        return users
 
     @staticmethod
     def get_or_register_user(dds_util, auth_provider_id, username):
@@ -193,7 +833,7 @@ class DDSProject(DDSBase):
     A simple object to represent a DDSProject
     """
 
-    def __init__(self, project_dict):
+    def __init__(self, project_dict, portal_root=None):
         self.id = project_dict.get('id')
         self.name = project_dict.get('name')
         self.description = project_dict.get('description')
@@ -201,7 +841,7 @@ class DDSProject(DDSBase):
         self.created_on = project_dict.get('audit', {}).get('created_on')
         self.last_updated_on = project_dict.get('audit', {}).get('last_updated_on')
         # URL is useful for all DDSProject instances not provided by DDS API
-        self.url = DDSUtil.get_project_url(self.id)
+        self.url = DDSUtil.get_project_url(self.id, portal_root)
 
     @staticmethod
     def fetch_list(dds_util):
@@ -211,7 +851,24 @@ class DDSProject(DDSBase):
         :return: [DDSProjects]
         """
         response = dds_util.get_projects().json()
-        return DDSProject.from_list(response['results'])
+        portal_root = DDSUtil.get_portal_root()
+        return [DDSProject(project_dict, portal_root) for project_dict in response['results']]
+
+    @staticmethod
+    def iter_list(dds_util, page_size, page=1, offset=0):
+        """
+        Iterate DDSProjects one DukeDS page at a time.
+        :param dds_util: DDSUtil
+        :param page_size: int: number of projects to fetch per request
+        :param page: int: DukeDS page to start on
+        :param offset: int: index of the first project to return from page
+        :return: DDSResultsIterator
+        """
+        portal_root = DDSUtil.get_portal_root()
+
+        def make_project(project_dict):
+            return DDSProject(project_dict, portal_root)
+        return DDSResultsIterator(dds_util.get_projects_page, make_project, page_size, page, offset)
 
     @staticmethod
     def fetch_one(dds_util, dds_project_id):
@@ -220,42 +877,201 @@ class DDSProject(DDSBase):
 
 
 class DDSProjectSummary(DDSProject):
-
+    """
+    A DDSProject with counts of the files and folders it contains.
+    """
     def __init__(self, project_dict):
         super(DDSProjectSummary, self).__init__(project_dict)
-        self.children = project_dict.get('children', [])
+        self.counts = {
+            'total_size': 0,
+            'file_count': 0,
+            'folder_count': 0,
+            'root_folder_count': 0,
+        }
+        for child in project_dict.get('children', []):
+            self.apply_child(child)
 
     @staticmethod
     def fetch_one(dds_util, dds_project_id):
+        """
+        Fetch a project and summarize its contents. The children of the project are counted a page at a time
+        and the counts are cached until the project is updated.
+        :param dds_util: DDSUtil
+        :param dds_project_id: str: DukeDS uuid of the project
+        :return: DDSProjectSummary
+        """
         project_dict = dds_util.get_project(dds_project_id).json()
-        children = dds_util.get_project_children(dds_project_id).json()
-        project_dict['children'] = children['results']
-        return DDSProjectSummary(project_dict)
-
-    def _get_children_of_kind(self, kind):
-        return [child for child in self.children if child['kind'] == kind]
-
-    def _get_files(self):
-        return self._get_children_of_kind('dds-file')
-
-    def _get_folders(self):
-        return self._get_children_of_kind('dds-folder')
+        project_summary = DDSProjectSummary(project_dict)
+        cache_key = get_project_summary_cache_key(project_summary)
+        summary_cache = get_project_summary_cache()
+        counts = summary_cache.get(cache_key)
+        if counts is None:
+            children = DDSResultsIterator(
+                lambda page, page_size: dds_util.get_project_children_page(dds_project_id, page, page_size),
+                lambda child: child, settings.DDS_PROJECT_CHILDREN_PAGE_SIZE)
+            for child, _ in children:
+                project_summary.apply_child(child)
+            summary_cache.set(cache_key, project_summary.counts, settings.DDS_PROJECT_SUMMARY_CACHE_SECONDS)
+        else:
+            project_summary.counts = counts
+        return project_summary
 
-    def _get_root_folders(self):
-        return [folder for folder in self._get_folders() if folder['parent']['kind'] == 'dds-project']
+    def apply_child(self, child):
+        """
+        Add a file or folder of the project to the counts.
+        :param child: dict: file or folder from the project's children
+        """
+        if child['kind'] == 'dds-file':
+            self.counts['total_size'] += child['current_version']['upload']['size']
+            self.counts['file_count'] += 1
+        elif child['kind'] == 'dds-folder':
+            self.counts['folder_count'] += 1
+            if child['parent']['kind'] == 'dds-project':
+                self.counts['root_folder_count'] += 1
 
     def total_size(self):
-        sizes = [file['current_version']['upload']['size'] for file in self._get_files()]
-        return sum(sizes)
+        return self.counts['total_size']
 
     def file_count(self):
-        return len(self._get_files())
+        return self.counts['file_count']
 
     def folder_count(self):
-        return len(self._get_folders())
+        return self.counts['folder_count']
 
     def root_folder_count(self):
-        return len(self._get_root_folders())
+        return self.counts['root_folder_count']
+
+
+def get_project_summary_cache_key(project):
+    # The last update time is part of the key so a cached summary is not used after the project changes
+    return 'dds-project-summary:{}:{}'.format(project.id, project.last_updated_on)
+
+
+def get_project_summary_cache():
+    if settings.DDS_PROJECT_SUMMARY_CACHE_BACKEND:
+        return caches[settings.DDS_PROJECT_SUMMARY_CACHE_BACKEND]
+    return cache
+
+
+class DDSProjectSummaryFunctions(object):
+    @staticmethod
+    def should_precompute():
+        """
+        Summaries computed by the background task worker are only visible to web processes through a shared cache.
+        :return: bool: True when project summaries should be computed in the background
+        """
+        return bool(settings.DDS_PROJECT_SUMMARY_PRECOMPUTE and settings.DDS_PROJECT_SUMMARY_CACHE_BACKEND)
+
+    @staticmethod
+    @background
+    def cache_project_summary(user_id, dds_project_id):
+        """
+        Summarize a project ahead of time so the summary is already cached when the recipient views the delivery.
+        :param user_id: int: id of the django user with access to the project
+        :param dds_project_id: str: DukeDS uuid of the project
+        """
+        if DDSProjectSummaryFunctions.should_precompute():
+            DDSProjectSummary.fetch_one(DDSUtil(User.objects.get(pk=user_id)), dds_project_id)
+
+
+class DDSProjectManifest(object):
+    """
+    Lists the files of a DukeDS project as manifest entries. The first page of the project's children is
+    fetched to find the number of pages, the remaining pages are then fetched max_workers at a time.
+    Entries are returned in page order.
+    """
+    def __init__(self, dds_util, project_id, page_size, max_workers):
+        """
+        :param dds_util: DDSUtil
+        :param project_id: str: DukeDS uuid of the project
+        :param page_size: int: number of files and folders to request per page
+        :param max_workers: int: number of pages to fetch at once
+        """
+        self.dds_util = dds_util
+        self.project_id = project_id
+        self.page_size = page_size
+        self.max_workers = max_workers
+
+    def __iter__(self):
+        response = self.fetch_page(1)
+        for entry in self.make_entries(response):
+            yield entry
+        total_pages = int(response.headers.get('x-total-pages') or 1)
+        if total_pages < 2:
+            return
+        self.dds_util.connect()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for first_page in range(2, total_pages + 1, self.max_workers):
+                pages = range(first_page, min(first_page + self.max_workers, total_pages + 1))
+                for response in executor.map(self.fetch_page, pages):
+                    for entry in self.make_entries(response):
+                        yield entry
+
+    def fetch_page(self, page):
+        return self.dds_util.get_project_children_page(self.project_id, page, self.page_size,
+                                                       exclude_response_fields=PROJECT_MANIFEST_EXCLUDE_FIELDS)
+
+    @staticmethod
+    def make_entries(response):
+        return [DDSProjectManifest.make_entry(child) for child in response.json()['results']
+                if child['kind'] == 'dds-file']
+
+    @staticmethod
+    def make_entry(file_dict):
+        """
+        :param file_dict: dict: file from the project's children
+        :return: dict: manifest entry for the file
+        """
+        folder_names = [ancestor['name'] for ancestor in file_dict.get('ancestors', [])
+                        if ancestor['kind'] == 'dds-folder']
+        current_version = file_dict['current_version']
+        upload = current_version['upload']
+        return {
+            'id': file_dict['id'],
+            'path': '/'.join(folder_names + [file_dict['name']]),
+            'size': upload['size'],
+            'version': current_version.get('version'),
+            'hashes': {hash_dict['algorithm']: hash_dict['value'] for hash_dict in upload.get('hashes', [])},
+        }
+
+
+def record_object_manifest(delivery, dds_util):
+    """
+    Save a manifest of the files in the delivery's project. Nothing is saved when fetching the files fails.
+    :param delivery: DDSDelivery: delivery to record the manifest for
+    :param dds_util: DDSUtil: connection to DukeDS for a user who can read the project
+    """
+    project_manifest = DDSProjectManifest(dds_util, delivery.project_id, settings.DDS_PROJECT_CHILDREN_PAGE_SIZE,
+                                          settings.DDS_MANIFEST_WORKERS)
+    manifest = DDSObjectManifest.objects.create(chunked=True)
+    try:
+        # Chunks are written as DukeDS is paged so no transaction is held open across network requests
+        manifest_writer = ObjectManifestWriter(manifest)
+        manifest_writer.write_all(project_manifest)
+        with transaction.atomic():
+            manifest_writer.close()
+            delivery.manifest = manifest
+            # Only save the manifest since the delivery may be accepted while the manifest is recorded
+            delivery.save(update_fields=['manifest'])
+    except Exception:
+        # Deleting the partial manifest also deletes its chunks
+        manifest.delete()
+        raise
+
+
+class DDSManifestFunctions(object):
+    @staticmethod
+    @background
+    def record_object_manifest(delivery_id, user_id):
+        """
+        Record the files in a DukeDS delivery's project. Queued before the delivery email is sent, the files may
+        still change between sending and the task running if the task queue is backed up.
+        :param delivery_id: int: id of the DDSDelivery
+        :param user_id: int: id of the django user who sent the delivery
+        """
+        delivery = DDSDelivery.objects.get(pk=delivery_id)
+        if not delivery.manifest:
+            record_object_manifest(delivery, DDSUtil(User.objects.get(pk=user_id)))
 
 
 class DDSProjectPermissions(DDSBase):
@@ -292,14 +1108,22 @@ class DDSProjectPermissions(DDSBase):
 
 class DDSProjectTransfer(DDSBase):
 
-    def __init__(self, transfer_dict):
+    def __init__(self, transfer_dict, deliveries=None, portal_root=None):
+        """
+        :param transfer_dict: dict: project transfer details from DukeDS
+        :param deliveries: dict: local DDSDelivery for each transfer id, looked up when None
+        :param portal_root: str: DukeDS portal url, looked up when None
+        """
         self.id = transfer_dict.get('id')
         self.status = transfer_dict.get('status')
         self.status_comment = transfer_dict.get('status_comment')
         self.to_users = DDSUser.from_list(transfer_dict.get('to_users'))
         self.from_user = DDSUser(transfer_dict.get('from_user'))
         self.project_dict = transfer_dict.get('project')
-        delivery_obj = DDSProjectTransfer._lookup_delivery(self.id)
+        if deliveries is None:
+            delivery_obj = DDSProjectTransfer._lookup_delivery(self.id)
+        else:
+            delivery_obj = deliveries.get(self.id)
         self.delivery = None
         if delivery_obj:
             self.delivery = delivery_obj.id
@@ -307,7 +1131,7 @@ class DDSProjectTransfer(DDSBase):
             # This is to keep consistent names for deliveries even if the recipient renames the project.
             if delivery_obj.project_name:
                 self.project_dict['name'] = delivery_obj.project_name
-        self.project = DDSProject(self.project_dict)
+        self.project = DDSProject(self.project_dict, portal_root)
         audit = transfer_dict['audit']
         self.created_on = audit['created_on']
         self.last_updated_on = audit['last_updated_on']
@@ -317,30 +1141,140 @@ class DDSProjectTransfer(DDSBase):
         delivery = DDSDelivery.objects.filter(transfer_id=transfer_id).first()
         return delivery
 
+    @staticmethod
+    def _lookup_deliveries(transfer_ids):
+        """
+        :param transfer_ids: [str]: DukeDS project transfer ids
+        :return: dict: DDSDelivery for each transfer id that has one
+        """
+        deliveries = DDSDelivery.objects.filter(transfer_id__in=transfer_ids)
+        return {delivery.transfer_id: delivery for delivery in deliveries}
+
     @staticmethod
     def fetch_list(dds_util):
         response = dds_util.get_project_transfers().json()
-        return DDSProjectTransfer.from_list(response['results'])
+        transfer_dicts = response['results']
+        transfer_ids = [transfer_dict.get('id') for transfer_dict in transfer_dicts]
+        deliveries = DDSProjectTransfer._lookup_deliveries(transfer_ids)
+        portal_root = DDSUtil.get_portal_root()
+        return [DDSProjectTransfer(transfer_dict, deliveries, portal_root) for transfer_dict in transfer_dicts]
 
     @staticmethod
     def fetch_one(dds_util, dds_project_transfer_id):
         response = dds_util.get_project_transfer(dds_project_transfer_id).json()
         return DDSProjectTransfer(response)
 
+    @staticmethod
+    def from_records(records):
+        """
+        Create DDSProjectTransfers from local copies of DukeDS project_transfers.
+        :param records: [DDSProjectTransferRecord]
+        :return: [DDSProjectTransfer]
+        """
+        deliveries = DDSProjectTransfer._lookup_deliveries([record.transfer_id for record in records])
+        portal_root = DDSUtil.get_portal_root() if records else None
+        return [DDSProjectTransfer(record.content, deliveries, portal_root) for record in records]
+
+
+class DDSProjectTransferSync(object):
+    """
+    Copies the DukeDS project_transfers of a user into DDSProjectTransferRecord.
+    DukeDS cannot filter project_transfers by modification time, so every transfer is fetched
+    but only new or changed transfers are written.
+    """
+    def __init__(self, user, dds_util=None):
+        """
+        :param user: User: django user whose transfers are copied
+        :param dds_util: DDSUtil: connection to DukeDS for user
+        """
+        self.user = user
+        self.dds_util = dds_util or DDSUtil(user)
+
+    def sync(self):
+        """
+        :return: DDSProjectTransferSyncState: updated sync state for the user
+        """
+        started = timezone.now()
+        dds_user_id = self.dds_util.get_current_user().id
+        transfer_dicts = self.dds_util.get_project_transfers().json()['results']
+        transfer_ids = [transfer_dict['id'] for transfer_dict in transfer_dicts]
+        with transaction.atomic():
+            existing_content = dict(DDSProjectTransferRecord.objects.filter(transfer_id__in=transfer_ids)
+                                    .values_list('transfer_id', 'content'))
+            for transfer_dict in transfer_dicts:
+                if existing_content.get(transfer_dict['id']) != transfer_dict:
+                    DDSProjectTransferRecord.save_transfer(transfer_dict)
+            # Transfers DukeDS no longer returns for this user
+            DDSProjectTransferRecord.for_dds_user(dds_user_id).exclude(transfer_id__in=transfer_ids) \
+                .exclude(synced_at__gte=started).delete()
+            sync_state, _ = DDSProjectTransferSyncState.objects.update_or_create(
+                user=self.user, defaults={'dds_user_id': dds_user_id, 'synced_at': started})
+        return sync_state
+
+    @staticmethod
+    def get_sync_state(user, dds_util):
+        """
+        Return the sync state for user. The first time a user's transfers are requested they are synced
+        immediately, afterwards stale transfers are synced in the background.
+        :param user: User: django user whose transfers are being listed
+        :param dds_util: DDSUtil: connection to DukeDS for user
+        :return: DDSProjectTransferSyncState
+        """
+        sync_state = DDSProjectTransferSyncState.objects.filter(user=user).first()
+        if not sync_state or sync_state.synced_at is None:
+            return DDSProjectTransferSync(user, dds_util).sync()
+        if sync_state.is_stale(settings.DDS_TRANSFER_SYNC_SECONDS) and \
+                not sync_state.is_sync_queued(settings.DDS_TRANSFER_SYNC_QUEUED_SECONDS):
+            sync_state.queued_at = timezone.now()
+            sync_state.save()
+            DDSProjectTransferSyncFunctions.sync_project_transfers(user.id)
+        return sync_state
+
+
+class DDSProjectTransferSyncFunctions(object):
+    @staticmethod
+    @background
+    def sync_project_transfers(user_id):
+        """
+        Copy the DukeDS project_transfers of a user into DDSProjectTransferRecord.
+        When the sync fails it is no longer marked as queued so the next listing of transfers queues another.
+        :param user_id: int: id of the django user
+        """
+        try:
+            DDSProjectTransferSync(User.objects.get(pk=user_id)).sync()
+        except Exception as e:
+            DDSProjectTransferSyncState.objects.filter(user_id=user_id).update(queued_at=None)
+            print("Syncing DukeDS project transfers for user {} failed.".format(user_id))
+            print(str(e))
+
 
 class DeliveryDetails(object):
-    def __init__(self, delivery_or_share, user):
+    def __init__(self, delivery_or_share, user, project=None):
+        """
+        :param delivery_or_share: DDSDelivery/Share: item messages are about
+        :param user: User: user with a DukeDS authentication credential
+        :param project: DDSProject: details of the project when they have already been fetched
+        """
         self.storage = StorageTypes.DDS
         self.delivery = delivery_or_share
         self.ddsutil = DDSUtil(user)
         self.email_template_set = delivery_or_share.email_template_set
         self.user = user
+        # Details fetched from DukeDS are kept so every message built for this delivery fetches them once
+        self._from_user = None
+        self._to_user = None
+        self._project = project
+        self._context = None
 
     def get_from_user(self):
-        return DDSUser.fetch_one(self.ddsutil, self.delivery.from_user_id)
+        if self._from_user is None:
+            self._from_user = DDSUser.fetch_one(self.ddsutil, self.delivery.from_user_id)
+        return self._from_user
 
     def get_to_user(self):
-        return DDSUser.fetch_one(self.ddsutil, self.delivery.to_user_id)
+        if self._to_user is None:
+            self._to_user = DDSUser.fetch_one(self.ddsutil, self.delivery.to_user_id)
+        return self._to_user
 
     def get_transfer_id(self):
         # self.delivery.transfer_id may
@@ -355,6 +1289,11 @@ class DeliveryDetails(object):
             return ''
 
     def get_project(self):
+        if self._project is None:
+            self._project = self._fetch_project()
+        return self._project
+
+    def _fetch_project(self):
         # Fetch a DDSProject, by transfer_id if present
         transfer_id = self.get_transfer_id()
         if transfer_id:
@@ -405,6 +1344,11 @@ class DeliveryDetails(object):
         }
 
     def get_context(self):
+        if self._context is None:
+            self._context = self._make_context()
+        return self._context
+
+    def _make_context(self):
         from_user = self.get_from_user()
         to_user = self.get_to_user()
         project = self.get_project()
@@ -453,10 +1397,25 @@ class DeliveryUtil(object):
     def share_with_additional_users(self):
         """
         Share project with additional users based on delivery share_to_users.
+        Permissions are given concurrently and then each user is emailed over a single mail connection.
+        Users already notified by an earlier attempt are skipped so retrying after a partial share is safe.
         Adds user names to failed_share_users for failed share commands.
         """
-        for share_to_user in self.delivery.share_users.all():
-            self._share_with_additional_user(share_to_user)
+        notified_user_ids = set(self._get_share_queryset().filter(state=State.NOTIFIED)
+                                .values_list('to_user_id', flat=True))
+        share_to_users = [share_to_user for share_to_user in self.delivery.share_users.all()
+                          if share_to_user.dds_id not in notified_user_ids]
+        share_to_users = self._give_share_users_permission(share_to_users)
+        if not share_to_users:
+            return
+        project = None
+        with get_connection() as connection:
+            for share_to_user in share_to_users:
+                try:
+                    project = self._create_and_send_share_message(share_to_user, self.delivery.project_id,
+                                                                  connection, project)
+                except DataServiceError:
+                    self.failed_share_users.append(self._try_lookup_user_name(share_to_user.dds_id))
 
     def give_sender_permission(self, share_role=ShareRole.DOWNLOAD):
         """
@@ -471,40 +1430,83 @@ class DeliveryUtil(object):
         except DataServiceError:
             self.failed_share_users.append(self._try_lookup_user_name(from_user_id))
 
-    def _share_with_additional_user(self, share_to_user):
-        try:
-            project_id = self.delivery.project_id
-            self.dds_util.share_project_with_user(project_id, share_to_user.dds_id, self.share_role)
-            self._create_and_send_share_message(share_to_user, project_id)
-        except DataServiceError:
-            self.failed_share_users.append(self._try_lookup_user_name(share_to_user.dds_id))
+    def _give_share_users_permission(self, share_to_users):
+        """
+        Give share_role permission for the delivered project to several users at once.
+        Adds user names to failed_share_users for users that could not be given permission.
+        :param share_to_users: [DDSDeliveryShareUser]: users to give permission to
+        :return: [DDSDeliveryShareUser]: users that were given permission
+        """
+        if not share_to_users:
+            return []
+        project_id = self.delivery.project_id
+        self.dds_util.connect()
+        with ThreadPoolExecutor(max_workers=settings.DDS_SHARE_WORKERS) as executor:
+            futures = [
+                executor.submit(self.dds_util.share_project_with_user, project_id, share_to_user.dds_id,
+                                self.share_role)
+                for share_to_user in share_to_users
+            ]
+        shared_users = []
+        for share_to_user, future in zip(share_to_users, futures):
+            try:
+                future.result()
+                shared_users.append(share_to_user)
+            except DataServiceError:
+                self.failed_share_users.append(self._try_lookup_user_name(share_to_user.dds_id))
+        return shared_users
+
+    def _get_share_queryset(self):
+        """
+        Return the shares of the delivered project sent by the delivery's recipient.
+        """
+        return Share.objects.filter(project_id=self.delivery.project_id, from_user_id=self.delivery.to_user_id)
 
     def _try_lookup_user_name(self, user_id):
         try:
-            remote_user = self.dds_util.get_remote_user(user_id)
-            return remote_user.full_name
+            return DDSUser.fetch_one(self.dds_util, user_id).full_name
         except DataServiceError:
             return user_id
 
-    def _create_and_send_share_message(self, share_to_user, project_id):
-
-        share = Share.objects.create(project_id=project_id,
-                                     from_user_id=self.delivery.to_user_id,
-                                     to_user_id=share_to_user.dds_id,
-                                     role=self.share_role,
-                                     user_message=self.share_user_message,
-                                     email_template_set=self.delivery.email_template_set)
-        message_factory = DDSMessageFactory(share, self.user)
+    def _create_and_send_share_message(self, share_to_user, project_id, connection=None, project=None):
+        """
+        Create a Share for share_to_user and email them about it.
+        :param share_to_user: DDSDeliveryShareUser: user to share with
+        :param project_id: str: DukeDS UUID of the project being shared
+        :param connection: email backend connection to send the message with
+        :param project: DDSProject: project details fetched for a previous share
+        :return: DDSProject: project details to reuse for the next share
+        """
+        # Reuse a share left unsent by an earlier attempt
+        share = self._get_share_queryset().filter(to_user_id=share_to_user.dds_id).exclude(
+            state=State.NOTIFIED).first()
+        if not share:
+            share = Share.objects.create(project_id=project_id,
+                                         from_user_id=self.delivery.to_user_id,
+                                         to_user_id=share_to_user.dds_id,
+                                         role=self.share_role,
+                                         user_message=self.share_user_message,
+                                         email_template_set=self.delivery.email_template_set)
+        message_factory = DDSMessageFactory(share, self.user, project)
         message = message_factory.make_share_message()
-        message.send()
+        message.send(connection)
         share.mark_notified(message.email_text)
+        return message_factory.delivery_details.get_project()
 
     def get_warning_message(self):
         """
         Create message about any issues that occurred during share_with_additional_users.
         :return: str: end user warning message
         """
-        failed_share_users_str = ', '.join(self.failed_share_users)
+        return DeliveryUtil.make_warning_message(self.failed_share_users)
+
+    @staticmethod
+    def make_warning_message(failed_share_users):
+        """
+        :param failed_share_users: [str]: names of users the project could not be shared with
+        :return: str: end user warning message
+        """
+        failed_share_users_str = ', '.join(failed_share_users)
         warning_message = ''
         if failed_share_users_str:
             warning_message = "Failed to share with the following user(s): " + failed_share_users_str
@@ -525,7 +1527,7 @@ class DeliveryUtil(object):
 class DDSDeliveryType:
     name = StorageTypes.DDS
     delivery_cls = DDSDelivery
-    transfer_in_background = False
+    transfer_in_background = True
 
     @staticmethod
     def get_delivery(transfer_id):
@@ -543,42 +1545,138 @@ class DDSDeliveryType:
 
     @staticmethod
     def transfer_delivery(delivery, user):
-        delivery_util = DDSDeliveryType.make_delivery_util(delivery, user)
-        delivery_util.accept_project_transfer()
-        delivery_util.share_with_additional_users()
-        delivery_util.give_sender_permission()
-        warning_message = delivery_util.get_warning_message()
+        delivery.performed_by = user.get_username()
+        delivery.mark_transferring()
+        DDSTransferFunctions.transfer_delivery(delivery.id)
+
+    @staticmethod
+    def make_processed_message(delivery, user, process_type, direction, warning_message=''):
         message_factory = DDSMessageFactory(delivery, user)
-        sender_message = message_factory.make_processed_message('accepted',
-                                                                MessageDirection.ToSender,
-                                                                warning_message=warning_message)
-        recipient_message = message_factory.make_processed_message('accepted_recipient',
-                                                                   MessageDirection.ToRecipient)
+        return message_factory.make_processed_message(process_type, direction, warning_message=warning_message)
+
+
+class DDSTransferFunctions(object):
+    @staticmethod
+    @background
+    def transfer_delivery(delivery_id):
+        """
+        Accept a DukeDS delivery for the user who accepted it in the ownership pages.
+        Steps already recorded in the delivery's transfer_state are skipped so a failed attempt can be retried.
+        :param delivery_id: int: id of the DDSDelivery to transfer
+        """
+        transfer = DDSTransfer(delivery_id)
+        try:
+            transfer.ensure_transferring_state()
+            transfer.run()
+        except Exception as e:
+            transfer.set_failed_and_record_exception(e)
+            raise
+
+
+class DDSTransfer(object):
+    """
+    Accepts a DukeDS delivery, sharing the project and emailing the sender and recipient.
+    Each step records its completion in the delivery's transfer_state.
+    """
+    def __init__(self, delivery_id):
+        self.delivery = DDSDelivery.objects.get(pk=delivery_id)
+        self.user = User.objects.get(username=self.delivery.performed_by)
+        self.delivery_util = DDSDeliveryType.make_delivery_util(self.delivery, self.user)
+        self.delivery_util.failed_share_users = list(self.delivery.failed_share_users)
+        self._message_factory = None
+
+    def ensure_transferring_state(self):
+        if self.delivery.state != State.TRANSFERRING:
+            self.delivery.mark_transferring()
+
+    def run(self):
+        """
+        Run the remaining steps to accept the delivery based on transfer_state.
+        """
+        if self.delivery.transfer_state < DDSTransferStates.ACCEPTED_PROJECT_TRANSFER:
+            self.accept_project_transfer()
+        if self.delivery.transfer_state < DDSTransferStates.SHARED_WITH_USERS:
+            self.share_with_additional_users()
+        if self.delivery.transfer_state < DDSTransferStates.GAVE_SENDER_PERMISSION:
+            self.give_sender_permission()
+        if self.delivery.transfer_state < DDSTransferStates.EMAILED_SENDER:
+            self.email_sender()
+        if self.delivery.transfer_state < DDSTransferStates.EMAILED_RECIPIENT:
+            self.email_recipient()
+        if self.delivery.transfer_state < DDSTransferStates.COMPLETE:
+            self.mark_complete()
+
+    def accept_project_transfer(self):
+        # A previous attempt may have accepted the transfer without recording it
+        transfer_dict = self.delivery_util.dds_util.get_project_transfer(self.delivery.transfer_id).json()
+        if transfer_dict.get('status') != 'accepted':
+            self.delivery_util.accept_project_transfer()
+        self.set_transfer_state(DDSTransferStates.ACCEPTED_PROJECT_TRANSFER)
+
+    def share_with_additional_users(self):
+        self.delivery_util.share_with_additional_users()
+        self.delivery.failed_share_users = self.delivery_util.failed_share_users
+        self.set_transfer_state(DDSTransferStates.SHARED_WITH_USERS)
+
+    def give_sender_permission(self):
+        self.delivery_util.give_sender_permission()
+        self.delivery.failed_share_users = self.delivery_util.failed_share_users
+        self.set_transfer_state(DDSTransferStates.GAVE_SENDER_PERMISSION)
+
+    def email_sender(self):
+        message = self.get_message_factory().make_processed_message(
+            'accepted', MessageDirection.ToSender, warning_message=self.delivery_util.get_warning_message())
         # Record a copy of the project name to account for renamed projects after acceptance.
         # This will allow the user sending the project delivery to view consistent project names.
-        delivery.project_name = message_factory.delivery_details.get_project().name
-        # Save email messages first so the the emails can be resent if they fail
-        delivery.mark_accepted(user.get_username(), sender_message.email_text, recipient_message.email_text)
-        try:
-            sender_message.send()
-        except OSError as e:
-            warning_message += 'Failed to email to {}: {}\n'.format(sender_message.to, str(e))
+        self.delivery.project_name = self.get_message_factory().delivery_details.get_project().name
+        self.delivery.sender_completion_email_text = message.email_text
+        self.send_message(message)
+        self.set_transfer_state(DDSTransferStates.EMAILED_SENDER)
+
+    def email_recipient(self):
+        message = self.get_message_factory().make_processed_message('accepted_recipient',
+                                                                    MessageDirection.ToRecipient)
+        self.delivery.recipient_completion_email_text = message.email_text
+        self.send_message(message)
+        self.set_transfer_state(DDSTransferStates.EMAILED_RECIPIENT)
+
+    def send_message(self, message):
+        """
+        Send message, recording failures as errors so the delivery can still be completed.
+        The email text is saved on the delivery so it can be resent.
+        """
         try:
-            recipient_message.send()
+            message.send()
         except OSError as e:
-            warning_message += 'Failed to email to {}: {}\n'.format(recipient_message.to, str(e))
-        return warning_message
+            DDSDeliveryError.objects.create(delivery=self.delivery,
+                                            message='Failed to email to {}: {}'.format(message.to, str(e)))
 
-    @staticmethod
-    def make_processed_message(delivery, user, process_type, direction, warning_message=''):
-        message_factory = DDSMessageFactory(delivery, user)
-        return message_factory.make_processed_message(process_type, direction, warning_message=warning_message)
+    def get_message_factory(self):
+        """
+        Return the message factory shared by the sender and recipient emails so DukeDS is only queried once.
+        """
+        if self._message_factory is None:
+            self._message_factory = DDSMessageFactory(self.delivery, self.user)
+        return self._message_factory
+
+    def mark_complete(self):
+        self.delivery.transfer_state = DDSTransferStates.COMPLETE
+        self.delivery.mark_accepted(self.delivery.performed_by, self.delivery.sender_completion_email_text,
+                                    self.delivery.recipient_completion_email_text)
+
+    def set_transfer_state(self, transfer_state):
+        self.delivery.transfer_state = transfer_state
+        self.delivery.save()
+
+    def set_failed_and_record_exception(self, e):
+        DDSDeliveryError.objects.create(delivery=self.delivery, message=str(e))
+        self.delivery.mark_failed()
 
 
 class DDSMessageFactory(MessageFactory):
-    def __init__(self, delivery, user):
+    def __init__(self, delivery, user, project=None):
         super(DDSMessageFactory, self).__init__(
-            DeliveryDetails(delivery, user),
+            DeliveryDetails(delivery, user, project),
             user
         )
 
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from django.core.mail import EmailMessage
 from django.template import Template, Context
 from django.utils.safestring import mark_safe
@@ -6,9 +7,11 @@ from django.conf import settings
 LOAD_EMAIL_FILTERS = '{% load emailfilters %}'
 
 
+@lru_cache(maxsize=128)
 def template_with_email_filters(template_string):
     """
-    Create a template that will load our email filters
+    Create a template that will load our email filters.
+    Templates are cached so each one is only compiled once when sending many messages.
     :param template_string: str
     :return: Template
     """
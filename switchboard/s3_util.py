@@ -1,10 +1,19 @@
 from d4s2_api.models import S3Delivery, EmailTemplate, S3User, S3UserTypes, S3DeliveryError, State, S3ObjectManifest, \
-    EmailTemplateException, StorageTypes
+    EmailTemplateException, StorageTypes, S3TransferStates, S3DeliveryCopiedObject, S3TransferModes, S3UserCredential, \
+    ObjectManifestWriter
 from d4s2_api.utils import MessageFactory, MessageDirection
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+import threading
 import boto3
 import botocore
+import botocore.config
 from background_task import background
 
+HANDOFF_OWNER_ACCESS_WARNING = 'The bucket was handed off in place. S3 cannot change the owner of a bucket so ' \
+                               'the sender still owns it and keeps access to its contents.'
+
 
 def wrap_s3_exceptions(func):
     """
@@ -110,14 +119,56 @@ class S3DeliveryUtil(object):
 
     @wrap_s3_exceptions
     def accept_project_transfer(self):
-        self._grant_user_read_permissions(self.s3_delivery.to_user)
-        self._copy_files_to_new_destination_bucket()
-        self._cleanup_source_bucket()
+        """
+        Transfer the delivery to the recipient based on the delivery's transfer_mode. Each completed stage is
+        recorded in the delivery's transfer_state so a retried transfer resumes after the last completed stage
+        instead of starting over.
+        """
+        if self.s3_delivery.transfer_mode == S3TransferModes.HANDOFF:
+            self._hand_off_source_bucket()
+        else:
+            self._copy_source_bucket()
+
+    def _copy_source_bucket(self):
+        if self._transfer_state_before(S3TransferStates.GRANTED_RECIPIENT_PERMISSIONS):
+            self._grant_user_read_permissions(self.s3_delivery.to_user)
+            self._set_transfer_state(S3TransferStates.GRANTED_RECIPIENT_PERMISSIONS)
+        if self._transfer_state_before(S3TransferStates.COPIED_OBJECTS):
+            self._copy_files_to_new_destination_bucket()
+            self._set_transfer_state(S3TransferStates.COPIED_OBJECTS)
+        if self._transfer_state_before(S3TransferStates.CLEANED_UP_SOURCE_BUCKET):
+            self._cleanup_source_bucket()
+            self._set_transfer_state(S3TransferStates.CLEANED_UP_SOURCE_BUCKET)
+
+    def _hand_off_source_bucket(self):
+        """
+        Give the recipient full control of the source bucket and its objects in place, revoking the sender's grants.
+        The agent retains full control so it can still manage the bucket. No objects are copied.
+        S3 cannot change the owner of a bucket so the sender, as owner, keeps access and can change the ACLs again.
+        """
+        if self._transfer_state_before(S3TransferStates.HANDED_OFF_SOURCE_BUCKET):
+            to_s3_user = self.s3_delivery.to_user
+            s3 = S3Resource(self.s3_agent)
+            full_control_users = [self.s3_agent, to_s3_user]
+            s3.grant_objects_acl(self.source_bucket_name, grant_full_control_user=full_control_users)
+            s3.grant_bucket_acl(self.source_bucket_name, grant_full_control_user=full_control_users)
+            print("Gave agent {} and to_user {} full control of {}".format(self.s3_agent.s3_id, to_s3_user.s3_id,
+                                                                          self.source_bucket_name))
+            self._set_transfer_state(S3TransferStates.HANDED_OFF_SOURCE_BUCKET)
+
+    def _transfer_state_before(self, transfer_state):
+        return self.s3_delivery.transfer_state < transfer_state
+
+    def _set_transfer_state(self, transfer_state):
+        self.s3_delivery.transfer_state = transfer_state
+        self.s3_delivery.save()
 
     def share_with_additional_users(self):
         pass
 
     def get_warning_message(self):
+        if self.s3_delivery.transfer_mode == S3TransferModes.HANDOFF:
+            return HANDOFF_OWNER_ACCESS_WARNING
         return ''
 
     def _grant_user_read_permissions(self, s3_user):
@@ -138,8 +189,13 @@ class S3DeliveryUtil(object):
 
     def _copy_files_to_new_destination_bucket(self):
         s3 = S3Resource(self.s3_delivery.to_user)
-        s3.create_bucket(self.destination_bucket_name)
-        s3.copy_bucket(self.source_bucket_name, self.destination_bucket_name)
+        if self._transfer_state_before(S3TransferStates.CREATED_DESTINATION_BUCKET):
+            s3.create_bucket(self.destination_bucket_name)
+            self._set_transfer_state(S3TransferStates.CREATED_DESTINATION_BUCKET)
+        checkpoint = S3TransferCheckpoint(self.s3_delivery)
+        s3.copy_bucket(self.source_bucket_name, self.destination_bucket_name,
+                       skip_object=checkpoint.is_copied,
+                       on_object_copied=checkpoint.record_copied)
 
     def _cleanup_source_bucket(self):
         s3 = S3Resource(self.s3_agent)
@@ -155,12 +211,52 @@ class S3DeliveryUtil(object):
         print("Gave from user {} Full Control".format(from_s3_user.s3_id))
 
 
+class S3TransferCheckpoint(object):
+    """
+    Tracks which objects of a delivery have already been copied to the destination bucket.
+    An object is only considered copied when the ETag and size recorded match the current source object.
+    """
+    def __init__(self, s3_delivery):
+        """
+        :param s3_delivery: S3Delivery: delivery being transferred
+        """
+        self.s3_delivery = s3_delivery
+        self.copied_objects = {}
+        copied_objects = S3DeliveryCopiedObject.objects.filter(delivery=s3_delivery)
+        for key, e_tag, size in copied_objects.values_list('key', 'e_tag', 'size').iterator():
+            self.copied_objects[key] = (e_tag, size)
+
+    def is_copied(self, object_summary):
+        """
+        Return True if object_summary has already been copied unchanged.
+        :param object_summary: boto3 ObjectSummary: object in the source bucket
+        :return: boolean
+        """
+        return self.copied_objects.get(object_summary.key) == (object_summary.e_tag, object_summary.size)
+
+    def record_copied(self, object_summary):
+        """
+        Durably record that object_summary has been copied.
+        :param object_summary: boto3 ObjectSummary: object in the source bucket that was copied
+        """
+        S3DeliveryCopiedObject.objects.update_or_create(
+            delivery=self.s3_delivery,
+            key=object_summary.key,
+            defaults={
+                'e_tag': object_summary.e_tag,
+                'size': object_summary.size,
+            }
+        )
+        self.copied_objects[object_summary.key] = (object_summary.e_tag, object_summary.size)
+
+
 class S3DeliveryDetails(object):
     def __init__(self, s3_delivery, user):
         self.storage = StorageTypes.S3
         self.s3_delivery = s3_delivery
         self.email_template_set = s3_delivery.email_template_set
         self.user = user
+        self._context = None
 
     def get_from_user(self):
         return self.s3_delivery.from_user.user
@@ -169,6 +265,11 @@ class S3DeliveryDetails(object):
         return self.s3_delivery.to_user.user
 
     def get_context(self):
+        if self._context is None:
+            self._context = self._make_context()
+        return self._context
+
+    def _make_context(self):
         from_user = self.get_from_user()
         to_user = self.get_to_user()
         bucket_name = self.s3_delivery.bucket.name
@@ -201,21 +302,101 @@ class S3DeliveryDetails(object):
         }
 
 
+class S3ResourceCache(object):
+    """
+    Cache of boto3 s3 resources keyed by endpoint url and credentials.
+    Creating a boto3 session loads the botocore service models, so sessions and their connection pools
+    are reused by every S3Resource created for the same credentials. boto3 sessions and resources are not
+    thread safe so each thread keeps its own resources.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Incremented to discard the resources of every thread when credentials change
+        self.generation = 0
+
+    def get_resource(self, s3_user):
+        """
+        Return a boto3 s3 resource for s3_user cached for the current thread, creating one if necessary.
+        :param s3_user: S3User: user whose credentials the resource will use
+        :return: boto3 s3 resource
+        """
+        key = (s3_user.endpoint.url, s3_user.s3_id, s3_user.credential.aws_secret_access_key)
+        resources = self.get_thread_resources()
+        resource = resources.get(key)
+        if resource is None:
+            resource = self._create_resource(*key)
+            resources[key] = resource
+        return resource
+
+    def get_thread_resources(self):
+        """
+        :return: dict: resources created by the current thread since the cache was last invalidated
+        """
+        with self.lock:
+            generation = self.generation
+        if getattr(self.local, 'generation', None) != generation:
+            self.local.generation = generation
+            self.local.resources = {}
+        return self.local.resources
+
+    @staticmethod
+    def _create_resource(endpoint_url, aws_access_key_id, aws_secret_access_key):
+        session = boto3.session.Session(aws_access_key_id=aws_access_key_id,
+                                        aws_secret_access_key=aws_secret_access_key)
+        config = botocore.config.Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS)
+        return session.resource('s3', endpoint_url=endpoint_url, config=config)
+
+    def invalidate(self, s3_user_id):
+        """
+        Remove cached resources when a s3 user or their credential changes. Changes are rare so the resources
+        of every user are removed.
+        :param s3_user_id: int: id of the S3User
+        """
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+
+
+s3_resource_cache = S3ResourceCache()
+
+
+@receiver(post_save, sender=S3User)
+@receiver(post_delete, sender=S3User)
+def invalidate_s3_user_resources(sender, instance, **kwargs):
+    s3_resource_cache.invalidate(instance.id)
+
+
+@receiver(post_save, sender=S3UserCredential)
+@receiver(post_delete, sender=S3UserCredential)
+def invalidate_s3_user_credential_resources(sender, instance, **kwargs):
+    s3_resource_cache.invalidate(instance.s3_user_id)
+
+
 class S3Resource(object):
     def __init__(self, s3_user):
-        session = boto3.session.Session(aws_access_key_id=s3_user.s3_id,
-                                        aws_secret_access_key=s3_user.credential.aws_secret_access_key)
-        self.s3 = session.resource('s3', endpoint_url=s3_user.endpoint.url)
+        self.s3 = s3_resource_cache.get_resource(s3_user)
         self.exceptions = self.s3.meta.client.exceptions
 
     def create_bucket(self, bucket_name):
         bucket = self.s3.Bucket(bucket_name)
         bucket.create()
 
-    def copy_bucket(self, source_bucket_name, destination_bucket_name):
+    def copy_bucket(self, source_bucket_name, destination_bucket_name, skip_object=None, on_object_copied=None):
+        """
+        Copy objects from the source bucket into the destination bucket.
+        :param source_bucket_name: str: name of the bucket to copy objects from
+        :param destination_bucket_name: str: name of the bucket to copy objects into
+        :param skip_object: func(object_summary): optional, returns True for objects that should not be copied
+        :param on_object_copied: func(object_summary): optional, called after each object is copied
+        """
         # TODO: compare this on a large project vs aws cli sync
         source_bucket = self.s3.Bucket(source_bucket_name)
         for file_object in source_bucket.objects.all():
+            if skip_object and skip_object(file_object):
+                continue
             self.s3.meta.client.copy_object(
                 CopySource={
                     'Bucket': source_bucket_name,
@@ -225,6 +406,8 @@ class S3Resource(object):
                 Key=file_object.key,
                 MetadataDirective='COPY'
             )
+            if on_object_copied:
+                on_object_copied(file_object)
 
     def delete_bucket(self, bucket_name):
         bucket = self.s3.Bucket(bucket_name)
@@ -252,24 +435,37 @@ class S3Resource(object):
 
     @staticmethod
     def _make_acl_args(grant_full_control_user, grant_read_user):
+        """
+        Create arguments for an acl put request. Any existing grants not included are removed.
+        :param grant_full_control_user: S3User or [S3User]: user(s) to grant full control to
+        :param grant_read_user: S3User: user to grant read permissions to
+        :return: dict: arguments for BucketAcl.put or ObjectAcl.put
+        """
         args = {}
         if grant_full_control_user:
-            args['GrantFullControl'] = 'id={}'.format(grant_full_control_user.s3_id)
+            args['GrantFullControl'] = S3Resource._make_grantees(grant_full_control_user)
         if grant_read_user:
-            args['GrantRead'] = 'id={}'.format(grant_read_user.s3_id)
+            args['GrantRead'] = S3Resource._make_grantees(grant_read_user)
         if not args:
             raise ValueError("Programmer should specify grant_full_control_user or grant_read_user")
         return args
 
+    @staticmethod
+    def _make_grantees(s3_users):
+        if not isinstance(s3_users, (list, tuple)):
+            s3_users = [s3_users]
+        return ', '.join(['id={}'.format(s3_user.s3_id) for s3_user in s3_users])
+
     def get_bucket_owner(self, bucket_name):
         bucket_acl = self.s3.BucketAcl(bucket_name)
         return bucket_acl.owner['ID']
 
     def get_objects_for_bucket(self, bucket_name):
-        s3_objects = []
+        return list(self.iter_objects_for_bucket(bucket_name))
+
+    def iter_objects_for_bucket(self, bucket_name):
         for s3_object_summary in self.s3.Bucket(bucket_name).objects.all():
-            s3_objects.append(s3_object_summary.Object())
-        return s3_objects
+            yield s3_object_summary.Object()
 
 
 class S3BucketUtil(object):
@@ -299,9 +495,15 @@ class S3BucketUtil(object):
                 raise S3Exception(e)
 
     def get_objects_manifest(self, bucket_name):
-        manifest = []
-        for s3_object in self.s3.get_objects_for_bucket(bucket_name):
-            manifest.append({
+        return list(self.iter_objects_manifest(bucket_name))
+
+    def iter_objects_manifest(self, bucket_name):
+        """
+        Generate manifest entries for the objects in a bucket as the bucket is listed.
+        :param bucket_name: str: name of the bucket to list
+        """
+        for s3_object in self.s3.iter_objects_for_bucket(bucket_name):
+            yield {
                 'key': s3_object.key,
                 'metadata': s3_object.metadata,
                 'e_tag': s3_object.e_tag,
@@ -309,8 +511,7 @@ class S3BucketUtil(object):
                 'content_length': s3_object.content_length,
                 'content_type': s3_object.content_type,
                 'version_id': s3_object.version_id
-            })
-        return manifest
+            }
 
 
 class S3Exception(Exception):
@@ -519,8 +720,11 @@ class SendDeliveryOperation(S3Operation):
         bucket = self.delivery.bucket
         from_user = self.delivery.from_user
         s3_bucket_util = S3BucketUtil(bucket.endpoint, from_user.user)
-        objects_manifest = s3_bucket_util.get_objects_manifest(bucket_name=bucket.name)
-        self.delivery.manifest = S3ObjectManifest.objects.create(content=objects_manifest)
+        manifest = S3ObjectManifest.objects.create(chunked=True)
+        manifest_writer = ObjectManifestWriter(manifest)
+        manifest_writer.write_all(s3_bucket_util.iter_objects_manifest(bucket_name=bucket.name))
+        manifest_writer.close()
+        self.delivery.manifest = manifest
         self.delivery.save()
         self.background_funcs.give_agent_permission(self.delivery.id, self.accept_url)
 
@@ -0,0 +1,144 @@
+from django.test import TestCase
+from mock import patch, Mock
+import os
+import random
+import tempfile
+from switchboard.azure_local_util import LocalFileSystemClient, LocalTransferExecutor, copy_project, \
+    LOCAL_TRANSFER_FAILURE_MESSAGE, clear_local_acls
+
+
+class LocalStorageTestCase(TestCase):
+    def setUp(self):
+        clear_local_acls()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_root = os.path.join(self.temp_dir.name, 'source')
+        self.sink_root = os.path.join(self.temp_dir.name, 'sink')
+        self.write_file(self.source_root, 'user1/mouse/data.txt', b'abc')
+        self.write_file(self.source_root, 'user1/mouse/results/out.txt', b'12345')
+        os.makedirs(self.sink_root)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def write_file(root, path, data):
+        local_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as outfile:
+            outfile.write(data)
+
+
+class TestLocalFileSystemClient(LocalStorageTestCase):
+    def test_get_paths(self):
+        client = LocalFileSystemClient(self.source_root)
+        paths = [(p.name, p.is_directory, p.content_length) for p in client.get_paths('user1/mouse', recursive=True)]
+        self.assertEqual(paths, [
+            ('user1/mouse/results', True, 0),
+            ('user1/mouse/data.txt', False, 3),
+            ('user1/mouse/results/out.txt', False, 5),
+        ])
+        paths = [p.name for p in client.get_paths('user1/mouse', recursive=False)]
+        self.assertEqual(paths, ['user1/mouse/results', 'user1/mouse/data.txt'])
+
+    def test_get_paths_missing_directory(self):
+        client = LocalFileSystemClient(self.source_root)
+        with self.assertRaises(FileNotFoundError):
+            list(client.get_paths('user1/rat'))
+
+    def test_access_control(self):
+        client = LocalFileSystemClient(self.source_root)
+        directory_client = client.get_directory_client('user1/mouse')
+        self.assertEqual(directory_client.get_access_control(), {'acl': ''})
+        directory_client.set_access_control(acl='user:user2:rwx')
+        self.assertEqual(directory_client.get_access_control(), {'acl': 'user:user2:rwx'})
+        result = client.get_directory_client('user1/mouse/results').update_access_control_recursive(
+            acl='user:user3:r-x', continuation_token=None, batch_size=2000, max_batches=1, continue_on_failure=True)
+        self.assertEqual(result.continuation, None)
+        self.assertEqual(result.counters.failure_count, 0)
+        self.assertEqual(client.get_file_client('user1/mouse/results/out.txt').get_access_control(),
+                         {'acl': 'user:user3:r-x'})
+
+    def test_access_control_file(self):
+        client = LocalFileSystemClient(self.source_root)
+        result = client.get_file_client('user1/mouse/data.txt').update_access_control_recursive(
+            acl='user:user3:r-x', continuation_token=None, batch_size=2000, max_batches=1, continue_on_failure=True)
+        self.assertEqual(result.continuation, None)
+        self.assertEqual(result.counters.failure_count, 0)
+        self.assertEqual(client.get_file_client('user1/mouse/data.txt').get_access_control(),
+                         {'acl': 'user:user3:r-x'})
+        self.assertEqual(client.get_directory_client('user1/mouse').get_access_control(), {'acl': ''})
+
+    def test_access_control_shared_by_clients_of_a_root(self):
+        LocalFileSystemClient(self.source_root).get_directory_client('user1/mouse').set_access_control(
+            acl='user:user2:rwx')
+        self.assertEqual(LocalFileSystemClient(self.source_root).get_directory_client('user1/mouse')
+                         .get_access_control(), {'acl': 'user:user2:rwx'})
+        self.assertEqual(LocalFileSystemClient(self.sink_root).get_directory_client('user1/mouse')
+                         .get_access_control(), {'acl': ''})
+
+
+class TestCopyProject(LocalStorageTestCase):
+    def test_copy_project(self):
+        manifest = copy_project(LocalFileSystemClient(self.source_root), 'user1/mouse',
+                                LocalFileSystemClient(self.sink_root), 'user2/mouse')
+        self.assertEqual(manifest, [
+            {'name': 'user2/mouse/data.txt', 'size': 3},
+            {'name': 'user2/mouse/results/out.txt', 'size': 5},
+        ])
+        with open(os.path.join(self.sink_root, 'user2/mouse/results/out.txt'), 'rb') as infile:
+            self.assertEqual(infile.read(), b'12345')
+
+
+@patch('switchboard.azure_local_util.requests')
+class TestLocalTransferExecutor(LocalStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        roots = {'file:///source': self.source_root, 'file:///sink': self.sink_root}
+        self.executor = LocalTransferExecutor(lambda container_url: LocalFileSystemClient(roots[container_url]),
+                                              webhook_url='https://localhost/api/v2/az-transfers/',
+                                              webhook_token='secret', max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        super().tearDown()
+
+    def test_run(self, mock_requests):
+        response = self.executor.run(1, 'abc123', 'file:///source', 'user1/mouse', 'file:///sink', 'user2/mouse')
+        self.assertEqual(response, mock_requests.post.return_value)
+        mock_requests.post.assert_called_with(
+            'https://localhost/api/v2/az-transfers/',
+            headers={'user-agent': 'duke-data-delivery/2.0.0', 'Authorization': 'Token secret'},
+            json={
+                'delivery_id': '1',
+                'transfer_uuid': 'abc123',
+                'manifest': [
+                    {'name': 'user2/mouse/data.txt', 'size': 3},
+                    {'name': 'user2/mouse/results/out.txt', 'size': 5},
+                ]
+            })
+        mock_requests.post.return_value.raise_for_status.assert_called_with()
+
+    def test_run_missing_source(self, mock_requests):
+        self.executor.run(1, 'abc123', 'file:///source', 'user1/rat', 'file:///sink', 'user2/rat')
+        payload = mock_requests.post.call_args[1]['json']
+        self.assertNotIn('manifest', payload)
+        self.assertIn('user1/rat', payload['error_message'])
+
+    def test_submit_with_failures(self, mock_requests):
+        self.executor.failure_rate = 1
+        future = self.executor.submit(1, 'abc123', 'file:///source', 'user1/mouse', 'file:///sink', 'user2/mouse')
+        future.result()
+        payload = mock_requests.post.call_args[1]['json']
+        self.assertEqual(payload['error_message'], LOCAL_TRANSFER_FAILURE_MESSAGE)
+        self.assertFalse(os.path.exists(os.path.join(self.sink_root, 'user2')))
+
+    @patch('switchboard.azure_local_util.time')
+    def test_submit_with_delay(self, mock_time, mock_requests):
+        self.executor.delay_seconds = 2
+        self.executor.rand = Mock(spec=random.Random)
+        self.executor.rand.uniform.return_value = 1.5
+        self.executor.rand.random.return_value = 0.5
+        self.executor.submit(1, 'abc123', 'file:///source', 'user1/mouse', 'file:///sink', 'user2/mouse').result()
+        self.executor.rand.uniform.assert_called_with(0, 2)
+        mock_time.sleep.assert_called_with(1.5)
+        self.assertIn('manifest', mock_requests.post.call_args[1]['json'])
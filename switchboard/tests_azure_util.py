@@ -1,13 +1,23 @@
 from django.test import TestCase
 from background_task.tasks import tasks
+import os
+import tempfile
 import uuid
 from mock import patch, ANY, Mock, call
 from switchboard.azure_util import get_details_from_container_url, make_acl, AzDeliveryDetails, AzDeliveryType, \
     AzDelivery, State, TransferFunctions, AzureTransfer, \
     User, settings, AzDeliveryError, AzNotRecipientException, \
-    AzureProjectSummary, decompose_dfs_url, get_container_details
+    AzureProjectSummary, decompose_dfs_url, get_container_details, AzTransferManifestChunkUpload, iter_ndjson_entries, \
+    AzureProjectSummaryBuilder, create_project_summary, get_project_summary_cache_key, get_file_system_client, \
+    fetch_container_details, ContainerDetailsCache, AzSaaSUnavailable, AzureAclPropagation, merge_acl, \
+    get_user_object_id, AzUserNotFound, AzIncompleteDeliveryExists, get_directory_user
+import requests
+from azure.core.exceptions import AzureError, HttpResponseError
+from django.core.cache import cache
 from d4s2_api.utils import MessageDirection
-from d4s2_api.models import AzTransferStates, AzContainerPath
+from d4s2_api.models import AzTransferStates, AzContainerPath, AzTransferNotification, AzTransferManifestPart, \
+    AzAclUpdate, EmailTemplateSet, EmailTemplate, EmailTemplateType, StorageTypes
+from switchboard.azure_local_util import LocalFileSystemClient, clear_local_acls
 from django.conf import settings
 
 
@@ -45,6 +55,19 @@ class TestAzDeliveryDetails(TestCase):
         self.assertEqual(self.details.get_to_user(), mock_get_user_for_netid.return_value)
         mock_get_user_for_netid.assert_called_with('user2')
 
+    @patch('switchboard.azure_util.get_user_for_netid')
+    def test_get_users_fetched_once(self, mock_get_user_for_netid):
+        mock_get_user_for_netid.side_effect = [
+            Mock(username='user1', full_name='User1', email='user1@sample.com'),
+            Mock(username='user2', full_name='User2', email='user2@sample.com'),
+        ]
+        self.details.get_email_context('accepturl', 'accepted', '', '')
+        context = self.details.get_email_context('accepturl', 'accepted_recipient', '', '')
+        self.assertEqual(context['sender_name'], 'User1')
+        self.assertEqual(context['recipient_name'], 'User2')
+        self.assertEqual(self.details.get_from_user().username, 'user1')
+        self.assertEqual(mock_get_user_for_netid.call_count, 2)
+
     @patch('switchboard.azure_util.get_user_for_netid')
     def test_get_context(self, mock_get_user_for_netid):
         mock_get_user_for_netid.side_effect = [
@@ -190,6 +213,95 @@ class TestTransferFunctions(TestCase):
         mock_azure_transfer.return_value.assert_has_calls(expected_calls)
 
 
+class TestCompleteTransfer(TestCase):
+    def setUp(self):
+        self.delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path="user1/mouse", container_url="http://127.0.0.1"),
+            from_netid='user1',
+            to_netid='user2',
+            state=State.TRANSFERRING,
+        )
+        self.notification = AzTransferNotification.objects.create(
+            delivery=self.delivery, transfer_uuid=uuid.uuid4(), payload={'manifest': [{'name': 'file1.txt'}]})
+
+    @patch('switchboard.azure_util.AzureTransfer')
+    def test_complete_transfer(self, mock_azure_transfer):
+        TransferFunctions.queue_complete_transfer(self.notification)
+        tasks.run_next_task()
+        mock_azure_transfer.assert_called_with(self.delivery.id)
+        mock_azure_transfer.return_value.assert_has_calls([
+            call.ensure_transferring_state(),
+            call.complete_transfer([{'name': 'file1.txt'}]),
+        ])
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.processed, True)
+
+    @patch('switchboard.azure_util.AzureTransfer')
+    def test_complete_transfer_fails(self, mock_azure_transfer):
+        error = ValueError('SMTP down')
+        mock_azure_transfer.return_value.complete_transfer.side_effect = error
+        TransferFunctions.queue_complete_transfer(self.notification)
+        tasks.run_next_task()
+        mock_azure_transfer.return_value.set_failed_and_record_exception.assert_called_with(error)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.processed, False)
+
+    @patch('switchboard.azure_util.traceback')
+    def test_complete_transfer_newer_delivery_in_progress(self, mock_traceback):
+        self.delivery.mark_failed()
+        AzDelivery.objects.create(source_project=self.delivery.source_project, from_netid='user1', to_netid='user3')
+        TransferFunctions.queue_complete_transfer(self.notification)
+        self.assertTrue(tasks.run_next_task())
+        # The failure is recorded instead of retrying the task
+        self.assertFalse(tasks.run_next_task())
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.FAILED)
+        self.assertEqual([error.message for error in self.delivery.errors.all()],
+                         ["Error: Another delivery of 'user1/mouse' is in progress."])
+
+
+class TestAzureTransferLocalStorage(TestCase):
+    def setUp(self):
+        clear_local_acls()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        for path in ['user2/mouse/data.txt', 'user2/mouse/notes.txt', 'user2/mouse/results/out.txt']:
+            local_path = os.path.join(self.temp_dir.name, path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, 'wb') as outfile:
+                outfile.write(b'abc')
+        from_user = User.objects.create_user(username="user1@{}".format(settings.USERNAME_EMAIL_HOST))
+        email_template_set = EmailTemplateSet.objects.create(name='someset', storage=StorageTypes.AZURE)
+        for template_type in ['accepted', 'accepted_recipient']:
+            EmailTemplate.objects.create(template_set=email_template_set, owner=from_user,
+                                         template_type=EmailTemplateType.objects.get(name=template_type),
+                                         subject='Subject', body='Body')
+        self.delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path="user1/mouse", container_url="file:///source"),
+            from_netid='user1',
+            destination_project=AzContainerPath.objects.create(path="user2/mouse",
+                                                               container_url='file://' + self.temp_dir.name),
+            to_netid='user2',
+            share_user_ids=['user3'],
+            email_template_set=email_template_set,
+            state=State.TRANSFERRING,
+        )
+
+    @patch('switchboard.azure_util.print')
+    def test_complete_transfer_with_top_level_files(self, mock_print):
+        with self.settings(AZURE_TRANSFER_EXECUTOR='local'):
+            AzureTransfer(self.delivery.id).complete_transfer([{'name': 'user2/mouse/data.txt'}])
+            file_system_client = get_file_system_client(self.delivery.destination_project.container_url)
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.ACCEPTED)
+        self.assertEqual(self.delivery.transfer_state, AzTransferStates.COMPLETE)
+        self.assertFalse(any(acl_update.has_failures() for acl_update in self.delivery.acl_updates.all()))
+        for path in ['user2/mouse', 'user2/mouse/data.txt', 'user2/mouse/notes.txt', 'user2/mouse/results/out.txt']:
+            acl = file_system_client.get_file_client(path).get_access_control()['acl'].split(',')
+            self.assertIn('user:user2:rwx', acl)
+            self.assertIn('user:user3:r-x', acl)
+
+
 class TestAzureTransfer(TestCase):
     def setUp(self):
         self.delivery = AzDelivery.objects.create(
@@ -215,13 +327,25 @@ class TestAzureTransfer(TestCase):
         self.delivery.refresh_from_db()
         self.assertEqual(self.delivery.state, State.TRANSFERRING)
 
+    def test_ensure_transferring_state_newer_delivery_in_progress(self):
+        self.delivery.mark_failed()
+        AzDelivery.objects.create(source_project=self.delivery.source_project, from_netid='user1', to_netid='user3')
+        self.transfer = AzureTransfer(delivery_id=self.delivery.id)
+        with self.assertRaises(AzIncompleteDeliveryExists):
+            self.transfer.ensure_transferring_state()
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.FAILED)
+
     @patch('switchboard.azure_util.print')
     def test_record_object_manifest(self, mock_print):
         files_manifest = [{"name": "file1.txt"}]
         self.transfer.record_object_manifest(files_manifest)
         self.delivery.refresh_from_db()
         self.assertEqual(self.delivery.transfer_state, AzTransferStates.CREATED_MANIFEST)
-        self.assertIn('[{"name": "file1.txt"}]', self.delivery.manifest.content)
+        self.assertEqual(list(self.delivery.manifest.iter_entries()), [{"name": "file1.txt"}])
+        header = self.delivery.manifest.get_header()
+        self.assertEqual(header['delivery'], self.delivery.id)
+        self.assertEqual(header['entry_count'], 1)
         mock_print.assert_called_with('Recorded object manifest for {}.'.format(self.delivery.id))
 
     @patch('switchboard.azure_util.print')
@@ -246,6 +370,15 @@ class TestAzureTransfer(TestCase):
         mock_message_factory.return_value.make_processed_message.return_value.send.assert_called_with()
         mock_print.assert_called_with('Notifying receiver transfer of delivery {} is complete.'.format(self.delivery.id))
 
+    @patch('switchboard.azure_util.print')
+    @patch('switchboard.azure_util.AzMessageFactory')
+    def test_email_sender_and_recipient_share_message_factory(self, mock_message_factory, mock_print):
+        mock_message_factory.return_value.make_processed_message.return_value = Mock(email_text="email")
+        self.transfer.email_sender()
+        self.transfer.email_recipient()
+        self.assertEqual(mock_message_factory.call_count, 1)
+        self.assertEqual(mock_message_factory.return_value.make_processed_message.call_count, 2)
+
     @patch('switchboard.azure_util.print')
     def test_mark_complete(self, mock_print):
         self.transfer.mark_complete()
@@ -254,6 +387,119 @@ class TestAzureTransfer(TestCase):
         self.assertEqual(self.delivery.state, State.ACCEPTED)
         mock_print.assert_called_with("Marking delivery {} complete.".format(self.delivery.id))
 
+    def test_complete_transfer(self):
+        self.transfer.record_object_manifest = Mock()
+        self.transfer.give_download_users_permissions = Mock()
+        self.transfer.get_permissions_warning_message = Mock(return_value='Failed to give access to user3')
+        self.transfer.email_sender = Mock()
+        self.transfer.email_recipient = Mock()
+        self.transfer.mark_complete = Mock()
+        self.transfer.complete_transfer([{'name': 'file1.txt'}])
+        self.transfer.record_object_manifest.assert_called_with([{'name': 'file1.txt'}])
+        self.transfer.give_download_users_permissions.assert_called_with()
+        self.transfer.email_sender.assert_called_with('Failed to give access to user3')
+        self.transfer.email_recipient.assert_called_with()
+        self.transfer.mark_complete.assert_called_with()
+
+    def test_complete_transfer_resumes_from_transfer_state(self):
+        self.transfer.record_object_manifest = Mock()
+        self.transfer.give_download_users_permissions = Mock()
+        self.transfer.email_sender = Mock()
+        self.transfer.email_recipient = Mock()
+        self.transfer.mark_complete = Mock()
+        self.transfer.delivery.transfer_state = AzTransferStates.EMAILED_SENDER
+        self.transfer.complete_transfer([{'name': 'file1.txt'}])
+        self.transfer.record_object_manifest.assert_not_called()
+        self.transfer.give_download_users_permissions.assert_not_called()
+        self.transfer.email_sender.assert_not_called()
+        self.transfer.email_recipient.assert_called_with()
+        self.transfer.mark_complete.assert_called_with()
+
+    @patch('switchboard.azure_util.print')
+    @patch('switchboard.azure_util.get_file_system_client')
+    @patch('switchboard.azure_util.AzureAclPropagation')
+    @patch('switchboard.azure_util.DefaultAzureCredential')
+    @patch('switchboard.azure_util.get_user_object_id')
+    def test_give_download_users_permissions(self, mock_get_user_object_id, mock_default_azure_credential,
+                                             mock_acl_propagation, mock_get_file_system_client, mock_print):
+        mock_get_user_object_id.side_effect = lambda netid, credential: 'oid-' + netid
+        self.transfer.give_download_users_permissions()
+        mock_get_user_object_id.assert_has_calls([
+            call('user2', mock_default_azure_credential.return_value),
+            call('user3', mock_default_azure_credential.return_value),
+            call('user4', mock_default_azure_credential.return_value),
+        ])
+        mock_get_file_system_client.assert_called_with(self.delivery.destination_project.container_url)
+        mock_acl_propagation.return_value.run.assert_called_with([
+            ('user2', 'oid-user2', 'rwx'), ('user3', 'oid-user3', 'r-x'), ('user4', 'oid-user4', 'r-x')
+        ])
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.transfer_state, AzTransferStates.ADDED_DOWNLOAD_USERS)
+
+    @patch('switchboard.azure_util.print')
+    @patch('switchboard.azure_util.get_file_system_client')
+    @patch('switchboard.azure_util.AzureAclPropagation')
+    @patch('switchboard.azure_util.DefaultAzureCredential')
+    @patch('switchboard.azure_util.get_user_object_id')
+    def test_give_download_users_permissions_unknown_user(self, mock_get_user_object_id,
+                                                          mock_default_azure_credential, mock_acl_propagation,
+                                                          mock_get_file_system_client, mock_print):
+        def get_user_object_id(netid, credential):
+            if netid == 'user3':
+                raise AzUserNotFound('No Azure user found for netid user3')
+            return 'oid-' + netid
+        mock_get_user_object_id.side_effect = get_user_object_id
+        self.transfer.give_download_users_permissions()
+        mock_acl_propagation.return_value.run.assert_called_with([
+            ('user2', 'oid-user2', 'rwx'), ('user4', 'oid-user4', 'r-x')
+        ])
+        acl_update = AzAclUpdate.objects.get(delivery=self.delivery, user_id='user3')
+        self.assertEqual(acl_update.path, 'user2/mouse')
+        self.assertEqual(acl_update.permissions, 'r-x')
+        self.assertEqual(acl_update.complete, True)
+        self.assertEqual(acl_update.error_message, 'No Azure user found for netid user3')
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.transfer_state, AzTransferStates.ADDED_DOWNLOAD_USERS)
+        self.assertEqual(self.transfer.get_permissions_warning_message(), 'Failed to give access to user3')
+
+    @patch('switchboard.azure_util.print')
+    @patch('switchboard.azure_util.get_file_system_client')
+    @patch('switchboard.azure_util.AzureAclPropagation')
+    @patch('switchboard.azure_util.get_user_object_id')
+    def test_give_download_users_permissions_local(self, mock_get_user_object_id, mock_acl_propagation,
+                                                   mock_get_file_system_client, mock_print):
+        with self.settings(AZURE_TRANSFER_EXECUTOR='local'):
+            self.transfer.give_download_users_permissions()
+        mock_get_user_object_id.assert_not_called()
+        mock_acl_propagation.return_value.run.assert_called_with([
+            ('user2', 'user2', 'rwx'), ('user3', 'user3', 'r-x'), ('user4', 'user4', 'r-x')
+        ])
+
+    @patch('switchboard.azure_util.settings')
+    @patch('switchboard.azure_util.GraphClient')
+    def test_get_user_object_id(self, mock_graph_client, mock_settings):
+        mock_settings.USERNAME_EMAIL_HOST = 'sample.com'
+        mock_graph_client.return_value.get.return_value = Mock(status_code=200,
+                                                               json=Mock(return_value={'id': 'oid-user3'}))
+        credential = Mock()
+        self.assertEqual(get_user_object_id('user3', credential), 'oid-user3')
+        mock_graph_client.assert_called_with(credential=credential)
+        mock_graph_client.return_value.get.assert_called_with('/users/user3@sample.com', params={'$select': 'id'})
+
+        mock_graph_client.return_value.get.return_value = Mock(status_code=404)
+        with self.assertRaises(AzUserNotFound):
+            get_user_object_id('user3', credential)
+
+    def test_get_permissions_warning_message(self):
+        self.assertEqual(self.transfer.get_permissions_warning_message(), '')
+        AzAclUpdate.objects.create(delivery=self.delivery, user_id='user2', permissions='rwx', path='user2/mouse',
+                                   complete=True)
+        AzAclUpdate.objects.create(delivery=self.delivery, user_id='user4', permissions='r-x', path='user2/mouse',
+                                   complete=True, error_message='Bad user')
+        AzAclUpdate.objects.create(delivery=self.delivery, user_id='user3', permissions='r-x', path='user2/mouse/data',
+                                   complete=True, failure_count=2)
+        self.assertEqual(self.transfer.get_permissions_warning_message(), 'Failed to give access to user3, user4')
+
     def test_set_failed_and_record_exception(self):
         self.transfer.set_failed_and_record_exception(ValueError("Oops"))
         error = AzDeliveryError.objects.first()
@@ -286,6 +532,64 @@ class TestAzureTransfer(TestCase):
         )
         self.assertEqual(self.transfer.delivery.transfer_uuid, str(my_uuid))
 
+    @patch('switchboard.azure_util.requests')
+    @patch('switchboard.azure_util.get_local_transfer_executor')
+    @patch('switchboard.azure_util.settings')
+    def test_notify_transfer_service_local_executor(self, mock_settings, mock_get_local_transfer_executor,
+                                                    mock_requests):
+        mock_settings.AZURE_TRANSFER_EXECUTOR = 'local'
+        self.transfer.notify_transfer_service()
+        mock_requests.post.assert_not_called()
+        mock_get_local_transfer_executor.return_value.submit.assert_called_with(
+            self.transfer.delivery.id, self.transfer.delivery.transfer_uuid,
+            'https://fromacct.blob.core.windows.net/fromcontainer', 'user1/mouse',
+            'https://toacct.blob.core.windows.net/tocontainer', 'user2/mouse')
+
+
+class TestManifestChunkUpload(TestCase):
+    def setUp(self):
+        self.delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path="user1/mouse", container_url="http://127.0.0.1"),
+            from_netid='user1',
+            to_netid='user2',
+        )
+        self.transfer_uuid = uuid.uuid4()
+
+    def test_iter_ndjson_entries(self):
+        lines = [b'{"name": "file1.txt"}\n', b'  \n', b'{"name": "file2.txt"}']
+        self.assertEqual(list(iter_ndjson_entries(lines)), [{'name': 'file1.txt'}, {'name': 'file2.txt'}])
+        with self.assertRaises(ValueError) as raised_exception:
+            list(iter_ndjson_entries([b'{"name": "file1.txt"}', b'[bad']))
+        self.assertEqual(str(raised_exception.exception), 'Invalid JSON on line 2.')
+
+    def test_save_splits_into_parts(self):
+        chunk_upload = AzTransferManifestChunkUpload(self.delivery, self.transfer_uuid, chunk_number=3, part_size=2)
+        entry_count = chunk_upload.save(iter([{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]))
+        self.assertEqual(entry_count, 3)
+        parts = AzTransferManifestPart.objects.filter(chunk_number=3).order_by('sequence')
+        self.assertEqual([(part.sequence, part.get_entries()) for part in parts], [
+            (0, [{'name': 'a'}, {'name': 'b'}]),
+            (1, [{'name': 'c'}]),
+        ])
+
+    def test_save_empty_chunk(self):
+        chunk_upload = AzTransferManifestChunkUpload(self.delivery, self.transfer_uuid, chunk_number=0)
+        self.assertEqual(chunk_upload.save([]), 0)
+        self.assertEqual(AzTransferManifestChunkUpload.get_missing_chunk_numbers(
+            self.delivery, self.transfer_uuid, chunk_count=3), [1, 2])
+
+    def test_get_missing_chunk_numbers(self):
+        for chunk_number in [0, 2, 3, 7]:
+            AzTransferManifestChunkUpload(self.delivery, self.transfer_uuid, chunk_number).save([])
+        self.assertEqual(AzTransferManifestChunkUpload.get_missing_chunk_numbers(
+            self.delivery, self.transfer_uuid, chunk_count=4), [1])
+        self.assertEqual(AzTransferManifestChunkUpload.get_missing_chunk_numbers(
+            self.delivery, self.transfer_uuid, chunk_count=10), [1, 4, 5, 6, 8, 9])
+        self.assertEqual(AzTransferManifestChunkUpload.get_missing_chunk_numbers(
+            self.delivery, self.transfer_uuid, chunk_count=10 ** 10, limit=3), [1, 4, 5])
+        self.assertEqual(AzTransferManifestChunkUpload.get_missing_chunk_numbers(
+            self.delivery, self.transfer_uuid, chunk_count=1), [])
+
 
 class TestAzureProjectSummary(TestCase):
     def test_apply_path_dict(self):
@@ -324,22 +628,303 @@ class TestAzureProjectSummary(TestCase):
         self.assertEqual(summary.sub_folder_count, 1)
 
 
+class FakeFileSystemClient(object):
+    """
+    Local stand-in for a Data Lake FileSystemClient that lists paths from memory.
+    """
+    def __init__(self, paths):
+        self.paths = [Mock(is_directory=is_directory, content_length=content_length) for _, is_directory, content_length
+                      in paths]
+        for path, (name, _, _) in zip(self.paths, paths):
+            path.name = name
+        self.get_paths_calls = []
+
+    def get_paths(self, path, recursive):
+        self.get_paths_calls.append((path, recursive))
+        prefix = path + '/'
+        for item in self.paths:
+            if item.name.startswith(prefix) and (recursive or '/' not in item.name[len(prefix):]):
+                yield item
+
+
+class TestAzureAclPropagation(TestCase):
+    def setUp(self):
+        self.delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path="user1/mouse", container_url="http://127.0.0.1"),
+            destination_project=AzContainerPath.objects.create(path="user2/mouse", container_url="http://127.0.0.1"),
+            from_netid='user1',
+            to_netid='user2',
+        )
+        self.file_system_client = FakeFileSystemClient([
+            ('user2/mouse/README', False, 10),
+            ('user2/mouse/data', True, None),
+            ('user2/mouse/data/file1.txt', False, 100),
+        ])
+        self.project_client = Mock()
+        self.project_client.get_access_control.return_value = {'acl': 'user::rwx,group::r-x,other::---'}
+        self.directory_client = Mock()
+        self.directory_client.update_access_control_recursive.side_effect = [
+            Mock(continuation='token1', counters=Mock(failure_count=0)),
+            Mock(continuation=None, counters=Mock(failure_count=2)),
+        ]
+        self.file_client = Mock()
+        self.file_client.update_access_control_recursive.return_value = Mock(continuation=None,
+                                                                             counters=Mock(failure_count=0))
+        self.file_system_client.get_directory_client = Mock(side_effect=lambda path: {
+            'user2/mouse': self.project_client,
+            'user2/mouse/data': self.directory_client,
+        }[path])
+        self.file_system_client.get_file_client = Mock(return_value=self.file_client)
+        self.acl_propagation = AzureAclPropagation(self.delivery, self.file_system_client, max_workers=2,
+                                                   batch_size=100)
+
+    def test_run(self):
+        self.acl_propagation.run([('user3', 'oid3', 'r-x')])
+        self.project_client.set_access_control.assert_called_with(
+            acl='user::rwx,group::r-x,other::---,user:oid3:r-x,default:user:oid3:r-x')
+        self.directory_client.update_access_control_recursive.assert_has_calls([
+            call(acl='user:oid3:r-x,default:user:oid3:r-x', continuation_token=None, batch_size=100,
+                 max_batches=1, continue_on_failure=True),
+            call(acl='user:oid3:r-x,default:user:oid3:r-x', continuation_token='token1', batch_size=100,
+                 max_batches=1, continue_on_failure=True),
+        ])
+        self.file_system_client.get_file_client.assert_called_with('user2/mouse/README')
+        self.file_client.update_access_control_recursive.assert_called_with(
+            acl='user:oid3:r-x', continuation_token=None, batch_size=100, max_batches=1, continue_on_failure=True)
+        acl_updates = AzAclUpdate.objects.filter(delivery=self.delivery).order_by('path')
+        self.assertEqual([(acl_update.path, acl_update.complete, acl_update.failure_count, acl_update.continuation_token)
+                          for acl_update in acl_updates], [
+            ('user2/mouse', True, 0, ''),
+            ('user2/mouse/README', True, 0, ''),
+            ('user2/mouse/data', True, 2, ''),
+        ])
+        self.assertEqual(set(acl_update.user_id for acl_update in acl_updates), {'user3'})
+
+    def test_run_resumes_from_checkpoint(self):
+        AzAclUpdate.objects.create(delivery=self.delivery, user_id='user3', permissions='r-x', path='user2/mouse',
+                                   complete=True)
+        AzAclUpdate.objects.create(delivery=self.delivery, user_id='user3', permissions='r-x',
+                                   path='user2/mouse/README', is_directory=False, complete=True)
+        AzAclUpdate.objects.create(delivery=self.delivery, user_id='user3', permissions='r-x', path='user2/mouse/data',
+                                   continuation_token='token1')
+        self.directory_client.update_access_control_recursive.side_effect = None
+        self.directory_client.update_access_control_recursive.return_value = Mock(continuation=None,
+                                                                                  counters=Mock(failure_count=0))
+        self.acl_propagation.run([('user3', 'oid3', 'r-x')])
+        self.project_client.set_access_control.assert_not_called()
+        self.file_client.update_access_control_recursive.assert_not_called()
+        self.directory_client.update_access_control_recursive.assert_called_once_with(
+            acl='user:oid3:r-x,default:user:oid3:r-x', continuation_token='token1', batch_size=100,
+            max_batches=1, continue_on_failure=True)
+
+    def test_run_records_rejected_user(self):
+        error = HttpResponseError('Invalid ACL')
+        error.status_code = 400
+        self.project_client.set_access_control.side_effect = error
+        self.acl_propagation.run([('baduser', 'oid9', 'r-x')])
+        acl_update = AzAclUpdate.objects.get(delivery=self.delivery, path='user2/mouse')
+        self.assertEqual(acl_update.complete, True)
+        self.assertTrue(acl_update.has_failures())
+
+    def test_run_raises_service_errors(self):
+        error = HttpResponseError('Server busy')
+        error.status_code = 503
+        self.project_client.set_access_control.side_effect = error
+        with self.assertRaises(HttpResponseError):
+            self.acl_propagation.run([('user3', 'oid3', 'r-x')])
+
+    def test_merge_acl(self):
+        self.assertEqual(merge_acl('user::rwx,user:user3:r--', 'user:user3:r-x,default:user:user3:r-x'),
+                         'user::rwx,user:user3:r-x,default:user:user3:r-x')
+
+
+class TestCreateProjectSummary(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.delivery = AzDelivery.objects.create(
+            source_project=AzContainerPath.objects.create(path="user1/mouse", container_url="http://127.0.0.1"),
+            from_netid='user1',
+            to_netid='user2',
+        )
+        self.file_system_client = FakeFileSystemClient([
+            ('user1/mouse/README', False, 10),
+            ('user1/mouse/data', True, None),
+            ('user1/mouse/data/file1.txt', False, 100),
+            ('user1/mouse/data/raw', True, None),
+            ('user1/mouse/data/raw/file2.txt', False, 1000),
+            ('user1/mouse/results', True, None),
+            ('user1/mouse/results/file3.txt', False, 10000),
+            ('user1/rat/other.txt', False, 5),
+        ])
+
+    def test_build(self):
+        builder = AzureProjectSummaryBuilder(self.file_system_client, max_workers=2)
+        summary = builder.build(self.delivery.id, 'user1/mouse')
+        self.assertEqual(summary.total_size, 11110)
+        self.assertEqual(summary.file_count, 4)
+        self.assertEqual(summary.folder_count, 3)
+        self.assertEqual(summary.root_folder_count, 2)
+        self.assertEqual(summary.sub_folder_count, 1)
+        self.assertEqual(sorted(self.file_system_client.get_paths_calls), [
+            ('user1/mouse', False), ('user1/mouse/data', True), ('user1/mouse/results', True)
+        ])
+
+    def test_create_project_summary_is_cached_by_state(self):
+        summary = create_project_summary(self.delivery, self.file_system_client)
+        self.assertEqual(summary.file_count, 4)
+        self.assertEqual(summary.error_msg, None)
+        self.assertEqual(len(self.file_system_client.get_paths_calls), 3)
+
+        summary = create_project_summary(self.delivery, self.file_system_client)
+        self.assertEqual(summary.file_count, 4)
+        self.assertEqual(len(self.file_system_client.get_paths_calls), 3)
+
+        self.delivery.mark_notified('email text')
+        create_project_summary(self.delivery, self.file_system_client)
+        self.assertEqual(len(self.file_system_client.get_paths_calls), 6)
+
+    @patch('switchboard.azure_util.traceback')
+    def test_create_project_summary_error(self, mock_traceback):
+        file_system_client = Mock()
+        file_system_client.get_paths.side_effect = AzureError('Forbidden')
+        summary = create_project_summary(self.delivery, file_system_client)
+        self.assertEqual(summary.error_msg, 'Unable to determine due to permission limitations.')
+        self.assertEqual(cache.get(get_project_summary_cache_key(self.delivery)), None)
+
+    @patch('switchboard.azure_util.DataLakeServiceClient')
+    @patch('switchboard.azure_util.settings')
+    def test_get_file_system_client(self, mock_settings, mock_data_lake_service_client):
+        mock_settings.AZURE_STORAGE_ACCOUNT_KEY = 'secret'
+        get_file_system_client('https://myacct.blob.core.windows.net/mycontainer')
+        mock_data_lake_service_client.assert_called_with('https://myacct.dfs.core.windows.net', credential='secret')
+        mock_data_lake_service_client.return_value.get_file_system_client.assert_called_with('mycontainer')
+
+        get_file_system_client('http://127.0.0.1:10000/devstoreaccount1/mycontainer')
+        mock_data_lake_service_client.assert_called_with('http://127.0.0.1:10000/devstoreaccount1',
+                                                         credential='secret')
+
+        with self.assertRaises(ValueError):
+            get_file_system_client('file:///tmp/benchmark/mycontainer')
+        mock_settings.AZURE_TRANSFER_EXECUTOR = 'local'
+        file_system_client = get_file_system_client('file:///tmp/benchmark/mycontainer')
+        self.assertIsInstance(file_system_client, LocalFileSystemClient)
+        self.assertEqual(file_system_client.root, '/tmp/benchmark/mycontainer')
+
+
 class TestGlobalFunctions(TestCase):
     def test_decompose_dfs_url(self):
         acct, container = decompose_dfs_url("https://myacct.dfs.core.windows.net/my-container")
         self.assertEqual(acct, 'myacct')
         self.assertEqual(container, 'my-container')
 
-    @patch('switchboard.azure_util.requests')
     @patch('switchboard.azure_util.settings')
-    def test_get_container_details(self, mock_settings, mock_requests):
+    def test_fetch_container_details(self, mock_settings):
         mock_settings.AZURE_SAAS_KEY = 'mykey'
         mock_settings.AZURE_SAAS_URL = 'myurl'
-        response = Mock()
-        response.json.return_value = { "result": "ok"}
-        mock_requests.get.return_value = response
+        mock_settings.AZURE_SAAS_TIMEOUT = 5
+        session = Mock()
+        session.get.return_value = Mock(status_code=200)
+        session.get.return_value.json.return_value = {"result": "ok"}
+        details = fetch_container_details(session, 'myacct', 'my-container')
+        self.assertEqual(details, {"result": "ok"})
+        session.get.assert_called_with('myurl/api/FileSystems/myacct/my-container',
+                                       headers={'Saas-FileSystems-Api-Key': 'mykey'},
+                                       timeout=5)
+        session.get.return_value = Mock(status_code=404)
+        self.assertEqual(fetch_container_details(session, 'myacct', 'my-container'), None)
+
+    @patch('switchboard.azure_util.container_details_cache')
+    def test_get_container_details(self, mock_container_details_cache):
+        mock_container_details_cache.get.return_value = {"result": "ok"}
         details = get_container_details("https://myacct.dfs.core.windows.net/my-container")
         self.assertEqual(details, {"result": "ok"})
-        mock_requests.get.assert_called_with('myurl/api/FileSystems/myacct/my-container',
-                                             headers={'Saas-FileSystems-Api-Key': 'mykey'},
-                                             timeout=1)
+        mock_container_details_cache.get.assert_called_with("https://myacct.dfs.core.windows.net/my-container")
+
+    @patch('switchboard.azure_util.container_details_cache')
+    def test_get_container_details_local(self, mock_container_details_cache):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, 'user1@duke.edu'))
+            with self.settings(AZURE_TRANSFER_EXECUTOR='local'):
+                details = get_container_details('file://' + os.path.join(temp_dir, 'user1@duke.edu'))
+                self.assertEqual(details, {'owner': 'user1@duke.edu'})
+                self.assertEqual(get_container_details('file://' + os.path.join(temp_dir, 'missing')), None)
+        mock_container_details_cache.get.assert_not_called()
+
+    @patch('switchboard.azure_util.get_user_for_netid')
+    def test_get_directory_user(self, mock_get_user_for_netid):
+        self.assertEqual(get_directory_user('user1'), mock_get_user_for_netid.return_value)
+        mock_get_user_for_netid.assert_called_with('user1')
+        mock_get_user_for_netid.reset_mock()
+        with self.settings(AZURE_TRANSFER_EXECUTOR='local', USERNAME_EMAIL_HOST='duke.edu'):
+            user = get_directory_user('user1')
+        self.assertEqual(user.username, 'user1')
+        self.assertEqual(user.email, 'user1@duke.edu')
+        mock_get_user_for_netid.assert_not_called()
+
+
+@patch('switchboard.azure_util.settings', AZURE_SAAS_CACHE_SECONDS=100, AZURE_SAAS_NEGATIVE_CACHE_SECONDS=10,
+       AZURE_SAAS_STALE_SECONDS=1000)
+@patch('switchboard.azure_util.fetch_container_details')
+class TestContainerDetailsCache(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = ContainerDetailsCache(clock=lambda: self.now)
+        self.url = "https://myacct.dfs.core.windows.net/my-container"
+
+    def test_get_caches_details(self, mock_fetch_container_details, mock_settings):
+        mock_fetch_container_details.return_value = {'owner': 'user1'}
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user1'})
+        self.now = 50
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user1'})
+        mock_fetch_container_details.assert_called_once_with(ANY, 'myacct', 'my-container')
+        self.now = 101
+        mock_fetch_container_details.return_value = {'owner': 'user2'}
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user2'})
+
+    def test_get_caches_not_found_for_less_time(self, mock_fetch_container_details, mock_settings):
+        mock_fetch_container_details.return_value = None
+        self.assertEqual(self.cache.get(self.url), None)
+        self.now = 9
+        self.assertEqual(self.cache.get(self.url), None)
+        self.assertEqual(mock_fetch_container_details.call_count, 1)
+        self.now = 11
+        mock_fetch_container_details.return_value = {'owner': 'user1'}
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user1'})
+
+    def test_get_uses_stale_details_when_unavailable(self, mock_fetch_container_details, mock_settings):
+        mock_fetch_container_details.return_value = {'owner': 'user1'}
+        self.cache.get(self.url)
+        mock_fetch_container_details.side_effect = requests.exceptions.ReadTimeout()
+        self.now = 500
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user1'})
+        self.now = 1001
+        with self.assertRaises(AzSaaSUnavailable):
+            self.cache.get(self.url)
+
+    def test_get_unavailable_without_cached_details(self, mock_fetch_container_details, mock_settings):
+        mock_fetch_container_details.side_effect = requests.exceptions.ConnectionError()
+        with self.assertRaises(AzSaaSUnavailable):
+            self.cache.get(self.url)
+
+    @patch('switchboard.azure_util.threading.Thread')
+    def test_get_refreshes_hot_entries(self, mock_thread, mock_fetch_container_details, mock_settings):
+        mock_fetch_container_details.return_value = {'owner': 'user1'}
+        self.cache.get(self.url)
+        self.now = 50
+        self.cache.get(self.url)
+        mock_thread.assert_not_called()
+
+        self.now = 80
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user1'})
+        self.assertEqual(mock_thread.call_count, 1)
+        # only one refresh is started at a time
+        self.cache.get(self.url)
+        self.assertEqual(mock_thread.call_count, 1)
+
+        # run the refresh
+        mock_fetch_container_details.return_value = {'owner': 'user2'}
+        refresh_kwargs = mock_thread.call_args[1]
+        refresh_kwargs['target'](*refresh_kwargs['args'])
+        self.now = 150
+        self.assertEqual(self.cache.get(self.url), {'owner': 'user2'})
+        self.assertEqual(mock_fetch_container_details.call_count, 2)
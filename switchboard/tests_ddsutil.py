@@ -1,13 +1,26 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from gcb_web_auth.models import DDSEndpoint
-from mock import patch, Mock, MagicMock, call
+from mock import patch, Mock, MagicMock, call, ANY
 
 from d4s2_api.models import User, Share, State, DDSDeliveryShareUser, DDSDelivery, ShareRole, EmailTemplateSet, \
-    UserEmailTemplateSet, EmailTemplate, EmailTemplateType
+    UserEmailTemplateSet, EmailTemplate, EmailTemplateType, DDSProjectTransferRecord, DDSProjectTransferSyncState, \
+    DDSTransferStates, DDSObjectManifest, DDSObjectManifestChunk
 from switchboard.dds_util import DDSUtil, DeliveryDetails, DeliveryUtil, DDSDeliveryType, \
     SHARE_IN_RESPONSE_TO_DELIVERY_MSG, PROJECT_ADMIN_ID, DDSProject, DDSProjectPermissions, \
     DDS_PERMISSIONS_ID_SEP, MessageDirection, DDSUser, DDSAuthProvider, DDSAffiliate, DDSProjectSummary, \
-    DataServiceError, DDSNotRecipientException, DDSProjectTransfer, create_email_from_username
+    DataServiceError, DDSNotRecipientException, DDSProjectTransfer, create_email_from_username, RemoteStoreCache, \
+    remote_store_cache, get_token_expiration, DDSUserCache, DDSProjectTransferSync, DDSResultsIterator, DDSListFilter, \
+    DDSTransfer, DDSTransferFunctions, DDSProjectSummaryFunctions, DDSProjectManifest, DDSManifestFunctions, \
+    DDSUnavailable, DDSCircuitBreaker, DDSCircuitBreakerSession, get_dds_endpoint_name, record_object_manifest, \
+    dds_user_cache
+from ddsc.core.ddsapi import DataServiceApi
+from background_task.tasks import tasks
+from django.utils import timezone
+import datetime
+from gcb_web_auth.models import DDSUserCredential, DukeDSAPIToken
+import jwt
+import threading
 
 
 class CreateEmailTestCase(TestCase):
@@ -34,6 +47,22 @@ class DDSUtilTestCase(TestCase):
         mock_get_dds_token = patcher.start()
         mock_get_dds_token.return_value = MagicMock(key='sometoken')
         self.addCleanup(patcher.stop)
+        remote_store_cache.clear()
+        self.addCleanup(remote_store_cache.clear)
+
+    @patch('switchboard.dds_util.RemoteStore')
+    def test_remote_store_shared_between_instances(self, mockRemoteStore):
+        self.assertEqual(DDSUtil(self.user).remote_store, mockRemoteStore.return_value)
+        self.assertEqual(DDSUtil(self.user).remote_store, mockRemoteStore.return_value)
+        self.assertEqual(mockRemoteStore.call_count, 1)
+
+    @patch('switchboard.dds_util.RemoteStore')
+    def test_connect(self, mockRemoteStore):
+        dds_util = DDSUtil(self.user)
+        self.assertEqual(dds_util.connect(), mockRemoteStore.return_value)
+        dds_util.connect()
+        self.assertEqual(dds_util.remote_store, mockRemoteStore.return_value)
+        self.assertEqual(mockRemoteStore.call_count, 1)
 
     @patch('switchboard.dds_util.RemoteStore')
     def testGetEmail(self, mockRemoteStore):
@@ -151,12 +180,63 @@ class DDSUtilTestCase(TestCase):
         self.assertEqual(children, mock_children)
         self.assertEqual(mock_remote_store.data_service.get_project_children.call_args, call('123', ''))
 
+    def test_get_project_children_page(self):
+        dds_util = DDSUtil(user=Mock())
+        mock_remote_store = Mock()
+        dds_util._remote_store = mock_remote_store
+        response = dds_util.get_project_children_page('123', 2, 500)
+        self.assertEqual(response, mock_remote_store.data_service._get_single_page.return_value)
+        mock_remote_store.data_service._get_single_page.assert_called_with(
+            '/projects/123/children', {'name_contains': '', 'exclude_response_fields': 'audit ancestors project'},
+            2, 500)
+
+    def test_get_single_page_with_installed_data_service_api(self):
+        # Uses the real DukeDSClient DataServiceApi so a change to its private _get_single_page is caught
+        mock_http = Mock()
+        mock_http.get.return_value = Mock(status_code=200, headers={'x-total-pages': '3'})
+        mock_auth = Mock(**{'get_auth.return_value': 'secret-token'})
+        dds_util = DDSUtil(user=Mock())
+        dds_util._remote_store = Mock(data_service=DataServiceApi(mock_auth, 'https://dds.example.com/api/v1',
+                                                                  http=mock_http))
+
+        response = dds_util.get_users_page(2, 100, username='joe')
+        self.assertEqual(response, mock_http.get.return_value)
+        mock_http.get.assert_called_with('https://dds.example.com/api/v1/users', headers=ANY,
+                                         params={'username': 'joe', 'page': 2, 'per_page': 100})
+        self.assertEqual(mock_http.get.call_args[1]['headers']['Authorization'], 'secret-token')
+
+        dds_util.get_projects_page(1, 50)
+        mock_http.get.assert_called_with('https://dds.example.com/api/v1/projects', headers=ANY,
+                                         params={'page': 1, 'per_page': 50})
+
+        dds_util.get_project_children_page('123', 3, 500)
+        mock_http.get.assert_called_with('https://dds.example.com/api/v1/projects/123/children', headers=ANY,
+                                         params={'name_contains': '',
+                                                 'exclude_response_fields': 'audit ancestors project',
+                                                 'page': 3, 'per_page': 500})
+
     def test_cancel_project_transfer(self):
         dds_util = DDSUtil(user=Mock())
         mock_remote_store = Mock()
         dds_util._remote_store = mock_remote_store
         dds_util.cancel_project_transfer(transfer_id='123')
 
+    def test_accept_project_transfer_records_transfer(self):
+        dds_util = DDSUtil(user=Mock())
+        mock_remote_store = Mock()
+        mock_remote_store.data_service.accept_project_transfer.return_value.json.return_value = {
+            'id': '123', 'status': 'accepted', 'from_user': {'id': 'user1'}, 'to_users': [{'id': 'user2'}],
+            'audit': {'created_on': '2019-01-01T10:00:00Z'},
+        }
+        dds_util._remote_store = mock_remote_store
+        transfer_dict = dds_util.accept_project_transfer(transfer_id='123')
+        self.assertEqual(transfer_dict['status'], 'accepted')
+        record = DDSProjectTransferRecord.objects.get(transfer_id='123')
+        self.assertEqual(record.status, 'accepted')
+        self.assertEqual(record.from_user_id, 'user1')
+        self.assertEqual(record.to_user_ids, ['user2'])
+        self.assertEqual(record.created_on.year, 2019)
+
     def test_get_users_no_filter(self):
         mock_user = Mock(name='joe')
         dds_util = DDSUtil(user=Mock())
@@ -218,7 +298,102 @@ class DDSUtilTestCase(TestCase):
         mock_remote_store.data_service.auth_provider_add_user.assert_called_with('provider1', 'user1')
 
 
+@patch('switchboard.dds_util.settings', DDS_CLIENT_CACHE_SIZE=2, DDS_CLIENT_CACHE_SECONDS=3600,
+       DDS_TOKEN_EXPIRATION_MARGIN_SECONDS=300)
+@patch('switchboard.dds_util.RemoteStore')
+@patch('switchboard.dds_util.make_auth_config')
+@patch('switchboard.dds_util.get_dds_token')
+class RemoteStoreCacheTestCase(TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.cache = RemoteStoreCache(clock=lambda: self.now)
+        self.user1 = User.objects.create(username='user1')
+        self.user2 = User.objects.create(username='user2')
+        self.user3 = User.objects.create(username='user3')
+
+    def test_get_reuses_remote_store(self, mock_get_dds_token, mock_make_auth_config, mock_remote_store,
+                                     mock_settings):
+        mock_get_dds_token.return_value = Mock(key='sometoken')
+        mock_remote_store.side_effect = [Mock(), Mock()]
+        remote_store1 = self.cache.get(self.user1)
+        self.assertEqual(self.cache.get(self.user1), remote_store1)
+        self.assertNotEqual(self.cache.get(self.user2), remote_store1)
+        mock_get_dds_token.assert_has_calls([call(self.user1), call(self.user2)])
+        self.assertEqual(mock_get_dds_token.call_count, 2)
+        data_service1 = mock_remote_store.call_args_list[0][1]['data_service']
+        data_service2 = mock_remote_store.call_args_list[1][1]['data_service']
+        self.assertEqual(data_service1.http, data_service2.http)
+        self.assertIsInstance(data_service1.http, DDSCircuitBreakerSession)
+
+    def test_get_expires_before_token(self, mock_get_dds_token, mock_make_auth_config, mock_remote_store,
+                                      mock_settings):
+        token_key = jwt.encode({'exp': 2000}, 'secret').decode('utf-8')
+        mock_get_dds_token.return_value = Mock(key=token_key)
+        mock_remote_store.side_effect = [Mock(), Mock()]
+        remote_store = self.cache.get(self.user1)
+        self.now = 1699
+        self.assertEqual(self.cache.get(self.user1), remote_store)
+        self.now = 1700
+        self.assertNotEqual(self.cache.get(self.user1), remote_store)
+
+    def test_get_expires_after_cache_seconds(self, mock_get_dds_token, mock_make_auth_config, mock_remote_store,
+                                             mock_settings):
+        mock_get_dds_token.return_value = Mock(key='sometoken')
+        mock_remote_store.side_effect = [Mock(), Mock()]
+        remote_store = self.cache.get(self.user1)
+        self.now = 1000 + 3599
+        self.assertEqual(self.cache.get(self.user1), remote_store)
+        self.now = 1000 + 3600
+        self.assertNotEqual(self.cache.get(self.user1), remote_store)
+
+    def test_get_evicts_least_recently_used(self, mock_get_dds_token, mock_make_auth_config, mock_remote_store,
+                                            mock_settings):
+        mock_get_dds_token.return_value = Mock(key='sometoken')
+        mock_remote_store.side_effect = lambda *args, **kwargs: Mock()
+        remote_store1 = self.cache.get(self.user1)
+        self.cache.get(self.user2)
+        self.cache.get(self.user1)
+        self.cache.get(self.user3)
+        self.assertEqual(list(self.cache.entries.keys()), [self.user1.id, self.user3.id])
+        self.assertEqual(self.cache.get(self.user1), remote_store1)
+
+    @patch('switchboard.dds_util.get_dds_config_for_credentials')
+    def test_get_with_credential(self, mock_get_dds_config_for_credentials, mock_get_dds_token,
+                                 mock_make_auth_config, mock_remote_store, mock_settings):
+        endpoint = DDSEndpoint.objects.create(api_root='https://api.example.com', portal_root='https://example.com',
+                                              openid_provider_id='openid-123', openid_provider_service_id='456')
+        DDSUserCredential.objects.create(endpoint=endpoint, user=self.user1, token='secret', dds_id='dds1')
+        self.cache.get(self.user1)
+        mock_get_dds_token.assert_not_called()
+        config = mock_remote_store.call_args[0][0]
+        self.assertEqual(config, mock_get_dds_config_for_credentials.return_value)
+        self.assertEqual(self.cache.entries[self.user1.id].expires_at, 1000 + 3600)
+
+    def test_credential_changes_invalidate(self, mock_get_dds_token, mock_make_auth_config, mock_remote_store,
+                                           mock_settings):
+        mock_get_dds_token.return_value = Mock(key='sometoken')
+        remote_store_cache.clear()
+        self.addCleanup(remote_store_cache.clear)
+        with patch('switchboard.dds_util.remote_store_cache', self.cache):
+            self.cache.get(self.user1)
+            self.cache.get(self.user2)
+            token = DukeDSAPIToken.objects.create(user=self.user1, key='newtoken')
+            self.assertEqual(list(self.cache.entries.keys()), [self.user2.id])
+            self.cache.get(self.user1)
+            token.delete()
+            self.assertEqual(list(self.cache.entries.keys()), [self.user2.id])
+
+    def test_get_token_expiration(self, mock_get_dds_token, mock_make_auth_config, mock_remote_store,
+                                  mock_settings):
+        self.assertEqual(get_token_expiration(jwt.encode({'exp': 2000}, 'secret').decode('utf-8')), 2000)
+        self.assertEqual(get_token_expiration(jwt.encode({}, 'secret').decode('utf-8')), None)
+        self.assertEqual(get_token_expiration('sometoken'), None)
+
+
 class TestDeliveryDetails(TestCase):
+    def setUp(self):
+        dds_user_cache.clear()
+
     @patch('switchboard.dds_util.DDSUtil')
     @patch('switchboard.dds_util.DDSUser')
     @patch('switchboard.dds_util.DDSProjectTransfer')
@@ -290,6 +465,29 @@ class TestDeliveryDetails(TestCase):
         self.assertEqual(context['project_title'], 'SomeProject')
         self.assertEqual(context['project_url'], 'projecturl')
 
+    @patch('switchboard.dds_util.DDSUtil')
+    @patch('switchboard.dds_util.DDSUser')
+    @patch('switchboard.dds_util.DDSProjectTransfer')
+    def test_fetches_details_once(self, mock_dds_project_transfer, mock_dds_user, mock_dds_util):
+        mock_dds_project_transfer.fetch_one.return_value.project_dict = {
+            'name': 'SomeProject',
+        }
+        mock_dds_user.fetch_one.side_effect = [
+            Mock(full_name='joe', email='joe@joe.com', username='joe1'),
+            Mock(full_name='bob', email='bob@bob.com', username='bob1'),
+        ]
+        delivery = Mock(user_message='user message text', transfer_id='123')
+        details = DeliveryDetails(delivery, Mock())
+        self.assertEqual(details.get_from_user().full_name, 'joe')
+        self.assertEqual(details.get_to_user().full_name, 'bob')
+        details.get_email_context('accepturl', 'accepted', '', warning_message='')
+        context = details.get_email_context('accepturl', 'accepted_recipient', '', warning_message='')
+        self.assertEqual(context['sender_name'], 'joe')
+        self.assertEqual(context['recipient_name'], 'bob')
+        self.assertEqual(details.get_project().name, 'SomeProject')
+        self.assertEqual(mock_dds_user.fetch_one.call_count, 2)
+        self.assertEqual(mock_dds_project_transfer.fetch_one.call_count, 1)
+
     @patch('switchboard.dds_util.DDSProjectTransfer')
     @patch('switchboard.dds_util.DDSProject')
     def test_get_project_from_share(self, mock_dds_project, mock_dds_project_transfer):
@@ -329,6 +527,7 @@ class TestDeliveryDetails(TestCase):
 
 class DeliveryUtilTestCase(TestCase):
     def setUp(self):
+        dds_user_cache.clear()
         self.user = User.objects.create(username='test_user')
         self.email_template_set = EmailTemplateSet.objects.create(name='someset')
         UserEmailTemplateSet.objects.create(user=self.user, email_template_set=self.email_template_set)
@@ -380,7 +579,7 @@ class DeliveryUtilTestCase(TestCase):
         mock_ddsutil.return_value.share_project_with_user.assert_has_calls([
             call('ghi789', 'jkl888', 'file_downloader'),
             call('ghi789', 'mno999', 'file_downloader'),
-        ])
+        ], any_order=True)
 
         # each additional user should have an email sent (share record)
         share1 = Share.objects.get(to_user_id='jkl888')
@@ -392,6 +591,58 @@ class DeliveryUtilTestCase(TestCase):
         self.assertEqual(self.delivery.to_user_id, share2.from_user_id)
         self.assertEqual(State.NOTIFIED, share2.state)
 
+    @patch('switchboard.dds_util.DDSUtil')
+    @patch('switchboard.dds_util.get_connection')
+    def test_share_with_additional_users_sends_over_one_connection(self, mock_get_connection, mock_ddsutil):
+        mock_ddsutil.return_value.get_project.return_value.json.return_value = {'id': 'ghi789', 'name': 'Mouse'}
+        connection = mock_get_connection.return_value.__enter__.return_value
+        delivery_util = DeliveryUtil(self.delivery, self.user, 'file_downloader', 'Share in response to delivery.')
+        delivery_util.share_with_additional_users()
+
+        mock_get_connection.assert_called_once_with()
+        self.assertEqual(connection.send_messages.call_count, 2)
+        # Project details are fetched for the first share and reused for the second
+        mock_ddsutil.return_value.get_project.assert_called_once_with('ghi789')
+
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_share_with_additional_users_permission_fails(self, mock_ddsutil):
+        def share_project_with_user(project_id, dds_user_id, auth_role):
+            if dds_user_id == 'jkl888':
+                raise DataServiceError(response=Mock(status_code=400), url_suffix='', request_data=None)
+        mock_ddsutil.return_value.share_project_with_user.side_effect = share_project_with_user
+        mock_ddsutil.return_value.get_user.side_effect = lambda user_id: Mock(**{
+            'json.return_value': {'id': user_id, 'full_name': 'User ' + user_id}
+        })
+        delivery_util = DeliveryUtil(self.delivery, self.user, 'file_downloader', 'Share in response to delivery.')
+        delivery_util.share_with_additional_users()
+
+        self.assertEqual(delivery_util.failed_share_users, ['User jkl888'])
+        self.assertFalse(Share.objects.filter(to_user_id='jkl888').exists())
+        self.assertEqual(Share.objects.get(to_user_id='mno999').state, State.NOTIFIED)
+
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_share_with_additional_users_retry_after_partial_share(self, mock_ddsutil):
+        Share.objects.create(project_id='ghi789', from_user_id=self.delivery.to_user_id, to_user_id='jkl888',
+                             state=State.NOTIFIED)
+        unsent_share = Share.objects.create(project_id='ghi789', from_user_id=self.delivery.to_user_id,
+                                            to_user_id='mno999', role='file_downloader',
+                                            email_template_set=self.delivery.email_template_set)
+        delivery_util = DeliveryUtil(self.delivery, self.user, 'file_downloader', 'Share in response to delivery.')
+        delivery_util.share_with_additional_users()
+
+        mock_ddsutil.return_value.share_project_with_user.assert_called_once_with(
+            'ghi789', 'mno999', 'file_downloader')
+        self.assertEqual(Share.objects.filter(to_user_id='jkl888').count(), 1)
+        self.assertEqual(Share.objects.filter(to_user_id='mno999').count(), 1)
+        unsent_share.refresh_from_db()
+        self.assertEqual(unsent_share.state, State.NOTIFIED)
+
+        # Once every user has been notified a retry does nothing
+        mock_ddsutil.return_value.share_project_with_user.reset_mock()
+        delivery_util.share_with_additional_users()
+        self.assertFalse(mock_ddsutil.return_value.share_project_with_user.called)
+        self.assertEqual(Share.objects.count(), 2)
+
     def test_get_warning_message(self):
         delivery_util = DeliveryUtil(self.delivery, self.user, 'file_downloader', 'Share in response to delivery.')
         self.assertEqual(delivery_util.get_warning_message(), '')
@@ -407,6 +658,16 @@ class DeliveryUtilTestCase(TestCase):
         mock_dds_util.return_value.share_project_with_user.assert_called_with(
             'ghi789', 'abc123', ShareRole.DOWNLOAD)
 
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_give_sender_permission_fails(self, mock_dds_util):
+        mock_dds_util.return_value.share_project_with_user.side_effect = DataServiceError(
+            response=Mock(status_code=400), url_suffix='', request_data=None)
+        mock_dds_util.return_value.get_user.return_value.json.return_value = {'id': 'abc123', 'full_name': 'Joe'}
+        delivery_util = DeliveryUtil(self.delivery, self.user, 'file_downloader', 'Share in response to delivery.')
+        delivery_util.give_sender_permission()
+        self.assertEqual(delivery_util.failed_share_users, ['Joe'])
+        mock_dds_util.return_value.get_user.assert_called_with('abc123')
+
 
 class DDSDeliveryTypeTestCase(TestCase):
 
@@ -431,79 +692,18 @@ class DDSDeliveryTypeTestCase(TestCase):
                                                    share_user_message=SHARE_IN_RESPONSE_TO_DELIVERY_MSG)
         self.assertEqual(util, mock_delivery_util.return_value)
 
-    @patch('switchboard.dds_util.DDSUtil')
-    @patch('switchboard.dds_util.DDSMessageFactory')
-    @patch('switchboard.dds_util.Share')
-    def test_transfer_delivery(self, mock_share, mock_dds_message_factory, mock_dds_util):
-        share_users = Mock()
-        share_users.all.return_value = [Mock(dds_id='shareuser1'), Mock(dds_id='shareuser2')]
-        mock_delivery = Mock(share_users=share_users)
-        mock_user = Mock()
-        mock_dds_message_factory.return_value.make_processed_message.side_effect = [
-            Mock(email_text='first_email_content'),
-            Mock(email_text='second_email_content')
-        ]
-
-        warning_message = self.delivery_type.transfer_delivery(mock_delivery, mock_user)
-
-        self.assertEqual(warning_message, '')
-        mock_dds_util.return_value.accept_project_transfer.assert_called_with(mock_delivery.transfer_id)
-        mock_dds_util.return_value.share_project_with_user.assert_has_calls([
-            call(mock_delivery.project_id, 'shareuser1', 'file_downloader'),
-            call(mock_delivery.project_id, 'shareuser2', 'file_downloader'),
-            call(mock_delivery.project_id, mock_delivery.from_user_id, 'file_downloader'),
-        ])
-
-        make_processed_message = mock_dds_message_factory.return_value.make_processed_message
-        make_processed_message.assert_has_calls([
-            call('accepted', MessageDirection.ToSender, warning_message=''),
-            call('accepted_recipient', MessageDirection.ToRecipient),
-        ])
-        mock_delivery.mark_accepted.assert_called_with(
-            mock_user.get_username.return_value,
-            'first_email_content',
-            'second_email_content'
-        )
-        mock_delivery_details = mock_dds_message_factory.return_value.delivery_details
-        self.assertEqual(mock_delivery.project_name, mock_delivery_details.get_project.return_value.name)
-
-    @patch('switchboard.dds_util.DDSUtil')
-    @patch('switchboard.dds_util.DDSMessageFactory')
-    @patch('switchboard.dds_util.Share')
-    def test_transfer_delivery_with_send_errors(self, mock_share, mock_dds_message_factory, mock_dds_util):
-        share_users = Mock()
-        share_users.all.return_value = [Mock(dds_id='shareuser1'), Mock(dds_id='shareuser2')]
-        mock_delivery = Mock(share_users=share_users)
+    @patch('switchboard.dds_util.DDSTransferFunctions')
+    def test_transfer_delivery(self, mock_transfer_functions):
+        mock_delivery = Mock(id=123)
         mock_user = Mock()
-        message1 = Mock(email_text='first_email_content', to='user1')
-        message1.send.side_effect = OSError("Timeout 1")
-        message2 = Mock(email_text='second_email_content', to='user2')
-        message2.send.side_effect = OSError("Timeout 2")
-        mock_dds_message_factory.return_value.make_processed_message.side_effect = [
-            message1,
-            message2
-        ]
+        mock_user.get_username.return_value = 'user1'
 
         warning_message = self.delivery_type.transfer_delivery(mock_delivery, mock_user)
 
-        self.assertEqual(warning_message, 'Failed to email to user1: Timeout 1\nFailed to email to user2: Timeout 2\n')
-        mock_dds_util.return_value.accept_project_transfer.assert_called_with(mock_delivery.transfer_id)
-        mock_dds_util.return_value.share_project_with_user.assert_has_calls([
-            call(mock_delivery.project_id, 'shareuser1', 'file_downloader'),
-            call(mock_delivery.project_id, 'shareuser2', 'file_downloader'),
-            call(mock_delivery.project_id, mock_delivery.from_user_id, 'file_downloader'),
-        ])
-
-        make_processed_message = mock_dds_message_factory.return_value.make_processed_message
-        make_processed_message.assert_has_calls([
-            call('accepted', MessageDirection.ToSender, warning_message=''),
-            call('accepted_recipient', MessageDirection.ToRecipient),
-        ])
-        mock_delivery.mark_accepted.assert_called_with(
-            mock_user.get_username.return_value,
-            'first_email_content',
-            'second_email_content'
-        )
+        self.assertEqual(warning_message, None)
+        self.assertEqual(mock_delivery.performed_by, 'user1')
+        mock_delivery.mark_transferring.assert_called_with()
+        mock_transfer_functions.transfer_delivery.assert_called_with(123)
 
     @patch('switchboard.dds_util.DDSMessageFactory')
     def test_make_processed_message(self, mock_dds_message_factory):
@@ -519,6 +719,123 @@ class DDSDeliveryTypeTestCase(TestCase):
         )
 
 
+class DDSTransferTestCase(TestCase):
+    def setUp(self):
+        dds_user_cache.clear()
+        self.user = User.objects.create(username='recipient')
+        self.delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='fromuser1',
+                                                   to_user_id='touser1', transfer_id='transfer1',
+                                                   performed_by='recipient', state=State.TRANSFERRING)
+        DDSDeliveryShareUser.objects.create(delivery=self.delivery, dds_id='shareuser1')
+        dds_util_patcher = patch('switchboard.dds_util.DDSUtil')
+        self.mock_dds_util = dds_util_patcher.start().return_value
+        self.addCleanup(dds_util_patcher.stop)
+        self.mock_dds_util.get_project_transfer.return_value.json.return_value = {'status': 'pending'}
+        factory_patcher = patch('switchboard.dds_util.DDSMessageFactory')
+        self.mock_message_factory = factory_patcher.start()
+        self.addCleanup(factory_patcher.stop)
+        self.sender_message = Mock(email_text='sender email', to='sender@example.com')
+        self.recipient_message = Mock(email_text='recipient email', to='recipient@example.com')
+        self.mock_message_factory.return_value.make_processed_message.side_effect = [
+            self.sender_message, self.recipient_message
+        ]
+        self.mock_message_factory.return_value.delivery_details.get_project.return_value.name = 'MouseRNA'
+        share_patcher = patch('switchboard.dds_util.DeliveryUtil._create_and_send_share_message')
+        share_patcher.start()
+        self.addCleanup(share_patcher.stop)
+        connection_patcher = patch('switchboard.dds_util.get_connection')
+        connection_patcher.start()
+        self.addCleanup(connection_patcher.stop)
+
+    def test_transfer_delivery_runs_all_steps(self):
+        DDSTransferFunctions.transfer_delivery(self.delivery.id)
+        self.assertTrue(tasks.run_next_task())
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.ACCEPTED)
+        self.assertEqual(self.delivery.transfer_state, DDSTransferStates.COMPLETE)
+        self.assertEqual(self.delivery.project_name, 'MouseRNA')
+        self.assertEqual(self.delivery.sender_completion_email_text, 'sender email')
+        self.assertEqual(self.delivery.recipient_completion_email_text, 'recipient email')
+        self.mock_dds_util.accept_project_transfer.assert_called_with('transfer1')
+        self.mock_dds_util.share_project_with_user.assert_has_calls([
+            call('project1', 'shareuser1', 'file_downloader'),
+            call('project1', 'fromuser1', 'file_downloader'),
+        ])
+        self.mock_message_factory.return_value.make_processed_message.assert_has_calls([
+            call('accepted', MessageDirection.ToSender, warning_message=''),
+            call('accepted_recipient', MessageDirection.ToRecipient),
+        ])
+        self.assertTrue(self.sender_message.send.called)
+        self.assertTrue(self.recipient_message.send.called)
+        self.assertEqual(self.mock_message_factory.call_count, 1)
+
+    def test_run_skips_accepting_transfer_already_accepted(self):
+        self.mock_dds_util.get_project_transfer.return_value.json.return_value = {'status': 'accepted'}
+
+        DDSTransfer(self.delivery.id).run()
+
+        self.assertFalse(self.mock_dds_util.accept_project_transfer.called)
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.ACCEPTED)
+
+    def test_run_resumes_after_completed_steps(self):
+        self.delivery.transfer_state = DDSTransferStates.EMAILED_SENDER
+        self.delivery.failed_share_users = ['Joe']
+        self.delivery.sender_completion_email_text = 'earlier sender email'
+        self.delivery.save()
+        self.mock_message_factory.return_value.make_processed_message.side_effect = [self.recipient_message]
+
+        DDSTransfer(self.delivery.id).run()
+
+        self.assertFalse(self.mock_dds_util.get_project_transfer.called)
+        self.assertFalse(self.mock_dds_util.share_project_with_user.called)
+        self.assertFalse(self.sender_message.send.called)
+        self.assertTrue(self.recipient_message.send.called)
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.ACCEPTED)
+        self.assertEqual(self.delivery.sender_completion_email_text, 'earlier sender email')
+        self.assertEqual(self.delivery.failed_share_users, ['Joe'])
+
+    def test_run_records_email_errors(self):
+        self.sender_message.send.side_effect = OSError('Timeout 1')
+        self.recipient_message.send.side_effect = OSError('Timeout 2')
+
+        DDSTransfer(self.delivery.id).run()
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.ACCEPTED)
+        self.assertEqual([error.message for error in self.delivery.errors.order_by('created')], [
+            'Failed to email to sender@example.com: Timeout 1',
+            'Failed to email to recipient@example.com: Timeout 2',
+        ])
+
+    @patch('switchboard.dds_util.dds_user_cache', new_callable=DDSUserCache)
+    def test_run_records_failed_share_users(self, mock_dds_user_cache):
+        self.mock_dds_util.share_project_with_user.side_effect = DataServiceError(
+            response=Mock(status_code=500), url_suffix='', request_data={})
+        self.mock_dds_util.get_user.return_value.json.return_value = {'full_name': 'Joe'}
+
+        DDSTransfer(self.delivery.id).run()
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.failed_share_users, ['Joe', 'Joe'])
+        self.mock_message_factory.return_value.make_processed_message.assert_any_call(
+            'accepted', MessageDirection.ToSender,
+            warning_message='Failed to share with the following user(s): Joe, Joe')
+
+    def test_transfer_delivery_failure_marks_failed_and_keeps_progress(self):
+        self.mock_dds_util.share_project_with_user.side_effect = ValueError('Unexpected')
+
+        DDSTransferFunctions.transfer_delivery(self.delivery.id)
+        tasks.run_next_task()
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.state, State.FAILED)
+        self.assertEqual(self.delivery.transfer_state, DDSTransferStates.ACCEPTED_PROJECT_TRANSFER)
+        self.assertEqual([error.message for error in self.delivery.errors.all()], ['Unexpected'])
+
+
 @patch('switchboard.dds_util.DDSUtil.get_project_url')
 class DDSProjectTestCase(TestCase):
     def test_constructor(self, mock_get_project_url):
@@ -541,7 +858,9 @@ class DDSProjectTestCase(TestCase):
         self.assertEqual(project.created_on, '2019-01-01')
         self.assertEqual(project.last_updated_on, '2019-06-01')
 
-    def test_fetch_list(self, mock_get_project_url):
+    @patch('switchboard.dds_util.DDSUtil.get_portal_root')
+    def test_fetch_list(self, mock_get_portal_root, mock_get_project_url):
+        mock_get_portal_root.return_value = 'http://portal.example.org'
         mock_get_project_url.return_value = 'http://example.org'
         mock_dds_util = Mock()
         mock_dds_util.get_projects.return_value.json.return_value = {
@@ -567,13 +886,15 @@ class DDSProjectTestCase(TestCase):
         self.assertEqual(projects[0].url, 'http://example.org')
         self.assertEqual(projects[0].created_on, '2019-01-01')
         self.assertEqual(projects[0].last_updated_on, '2019-06-01')
+        mock_get_project_url.assert_called_with('123', 'http://portal.example.org')
 
 
 @patch('switchboard.dds_util.DDSUtil.get_project_url')
 class DDSProjectSummaryTestCase(TestCase):
 
     def setUp(self):
-        self.project = {'id': '123'}
+        cache.clear()
+        self.project = {'id': '123', 'audit': {'last_updated_on': '2019-06-01'}}
         self.children = [
             {'id': 'fo1', 'kind': 'dds-folder', 'parent': {'kind': 'dds-project'}},
             {'id': 'fi1', 'kind': 'dds-file', 'current_version': {'upload': {'size': 100}}},
@@ -582,18 +903,72 @@ class DDSProjectSummaryTestCase(TestCase):
             {'id': 'fo2', 'kind': 'dds-folder', 'parent': {'kind': 'dds-folder'}}
         ]
 
+    def make_mock_dds_util(self):
+        mock_dds_util = Mock()
+        mock_dds_util.get_project.return_value.json.return_value = dict(self.project)
+        pages = [self.children[:3], self.children[3:]]
+
+        def get_project_children_page(project_id, page, page_size):
+            return Mock(headers={'x-total': '5', 'x-total-pages': '2'},
+                        json=Mock(return_value={'results': pages[page - 1]}))
+        mock_dds_util.get_project_children_page.side_effect = get_project_children_page
+        return mock_dds_util
+
     def test_constructor(self, mock_get_project_url):
         project_summary = DDSProjectSummary({'id': '123', 'children': self.children})
         self.assertEqual(project_summary.id, '123')
-        self.assertEqual(project_summary.children, self.children)
+        self.assertEqual(project_summary.counts, {
+            'total_size': 600, 'file_count': 3, 'folder_count': 2, 'root_folder_count': 1
+        })
 
-    def test_fetch_one(self, mock_get_project_url):
-        mock_dds_util = Mock()
-        mock_dds_util.get_project.return_value.json.return_value = self.project
-        mock_dds_util.get_project_children.return_value.json.return_value = {'results': self.children}
+    @override_settings(DDS_PROJECT_CHILDREN_PAGE_SIZE=3)
+    def test_fetch_one_counts_each_page(self, mock_get_project_url):
+        mock_dds_util = self.make_mock_dds_util()
         project_summary = DDSProjectSummary.fetch_one(mock_dds_util, '123')
         self.assertEqual(project_summary.id, '123')
-        self.assertEqual(project_summary.children, self.children)
+        self.assertEqual(project_summary.total_size(), 600)
+        self.assertEqual(project_summary.file_count(), 3)
+        self.assertEqual(project_summary.folder_count(), 2)
+        self.assertEqual(project_summary.root_folder_count(), 1)
+        mock_dds_util.get_project_children_page.assert_has_calls([call('123', 1, 3), call('123', 2, 3)])
+        self.assertFalse(mock_dds_util.get_project_children.called)
+
+    @override_settings(DDS_PROJECT_SUMMARY_CACHE_SECONDS=60)
+    def test_fetch_one_uses_cached_counts_until_project_updated(self, mock_get_project_url):
+        mock_dds_util = self.make_mock_dds_util()
+        DDSProjectSummary.fetch_one(mock_dds_util, '123')
+        mock_dds_util.get_project_children_page.reset_mock()
+
+        project_summary = DDSProjectSummary.fetch_one(mock_dds_util, '123')
+        self.assertEqual(project_summary.total_size(), 600)
+        self.assertFalse(mock_dds_util.get_project_children_page.called)
+
+        self.project['audit'] = {'last_updated_on': '2019-07-01'}
+        mock_dds_util.get_project.return_value.json.return_value = dict(self.project)
+        DDSProjectSummary.fetch_one(mock_dds_util, '123')
+        self.assertTrue(mock_dds_util.get_project_children_page.called)
+
+    @override_settings(DDS_PROJECT_SUMMARY_CACHE_SECONDS=60, DDS_PROJECT_SUMMARY_CACHE_BACKEND='default')
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_cache_project_summary(self, mock_dds_util, mock_get_project_url):
+        user = User.objects.create(username='sender')
+        mock_dds_util.return_value = self.make_mock_dds_util()
+        DDSProjectSummaryFunctions.cache_project_summary(user.id, '123')
+        tasks.run_next_task()
+        mock_dds_util.assert_called_with(user)
+        mock_dds_util.return_value.get_project_children_page.reset_mock()
+
+        project_summary = DDSProjectSummary.fetch_one(mock_dds_util.return_value, '123')
+        self.assertEqual(project_summary.file_count(), 3)
+        self.assertFalse(mock_dds_util.return_value.get_project_children_page.called)
+
+    @override_settings(DDS_PROJECT_SUMMARY_CACHE_BACKEND=None)
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_cache_project_summary_skipped_without_shared_cache(self, mock_dds_util, mock_get_project_url):
+        user = User.objects.create(username='sender')
+        DDSProjectSummaryFunctions.cache_project_summary(user.id, '123')
+        self.assertTrue(tasks.run_next_task())
+        mock_dds_util.assert_not_called()
 
     def test_total_size(self, mock_get_project_url):
         project_summary = DDSProjectSummary({'id': '123', 'children': self.children})
@@ -612,6 +987,151 @@ class DDSProjectSummaryTestCase(TestCase):
         self.assertEqual(project_summary.root_folder_count(), 1)
 
 
+class DDSProjectManifestTestCase(TestCase):
+    def setUp(self):
+        self.folder = {'id': 'fo1', 'kind': 'dds-folder', 'name': 'data'}
+        self.pages = [
+            [
+                self.folder,
+                self.make_file('fi1', 'file1.txt', 100, ancestors=[{'kind': 'dds-project', 'name': 'Mouse'}]),
+            ],
+            [self.make_file('fi2', 'file2.txt', 200, ancestors=[{'kind': 'dds-project', 'name': 'Mouse'}, self.folder])],
+            [self.make_file('fi3', 'file3.txt', 300)],
+        ]
+        self.mock_dds_util = Mock()
+
+        def get_project_children_page(project_id, page, page_size, exclude_response_fields):
+            return Mock(headers={'x-total-pages': str(len(self.pages))},
+                        json=Mock(return_value={'results': self.pages[page - 1]}))
+        self.mock_dds_util.get_project_children_page.side_effect = get_project_children_page
+
+    @staticmethod
+    def make_file(file_id, name, size, ancestors=None):
+        return {
+            'id': file_id, 'kind': 'dds-file', 'name': name, 'ancestors': ancestors or [],
+            'current_version': {'version': 2, 'upload': {'size': size, 'hashes': [
+                {'algorithm': 'md5', 'value': file_id + 'md5'}
+            ]}}
+        }
+
+    def test_iter_lists_files_of_every_page_in_order(self):
+        project_manifest = DDSProjectManifest(self.mock_dds_util, 'project1', page_size=2, max_workers=2)
+        entries = list(project_manifest)
+        self.assertEqual(entries, [
+            {'id': 'fi1', 'path': 'file1.txt', 'size': 100, 'version': 2, 'hashes': {'md5': 'fi1md5'}},
+            {'id': 'fi2', 'path': 'data/file2.txt', 'size': 200, 'version': 2, 'hashes': {'md5': 'fi2md5'}},
+            {'id': 'fi3', 'path': 'file3.txt', 'size': 300, 'version': 2, 'hashes': {'md5': 'fi3md5'}},
+        ])
+        self.mock_dds_util.get_project_children_page.assert_has_calls([
+            call('project1', 1, 2, exclude_response_fields=['audit', 'project']),
+            call('project1', 2, 2, exclude_response_fields=['audit', 'project']),
+            call('project1', 3, 2, exclude_response_fields=['audit', 'project']),
+        ], any_order=True)
+
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_record_object_manifest(self, mock_dds_util):
+        mock_dds_util.return_value = self.mock_dds_util
+        user = User.objects.create(username='sender')
+        delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='fromuser1',
+                                              to_user_id='touser1', transfer_id='transfer1')
+        DDSManifestFunctions.record_object_manifest(delivery.id, user.id)
+        self.assertTrue(tasks.run_next_task())
+
+        delivery.refresh_from_db()
+        mock_dds_util.assert_called_with(user)
+        self.assertEqual(delivery.manifest.entry_count, 3)
+        self.assertEqual([entry['path'] for entry in delivery.manifest.iter_entries()],
+                         ['file1.txt', 'data/file2.txt', 'file3.txt'])
+
+        # A delivery that already has a manifest keeps it
+        manifest_id = delivery.manifest.id
+        DDSManifestFunctions.record_object_manifest(delivery.id, user.id)
+        self.assertTrue(tasks.run_next_task())
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.manifest.id, manifest_id)
+
+    def test_record_object_manifest_failure_saves_nothing(self):
+        delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='fromuser1',
+                                              to_user_id='touser1', transfer_id='transfer1')
+        fetch_page = self.mock_dds_util.get_project_children_page.side_effect
+
+        def fail_last_page(project_id, page, page_size, exclude_response_fields):
+            if page == 3:
+                raise DataServiceError(response=Mock(status_code=500), url_suffix='/children', request_data=None)
+            return fetch_page(project_id, page, page_size, exclude_response_fields)
+        self.mock_dds_util.get_project_children_page.side_effect = fail_last_page
+        with self.assertRaises(DataServiceError):
+            record_object_manifest(delivery, self.mock_dds_util)
+        delivery.refresh_from_db()
+        self.assertIsNone(delivery.manifest)
+        self.assertEqual(DDSObjectManifest.objects.count(), 0)
+
+    def test_record_object_manifest_save_failure_deletes_manifest(self):
+        delivery = DDSDelivery.objects.create(project_id='project1', from_user_id='fromuser1',
+                                              to_user_id='touser1', transfer_id='transfer1')
+        with patch.object(delivery, 'save', side_effect=ValueError('save failed')):
+            with self.assertRaises(ValueError):
+                record_object_manifest(delivery, self.mock_dds_util)
+        self.assertEqual(DDSObjectManifest.objects.count(), 0)
+        self.assertEqual(DDSObjectManifestChunk.objects.count(), 0)
+        delivery.refresh_from_db()
+        self.assertIsNone(delivery.manifest)
+
+
+class DDSResultsIteratorTestCase(TestCase):
+    @staticmethod
+    def make_fetch_page(values):
+        def fetch_page(page, page_size):
+            total_pages = (len(values) + page_size - 1) // page_size
+            response = Mock(headers={'x-total': str(len(values)), 'x-total-pages': str(total_pages)})
+            response.json.return_value = {'results': values[(page - 1) * page_size:page * page_size]}
+            return response
+        return Mock(side_effect=fetch_page)
+
+    def test_iterate_all(self):
+        fetch_page = self.make_fetch_page(['a', 'b', 'c', 'd', 'e'])
+        results = DDSResultsIterator(fetch_page, str.upper, page_size=2)
+        self.assertEqual(list(results), [
+            ('A', (1, 1)), ('B', (2, 0)), ('C', (2, 1)), ('D', (3, 0)), ('E', None)
+        ])
+        self.assertEqual(results.total, 5)
+        self.assertEqual(fetch_page.call_args_list, [call(1, 2), call(2, 2), call(3, 2)])
+
+    def test_fetches_pages_lazily(self):
+        fetch_page = self.make_fetch_page(['a', 'b', 'c', 'd', 'e'])
+        iterator = iter(DDSResultsIterator(fetch_page, str.upper, page_size=2, page=2, offset=1))
+        self.assertEqual(next(iterator), ('D', (3, 0)))
+        self.assertEqual(fetch_page.call_args_list, [call(2, 2)])
+
+    def test_empty(self):
+        fetch_page = self.make_fetch_page([])
+        results = DDSResultsIterator(fetch_page, str.upper, page_size=2)
+        self.assertEqual(list(results), [])
+        self.assertEqual(results.total, 0)
+
+
+class DDSListFilterTestCase(TestCase):
+    def test_name_prefix(self):
+        list_filter = DDSListFilter(name_prefix='Mou')
+        self.assertFalse(list_filter.is_empty())
+        self.assertTrue(list_filter.matches('mouse'))
+        self.assertFalse(list_filter.matches('rat'))
+        self.assertFalse(list_filter.matches(None))
+
+    def test_created(self):
+        list_filter = DDSListFilter(created_after=datetime.datetime(2019, 1, 1, tzinfo=timezone.utc),
+                                    created_before=datetime.datetime(2019, 2, 1, tzinfo=timezone.utc))
+        self.assertTrue(list_filter.matches('mouse', '2019-01-01T00:00:00Z'))
+        self.assertFalse(list_filter.matches('mouse', '2018-12-31T23:59:59Z'))
+        self.assertFalse(list_filter.matches('mouse', '2019-02-01T00:00:00Z'))
+        self.assertFalse(list_filter.matches('mouse', None))
+
+    def test_empty(self):
+        list_filter = DDSListFilter()
+        self.assertTrue(list_filter.is_empty())
+        self.assertTrue(list_filter.matches(None))
+
+
 class DDSProjectPermissionsTestCase(TestCase):
     def test_constructor(self):
         permissions = DDSProjectPermissions(project_permission_dict={
@@ -696,9 +1216,216 @@ class DDSProjectPermissionsTestCase(TestCase):
         self.assertEqual(permissions.auth_role, 'file_downloader')
 
 
+@patch('switchboard.dds_util.settings', DDS_USER_CACHE_SIZE=2, DDS_USER_CACHE_SECONDS=600,
+       DDS_USER_NEGATIVE_CACHE_SECONDS=60, DDS_USER_CACHE_BACKEND=None)
+class DDSUserCacheTestCase(TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.cache = DDSUserCache(clock=lambda: self.now)
+        self.fetch_user_dict = Mock()
+        self.fetch_user_dict.return_value = {'id': 'user1', 'full_name': 'Joe'}
+
+    def test_get_caches_user(self, mock_settings):
+        self.assertEqual(self.cache.get('user1', self.fetch_user_dict), {'id': 'user1', 'full_name': 'Joe'})
+        self.now = 1599
+        self.assertEqual(self.cache.get('user1', self.fetch_user_dict), {'id': 'user1', 'full_name': 'Joe'})
+        self.assertEqual(self.fetch_user_dict.call_count, 1)
+        self.now = 1600
+        self.cache.get('user1', self.fetch_user_dict)
+        self.assertEqual(self.fetch_user_dict.call_count, 2)
+
+    def test_get_caches_not_found_for_less_time(self, mock_settings):
+        self.fetch_user_dict.side_effect = DataServiceError(
+            response=Mock(status_code=404, json=Mock(return_value={'reason': 'Not Found'})),
+            url_suffix='/users/user1', request_data=None)
+        with self.assertRaises(DataServiceError) as raised_error:
+            self.cache.get('user1', self.fetch_user_dict)
+        self.assertEqual(raised_error.exception.status_code, 404)
+        self.now = 1059
+        with self.assertRaises(DataServiceError) as raised_error:
+            self.cache.get('user1', self.fetch_user_dict)
+        self.assertEqual(raised_error.exception.status_code, 404)
+        self.assertEqual(raised_error.exception.url_suffix, '/users/user1')
+        self.assertIn('Not Found', str(raised_error.exception))
+        self.assertEqual(self.fetch_user_dict.call_count, 1)
+        self.now = 1060
+        self.fetch_user_dict.side_effect = None
+        self.assertEqual(self.cache.get('user1', self.fetch_user_dict), {'id': 'user1', 'full_name': 'Joe'})
+
+    def test_get_does_not_cache_other_errors(self, mock_settings):
+        self.fetch_user_dict.side_effect = [
+            DataServiceError(response=Mock(status_code=500), url_suffix='/users/user1', request_data=None),
+            {'id': 'user1', 'full_name': 'Joe'},
+        ]
+        with self.assertRaises(DataServiceError):
+            self.cache.get('user1', self.fetch_user_dict)
+        self.assertEqual(self.cache.get('user1', self.fetch_user_dict), {'id': 'user1', 'full_name': 'Joe'})
+
+    def test_get_evicts_least_recently_used(self, mock_settings):
+        self.cache.get('user1', self.fetch_user_dict)
+        self.cache.get('user2', self.fetch_user_dict)
+        self.cache.get('user1', self.fetch_user_dict)
+        self.cache.get('user3', self.fetch_user_dict)
+        self.assertEqual(list(self.cache.entries.keys()), ['user1', 'user3'])
+
+    @patch('switchboard.dds_util.caches')
+    def test_get_uses_shared_cache(self, mock_caches, mock_settings):
+        mock_settings.DDS_USER_CACHE_BACKEND = 'shared'
+        shared_cache = mock_caches.__getitem__.return_value
+        shared_cache.get.return_value = None
+        self.cache.get('user1', self.fetch_user_dict)
+        mock_caches.__getitem__.assert_called_with('shared')
+        shared_cache.set.assert_called_with('dds-user-user1', ({'id': 'user1', 'full_name': 'Joe'}, None), 600)
+
+        shared_cache.get.return_value = ({'id': 'user2', 'full_name': 'Bob'}, None)
+        self.assertEqual(self.cache.get('user2', self.fetch_user_dict), {'id': 'user2', 'full_name': 'Bob'})
+        self.assertEqual(self.fetch_user_dict.call_count, 1)
+
+    def test_get_coalesces_concurrent_lookups(self, mock_settings):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch_user_dict():
+            started.set()
+            release.wait(5)
+            return {'id': 'user1', 'full_name': 'Joe'}
+        fetch_user_dict = Mock(side_effect=slow_fetch_user_dict)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get('user1', fetch_user_dict)))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(fetch_user_dict.call_count, 1)
+        self.assertEqual(results, [{'id': 'user1', 'full_name': 'Joe'}] * 3)
+
+    def test_get_uses_expired_user_while_unavailable(self, mock_settings):
+        self.cache.get('user1', self.fetch_user_dict)
+        self.now = 1600
+        self.fetch_user_dict.side_effect = DDSUnavailable()
+        self.assertEqual(self.cache.get('user1', self.fetch_user_dict), {'id': 'user1', 'full_name': 'Joe'})
+        with self.assertRaises(DDSUnavailable):
+            self.cache.get('user2', self.fetch_user_dict)
+
+
+@patch('switchboard.dds_util.settings', DDS_CIRCUIT_FAILURE_THRESHOLD=2, DDS_CIRCUIT_RESET_SECONDS=30)
+class DDSCircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.breaker = DDSCircuitBreaker(clock=lambda: self.now)
+        self.request = Mock()
+        self.request.return_value = Mock(status_code=200)
+
+    def fail_request(self, *args, **kwargs):
+        raise ConnectionError()
+
+    def test_call_opens_after_failures(self, mock_settings):
+        self.assertEqual(self.breaker.call('GET /users', 10, self.request, 'a', b='c'),
+                         self.request.return_value)
+        self.request.assert_called_with('a', b='c')
+        self.request.return_value = Mock(status_code=500)
+        self.breaker.call('GET /users', 10, self.request)
+        self.assertEqual(self.breaker.state, DDSCircuitBreaker.CLOSED)
+        with self.assertRaises(ConnectionError):
+            self.breaker.call('GET /users', 10, self.fail_request)
+        self.assertEqual(self.breaker.state, DDSCircuitBreaker.OPEN)
+        with self.assertRaises(DDSUnavailable):
+            self.breaker.call('GET /users', 10, self.request)
+        self.assertEqual(self.request.call_count, 2)
+
+    def test_call_resets_failures_after_success(self, mock_settings):
+        self.request.side_effect = [Mock(status_code=503), Mock(status_code=200), Mock(status_code=503)]
+        for _ in range(3):
+            self.breaker.call('GET /users', 10, self.request)
+        self.assertEqual(self.breaker.state, DDSCircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.consecutive_failures, 1)
+
+    def test_slow_calls_are_failures(self, mock_settings):
+        def slow_request():
+            self.now += 11
+            return Mock(status_code=200)
+        self.breaker.call('GET /users', 10, slow_request)
+        self.breaker.call('GET /users', 10, slow_request)
+        self.assertEqual(self.breaker.state, DDSCircuitBreaker.OPEN)
+        metrics = self.breaker.get_metrics()
+        self.assertEqual(metrics['endpoints']['GET /users']['slow_calls'], 2)
+        self.assertEqual(metrics['endpoints']['GET /users']['max_seconds'], 11)
+
+    def test_probe_success_closes(self, mock_settings):
+        self.breaker.state = DDSCircuitBreaker.OPEN
+        self.breaker.opened_at = self.now
+        self.now += 29
+        with self.assertRaises(DDSUnavailable):
+            self.breaker.call('GET /users', 10, self.request)
+        self.now += 1
+        self.assertTrue(self.breaker._before_call('GET /users'))
+        with self.assertRaises(DDSUnavailable):
+            self.breaker.call('GET /users', 10, self.request)
+        self.breaker._after_call('GET /users', True, 1, failed=False, slow=False)
+        self.assertEqual(self.breaker.state, DDSCircuitBreaker.CLOSED)
+        self.breaker.call('GET /users', 10, self.request)
+        self.request.assert_called_once_with()
+
+    def test_probe_failure_reopens(self, mock_settings):
+        self.breaker.state = DDSCircuitBreaker.OPEN
+        self.breaker.opened_at = self.now
+        self.now += 30
+        with self.assertRaises(ConnectionError):
+            self.breaker.call('GET /users', 10, self.fail_request)
+        self.assertEqual(self.breaker.state, DDSCircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.opened_at, 1030)
+        with self.assertRaises(DDSUnavailable):
+            self.breaker.call('GET /users', 10, self.request)
+
+    def test_get_metrics(self, mock_settings):
+        self.breaker.call('GET /users', 10, self.request)
+        self.breaker.call('GET /projects/{id}', 10, self.request)
+        with self.assertRaises(ConnectionError):
+            self.breaker.call('GET /users', 10, self.fail_request)
+        metrics = self.breaker.get_metrics()
+        self.assertEqual(metrics['state'], DDSCircuitBreaker.CLOSED)
+        self.assertEqual(metrics['consecutive_failures'], 1)
+        self.assertEqual(metrics['endpoints']['GET /users']['calls'], 2)
+        self.assertEqual(metrics['endpoints']['GET /users']['failures'], 1)
+        self.assertEqual(metrics['endpoints']['GET /projects/{id}']['calls'], 1)
+        self.breaker.reset()
+        self.assertEqual(self.breaker.get_metrics()['endpoints'], {})
+
+    def test_get_dds_endpoint_name(self, mock_settings):
+        self.assertEqual(get_dds_endpoint_name('get', 'https://api.example.com/api/v1/current_user'),
+                         'GET /current_user')
+        self.assertEqual(
+            get_dds_endpoint_name('put', 'https://api.example.com/api/v1/project_transfers/'
+                                         'bd0b8b0e-6c3b-4d0a-8a6b-9e4a5d2a7c11/accept'),
+            'PUT /project_transfers/{id}/accept')
+        self.assertEqual(get_dds_endpoint_name('GET', 'https://api.example.com/api/v1/projects/123/children?page=2'),
+                         'GET /projects/{id}/children')
+
+    @patch('switchboard.dds_util.dds_circuit_breaker')
+    @patch('switchboard.dds_util.requests.Session.request')
+    def test_session_uses_latency_budget(self, mock_request, mock_dds_circuit_breaker, mock_settings):
+        mock_settings.DDS_LATENCY_BUDGET_SECONDS = 10
+        mock_settings.DDS_ENDPOINT_LATENCY_BUDGETS = {'GET /projects/{id}/children': 30}
+        mock_dds_circuit_breaker.call.side_effect = lambda endpoint, budget, func, *args, **kwargs: \
+            func(*args, **kwargs)
+        session = DDSCircuitBreakerSession()
+        session.get('https://api.example.com/api/v1/projects/123/children')
+        mock_dds_circuit_breaker.call.assert_called_with('GET /projects/{id}/children', 30, ANY,
+                                                         'GET', 'https://api.example.com/api/v1/projects/123/children',
+                                                         allow_redirects=True, timeout=30)
+        self.assertEqual(mock_request.call_args[1]['timeout'], 30)
+        session.get('https://api.example.com/api/v1/users', timeout=5)
+        self.assertEqual(mock_dds_circuit_breaker.call.call_args[0][:2], ('GET /users', 10))
+        self.assertEqual(mock_request.call_args[1]['timeout'], 5)
+
+
 class DDSUserTestCase(TestCase):
 
     def setUp(self):
+        dds_user_cache.clear()
         self.user_dict = {
             'id': 'user-id-1',
             'username': 'username-123',
@@ -733,6 +1460,25 @@ class DDSUserTestCase(TestCase):
         self.assertEqual(dds_user.full_name, 'First Last')
         self.assertEqual(dds_user.email, 'username-123@test.com')
 
+    def test_fetch_many(self):
+        mock_dds_util = Mock()
+        mock_dds_util.get_user.side_effect = lambda user_id: Mock(**{'json.return_value': {'id': user_id}})
+        users = DDSUser.fetch_many(mock_dds_util, ['user1', 'user2', 'user3'], max_workers=2)
+        self.assertEqual([user.id for user in users], ['user1', 'user2', 'user3'])
+        self.assertEqual(DDSUser.fetch_many(mock_dds_util, [], max_workers=2), [])
+
+    def test_fetch_many_with_errors(self):
+        def get_user(user_id):
+            if user_id == 'user2':
+                raise ValueError('lookup failed')
+            return Mock(**{'json.return_value': {'id': user_id}})
+        mock_dds_util = Mock()
+        mock_dds_util.get_user.side_effect = get_user
+        users = DDSUser.fetch_many(mock_dds_util, ['user1', 'user2', 'user3'], max_workers=2)
+        self.assertEqual([user.id for user in users], ['user1', 'user3'])
+        with self.assertRaises(ValueError):
+            DDSUser.fetch_many(mock_dds_util, ['user2'], max_workers=2)
+
     def test_get_or_register_user_when_user_exists(self):
         mock_dds_util = Mock()
         mock_dds_util.get_users.return_value.json.return_value = {'results': [self.user_dict]}
@@ -885,3 +1631,133 @@ class DDSProjectTransferTestCase(TestCase):
         self.delivery.save()
         transfer = DDSProjectTransfer(transfer_dict=self.transfer_dict)
         self.assertEqual(transfer.project.name, 'Acceptance Name')
+
+    def test_fetch_list_queries(self):
+        DDSEndpoint.objects.create(api_root='https://api.example.com', portal_root='https://portal.example.com',
+                                   openid_provider_id='openid-123', openid_provider_service_id='service-456',
+                                   is_default=True)
+        self.delivery.project_name = 'Acceptance Name'
+        self.delivery.save()
+        transfer_dicts = []
+        for transfer_id in ['123', '456', '789']:
+            transfer_dict = dict(self.transfer_dict, id=transfer_id, project={'id': 'p' + transfer_id, 'name': 'Rat'})
+            transfer_dicts.append(transfer_dict)
+        mock_dds_util = Mock()
+        mock_dds_util.get_project_transfers.return_value.json.return_value = {'results': transfer_dicts}
+        # One query for the deliveries and one for the DukeDS endpoint
+        with self.assertNumQueries(2):
+            transfers = DDSProjectTransfer.fetch_list(mock_dds_util)
+        self.assertEqual([transfer.delivery for transfer in transfers], [self.delivery.id, None, None])
+        self.assertEqual([transfer.project.name for transfer in transfers], ['Acceptance Name', 'Rat', 'Rat'])
+        self.assertEqual(transfers[1].project.url, 'https://portal.example.com/#/project/p456')
+
+
+class DDSProjectTransferSyncTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='sync_user')
+        self.mock_dds_util = Mock()
+        self.mock_dds_util.get_current_user.return_value.id = 'user1'
+        self.transfer_dicts = [
+            self.make_transfer_dict('transfer1', 'pending', from_user_id='user1', to_user_id='user2'),
+            self.make_transfer_dict('transfer2', 'accepted', from_user_id='user3', to_user_id='user1'),
+        ]
+        self.mock_dds_util.get_project_transfers.return_value.json.return_value = {'results': self.transfer_dicts}
+
+    @staticmethod
+    def make_transfer_dict(transfer_id, status, from_user_id, to_user_id):
+        return {
+            'id': transfer_id,
+            'status': status,
+            'from_user': {'id': from_user_id},
+            'to_users': [{'id': to_user_id}],
+            'audit': {'created_on': '2019-01-01T10:00:00Z'},
+        }
+
+    def test_sync_creates_records(self):
+        sync_state = DDSProjectTransferSync(self.user, self.mock_dds_util).sync()
+        self.assertEqual(sync_state.dds_user_id, 'user1')
+        self.assertIsNotNone(sync_state.synced_at)
+        records = DDSProjectTransferRecord.for_dds_user('user1').order_by('transfer_id')
+        self.assertEqual([record.transfer_id for record in records], ['transfer1', 'transfer2'])
+        self.assertEqual([record.status for record in records], ['pending', 'accepted'])
+
+    def test_sync_writes_changed_and_deletes_missing(self):
+        DDSProjectTransferSync(self.user, self.mock_dds_util).sync()
+        DDSProjectTransferRecord.save_transfer(self.make_transfer_dict('transfer3', 'pending', 'user1', 'user4'))
+        DDSProjectTransferRecord.objects.filter(transfer_id='transfer3').update(
+            synced_at=timezone.now() - datetime.timedelta(minutes=5))
+        DDSProjectTransferRecord.save_transfer(self.make_transfer_dict('transfer4', 'pending', 'user5', 'user6'))
+        self.transfer_dicts[0]['status'] = 'rejected'
+        unchanged_synced_at = DDSProjectTransferRecord.objects.get(transfer_id='transfer2').synced_at
+
+        DDSProjectTransferSync(self.user, self.mock_dds_util).sync()
+
+        self.assertEqual(DDSProjectTransferRecord.objects.get(transfer_id='transfer1').status, 'rejected')
+        self.assertEqual(DDSProjectTransferRecord.objects.get(transfer_id='transfer2').synced_at,
+                         unchanged_synced_at)
+        # transfer3 was no longer returned for user1, transfer4 belongs to other users
+        self.assertFalse(DDSProjectTransferRecord.objects.filter(transfer_id='transfer3').exists())
+        self.assertTrue(DDSProjectTransferRecord.objects.filter(transfer_id='transfer4').exists())
+
+    def test_get_sync_state_syncs_first_time(self):
+        sync_state = DDSProjectTransferSync.get_sync_state(self.user, self.mock_dds_util)
+        self.assertEqual(sync_state.dds_user_id, 'user1')
+        self.assertEqual(DDSProjectTransferRecord.objects.count(), 2)
+        self.assertFalse(tasks.run_next_task())
+
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_get_sync_state_queues_sync_when_stale(self, mock_dds_util):
+        mock_dds_util.return_value = self.mock_dds_util
+        synced_at = timezone.now() - datetime.timedelta(hours=1)
+        DDSProjectTransferSyncState.objects.create(user=self.user, dds_user_id='user1', synced_at=synced_at)
+
+        sync_state = DDSProjectTransferSync.get_sync_state(self.user, self.mock_dds_util)
+        self.assertEqual(sync_state.synced_at, synced_at)
+        self.assertTrue(sync_state.is_sync_queued(600))
+        self.assertEqual(DDSProjectTransferRecord.objects.count(), 0)
+
+        # A second request while the sync is queued does not queue another
+        DDSProjectTransferSync.get_sync_state(self.user, self.mock_dds_util)
+        self.assertTrue(tasks.run_next_task())
+        self.assertFalse(tasks.run_next_task())
+
+        self.assertEqual(DDSProjectTransferRecord.objects.count(), 2)
+        sync_state.refresh_from_db()
+        self.assertGreater(sync_state.synced_at, synced_at)
+        self.assertFalse(sync_state.is_sync_queued(600))
+
+    @patch('switchboard.dds_util.print')
+    @patch('switchboard.dds_util.DDSUtil')
+    def test_failed_sync_is_queued_again(self, mock_dds_util, mock_print):
+        mock_dds_util.return_value = self.mock_dds_util
+        synced_at = timezone.now() - datetime.timedelta(hours=1)
+        DDSProjectTransferSyncState.objects.create(user=self.user, dds_user_id='user1', synced_at=synced_at)
+        self.mock_dds_util.get_project_transfers.side_effect = DataServiceError(
+            response=Mock(status_code=500), url_suffix='/project_transfers', request_data=None)
+
+        DDSProjectTransferSync.get_sync_state(self.user, self.mock_dds_util)
+        self.assertTrue(tasks.run_next_task())
+        sync_state = DDSProjectTransferSyncState.objects.get(user=self.user)
+        self.assertEqual(sync_state.synced_at, synced_at)
+        self.assertFalse(sync_state.is_sync_queued(600))
+
+        self.mock_dds_util.get_project_transfers.side_effect = None
+        DDSProjectTransferSync.get_sync_state(self.user, self.mock_dds_util)
+        self.assertTrue(tasks.run_next_task())
+        sync_state.refresh_from_db()
+        self.assertGreater(sync_state.synced_at, synced_at)
+
+    def test_queued_sync_expires(self):
+        now = timezone.now()
+        sync_state = DDSProjectTransferSyncState(user=self.user, dds_user_id='user1',
+                                                 synced_at=now - datetime.timedelta(hours=1),
+                                                 queued_at=now - datetime.timedelta(seconds=599))
+        self.assertTrue(sync_state.is_sync_queued(600))
+        sync_state.queued_at = now - datetime.timedelta(seconds=601)
+        self.assertFalse(sync_state.is_sync_queued(600))
+
+    def test_get_sync_state_fresh(self):
+        DDSProjectTransferSyncState.objects.create(user=self.user, dds_user_id='user1', synced_at=timezone.now())
+        sync_state = DDSProjectTransferSync.get_sync_state(self.user, self.mock_dds_util)
+        self.assertFalse(sync_state.is_sync_queued(600))
+        self.mock_dds_util.get_project_transfers.assert_not_called()
@@ -1,5 +1,5 @@
 from django.test import TestCase, override_settings
-from switchboard.mailer import generate_message
+from switchboard.mailer import generate_message, template_with_email_filters
 
 TEST_EMAIL_FROM_ADDRESS='noreply@domain.com'
 
@@ -61,3 +61,12 @@ class MailerTestCase(TestCase):
         }
         message = generate_message(self.reply_to_email, self.rcpt_email, self.cc_email, self.subject, template_text, context)
         self.assertEqual("message ", message.body)
+
+    def test_templates_compiled_once(self):
+        template = template_with_email_filters(self.template_text)
+        self.assertIs(template_with_email_filters(self.template_text), template)
+        message = generate_message(self.reply_to_email, self.rcpt_email, self.cc_email, self.subject, self.template_text, self.context)
+        other_context = dict(self.context, recipient_name='Other Receiver')
+        other_message = generate_message(self.reply_to_email, self.rcpt_email, self.cc_email, self.subject, self.template_text, other_context)
+        self.assertIn('draft to Receiver Name', message.body)
+        self.assertIn('draft to Other Receiver', other_message.body)
@@ -1,13 +1,17 @@
 from django.test import TestCase
 from mock import patch, Mock, call
-from d4s2_api.models import S3Bucket, S3User, S3UserTypes, S3Delivery, User, S3Endpoint, State, EmailTemplateSet
+import threading
+from d4s2_api.models import S3Bucket, S3User, S3UserTypes, S3Delivery, User, S3Endpoint, State, EmailTemplateSet, \
+    S3TransferStates, S3DeliveryCopiedObject, S3TransferModes, S3UserCredential
 from switchboard.s3_util import S3Resource, S3DeliveryUtil, S3DeliveryDetails, S3BucketUtil, \
     S3NoSuchBucket, S3DeliveryType, S3TransferOperation, S3DeliveryError, SendDeliveryBackgroundFunctions, \
-    SendDeliveryOperation, S3NotRecipientException, MessageDirection
+    SendDeliveryOperation, S3NotRecipientException, MessageDirection, S3TransferCheckpoint, s3_resource_cache, \
+    HANDOFF_OWNER_ACCESS_WARNING
 
 
 class S3DeliveryTestBase(TestCase):
     def setUp(self):
+        s3_resource_cache.clear()
         self.email_template_set = EmailTemplateSet.objects.create(name='someset')
         self.user_agent = User.objects.create(username='agent',
                                               email='agent@agent.com',
@@ -101,12 +105,87 @@ class S3DeliveryUtilTestCase(S3DeliveryTestBase):
 
         # As the to user create a bucket and copy the files
         mock_s3_copy_files.create_bucket.assert_called_with(s3_delivery_util.destination_bucket_name)
-        mock_s3_copy_files.copy_bucket.assert_called_with(s3_delivery_util.source_bucket_name,
-                                                          s3_delivery_util.destination_bucket_name)
+        args, kwargs = mock_s3_copy_files.copy_bucket.call_args
+        self.assertEqual(args, (s3_delivery_util.source_bucket_name, s3_delivery_util.destination_bucket_name))
 
         # As the agent Delete the source (this also deletes the files)
         mock_s3_cleanup_bucket.delete_bucket.assert_called_with(s3_delivery_util.source_bucket_name)
 
+        self.s3_delivery.refresh_from_db()
+        self.assertEqual(self.s3_delivery.transfer_state, S3TransferStates.CLEANED_UP_SOURCE_BUCKET)
+
+    @patch('switchboard.s3_util.S3Resource')
+    def test_accept_project_transfer_resumes_after_completed_states(self, mock_s3_resource):
+        self.s3_delivery.transfer_state = S3TransferStates.CREATED_DESTINATION_BUCKET
+        self.s3_delivery.save()
+        mock_s3_copy_files = Mock()
+        mock_s3_cleanup_bucket = Mock()
+        mock_s3_resource.side_effect = [
+            mock_s3_copy_files,
+            mock_s3_cleanup_bucket
+        ]
+
+        s3_delivery_util = S3DeliveryUtil(self.s3_delivery)
+        s3_delivery_util.accept_project_transfer()
+
+        # Permissions were already granted and the bucket already created
+        self.assertFalse(mock_s3_copy_files.grant_bucket_acl.called)
+        self.assertFalse(mock_s3_copy_files.create_bucket.called)
+        self.assertTrue(mock_s3_copy_files.copy_bucket.called)
+        mock_s3_cleanup_bucket.delete_bucket.assert_called_with(s3_delivery_util.source_bucket_name)
+
+    @patch('switchboard.s3_util.S3Resource')
+    def test_accept_project_transfer_records_copy_failure_state(self, mock_s3_resource):
+        mock_s3_grant_read = Mock()
+        mock_s3_copy_files = Mock()
+        mock_s3_copy_files.copy_bucket.side_effect = ValueError("copy failed")
+        mock_s3_resource.side_effect = [
+            mock_s3_grant_read,
+            mock_s3_copy_files,
+        ]
+
+        s3_delivery_util = S3DeliveryUtil(self.s3_delivery)
+        with self.assertRaises(ValueError):
+            s3_delivery_util.accept_project_transfer()
+
+        self.s3_delivery.refresh_from_db()
+        self.assertEqual(self.s3_delivery.transfer_state, S3TransferStates.CREATED_DESTINATION_BUCKET)
+
+    @patch('switchboard.s3_util.S3Resource')
+    def test_accept_project_transfer_handoff_mode(self, mock_s3_resource):
+        self.s3_delivery.transfer_mode = S3TransferModes.HANDOFF
+        self.s3_delivery.save()
+
+        s3_delivery_util = S3DeliveryUtil(self.s3_delivery)
+        s3_delivery_util.accept_project_transfer()
+
+        # As the agent give the to_user full control of the bucket in place replacing the from user's grants
+        mock_s3_resource.assert_called_once_with(self.s3_agent_user)
+        mock_s3 = mock_s3_resource.return_value
+        mock_s3.grant_bucket_acl.assert_called_with(
+            'mouse',
+            grant_full_control_user=[self.s3_agent_user, self.s3_to_user]
+        )
+        mock_s3.grant_objects_acl.assert_called_with(
+            'mouse',
+            grant_full_control_user=[self.s3_agent_user, self.s3_to_user]
+        )
+        self.assertFalse(mock_s3.create_bucket.called)
+        self.assertFalse(mock_s3.copy_bucket.called)
+        self.assertFalse(mock_s3.delete_bucket.called)
+        self.s3_delivery.refresh_from_db()
+        self.assertEqual(self.s3_delivery.transfer_state, S3TransferStates.HANDED_OFF_SOURCE_BUCKET)
+
+        # A retried transfer does not repeat the handoff
+        mock_s3_resource.reset_mock()
+        S3DeliveryUtil(self.s3_delivery).accept_project_transfer()
+        self.assertFalse(mock_s3_resource.called)
+
+    def test_get_warning_message(self):
+        self.assertEqual(S3DeliveryUtil(self.s3_delivery).get_warning_message(), '')
+        self.s3_delivery.transfer_mode = S3TransferModes.HANDOFF
+        self.assertEqual(S3DeliveryUtil(self.s3_delivery).get_warning_message(), HANDOFF_OWNER_ACCESS_WARNING)
+
     @patch('switchboard.s3_util.S3Resource')
     def test_decline_delivery(self, mock_s3_resource):
         s3_delivery_util = S3DeliveryUtil(self.s3_delivery)
@@ -116,6 +195,29 @@ class S3DeliveryUtilTestCase(S3DeliveryTestBase):
         )
 
 
+class S3TransferCheckpointTestCase(S3DeliveryTestBase):
+    def test_is_copied_requires_matching_e_tag_and_size(self):
+        S3DeliveryCopiedObject.objects.create(delivery=self.s3_delivery, key='file1.txt', e_tag='tag1', size=100)
+        checkpoint = S3TransferCheckpoint(self.s3_delivery)
+        self.assertTrue(checkpoint.is_copied(Mock(key='file1.txt', e_tag='tag1', size=100)))
+        self.assertFalse(checkpoint.is_copied(Mock(key='file1.txt', e_tag='tag2', size=100)))
+        self.assertFalse(checkpoint.is_copied(Mock(key='file1.txt', e_tag='tag1', size=200)))
+        self.assertFalse(checkpoint.is_copied(Mock(key='file2.txt', e_tag='tag1', size=100)))
+
+    def test_record_copied(self):
+        checkpoint = S3TransferCheckpoint(self.s3_delivery)
+        checkpoint.record_copied(Mock(key='file1.txt', e_tag='tag1', size=100))
+        checkpoint.record_copied(Mock(key='file1.txt', e_tag='tag2', size=200))
+        self.assertTrue(checkpoint.is_copied(Mock(key='file1.txt', e_tag='tag2', size=200)))
+
+        copied_objects = S3DeliveryCopiedObject.objects.filter(delivery=self.s3_delivery)
+        self.assertEqual([(o.key, o.e_tag, o.size) for o in copied_objects], [('file1.txt', 'tag2', 200)])
+
+        # Progress is reloaded for a new checkpoint (as happens when a transfer is retried)
+        checkpoint = S3TransferCheckpoint(self.s3_delivery)
+        self.assertTrue(checkpoint.is_copied(Mock(key='file1.txt', e_tag='tag2', size=200)))
+
+
 class S3DeliveryDetailsTestCase(S3DeliveryTestBase):
     def test_simple_getters(self):
         s3_delivery_details = S3DeliveryDetails(self.s3_delivery, self.from_user)
@@ -164,12 +266,29 @@ class S3DeliveryDetailsTestCase(S3DeliveryTestBase):
 
 class S3ResourceTestCase(TestCase):
     def setUp(self):
+        s3_resource_cache.clear()
         self.s3_user = Mock(
             s3_id='SomeID',
             credential=Mock(aws_secret_access_key='secret'),
             endpoint=Mock(url='someurl')
         )
 
+    @patch('switchboard.s3_util.boto3')
+    def test_resources_are_cached_per_credentials(self, mock_boto3):
+        s3_resource1 = S3Resource(self.s3_user)
+        s3_resource2 = S3Resource(self.s3_user)
+        self.assertEqual(s3_resource1.s3, s3_resource2.s3)
+        mock_boto3.session.Session.assert_called_once_with(aws_access_key_id='SomeID',
+                                                           aws_secret_access_key='secret')
+        args, kwargs = mock_boto3.session.Session.return_value.resource.call_args
+        self.assertEqual(args, ('s3',))
+        self.assertEqual(kwargs['endpoint_url'], 'someurl')
+        self.assertEqual(kwargs['config'].max_pool_connections, 50)
+
+        self.s3_user.credential.aws_secret_access_key = 'secret2'
+        S3Resource(self.s3_user)
+        self.assertEqual(mock_boto3.session.Session.call_count, 2)
+
     @patch('switchboard.s3_util.boto3')
     def test_create_bucket(self, mock_boto3):
         s3_resource = S3Resource(self.s3_user)
@@ -204,6 +323,28 @@ class S3ResourceTestCase(TestCase):
                  MetadataDirective='COPY')
         ])
 
+    @patch('switchboard.s3_util.boto3')
+    def test_copy_bucket_skip_and_callback(self, mock_boto3):
+        mock_source_bucket = Mock()
+        mock_file1 = Mock(key='key1')
+        mock_file2 = Mock(key='key2')
+        mock_source_bucket.objects.all.return_value = [mock_file1, mock_file2]
+        mock_bucket_constructor = mock_boto3.session.Session.return_value.resource.return_value.Bucket
+        mock_bucket_constructor.return_value = mock_source_bucket
+        mock_on_object_copied = Mock()
+
+        s3_resource = S3Resource(self.s3_user)
+        s3_resource.copy_bucket(source_bucket_name='from_bucket', destination_bucket_name='to_bucket',
+                                skip_object=lambda file_object: file_object.key == 'key1',
+                                on_object_copied=mock_on_object_copied)
+
+        s3_resource.s3.meta.client.copy_object.assert_called_once_with(
+            Bucket='to_bucket',
+            CopySource={'Bucket': 'from_bucket', 'Key': 'key2'},
+            Key='key2',
+            MetadataDirective='COPY')
+        mock_on_object_copied.assert_called_once_with(mock_file2)
+
     @patch('switchboard.s3_util.boto3')
     def test_delete_bucket(self, mock_boto3):
         mock_bucket = Mock()
@@ -262,6 +403,18 @@ class S3ResourceTestCase(TestCase):
             GrantFullControl='id=user3',
             GrantRead='id=user4')
 
+    @patch('switchboard.s3_util.boto3')
+    def test_grant_bucket_acl_multiple_full_control_users(self, mock_boto3):
+        s3_resource = S3Resource(self.s3_user)
+        s3_resource.grant_bucket_acl(
+            bucket_name='somebucket',
+            grant_full_control_user=[Mock(s3_id='user1'), Mock(s3_id='user2')],
+        )
+
+        mock_bucket_acl_constructor = mock_boto3.session.Session.return_value.resource.return_value.BucketAcl
+        mock_bucket_acl_constructor.return_value.put.assert_called_with(
+            GrantFullControl='id=user1, id=user2')
+
     @patch('switchboard.s3_util.boto3')
     def test_get_bucket_owner(self, mock_boto3):
         bucket1 = Mock()
@@ -289,6 +442,46 @@ class S3ResourceTestCase(TestCase):
         self.assertEqual(s3_objects, ['<s3_object1>', '<s3_object2>'])
 
 
+class S3ResourceCacheTestCase(S3DeliveryTestBase):
+    def setUp(self):
+        super(S3ResourceCacheTestCase, self).setUp()
+        self.credential = S3UserCredential.objects.create(s3_user=self.s3_from_user, aws_secret_access_key='secret')
+
+    @patch('switchboard.s3_util.boto3')
+    def test_credential_change_invalidates_cached_resources(self, mock_boto3):
+        S3Resource(self.s3_from_user)
+        S3Resource(self.s3_from_user)
+        self.assertEqual(mock_boto3.session.Session.call_count, 1)
+
+        self.credential.aws_secret_access_key = 'secret2'
+        self.credential.save()
+        self.assertEqual(s3_resource_cache.get_thread_resources(), {})
+
+        s3_from_user = S3User.objects.get(pk=self.s3_from_user.id)
+        S3Resource(s3_from_user)
+        mock_boto3.session.Session.assert_called_with(aws_access_key_id='from_user_s3_id',
+                                                      aws_secret_access_key='secret2')
+
+    @patch('switchboard.s3_util.boto3')
+    def test_s3_user_delete_invalidates_cached_resources(self, mock_boto3):
+        S3Resource(self.s3_from_user)
+        self.assertEqual(len(s3_resource_cache.get_thread_resources()), 1)
+        self.s3_from_user.delete()
+        self.assertEqual(s3_resource_cache.get_thread_resources(), {})
+
+    @patch('switchboard.s3_util.boto3')
+    def test_resources_are_not_shared_between_threads(self, mock_boto3):
+        mock_boto3.session.Session.side_effect = lambda **kwargs: Mock()
+        s3_resource = S3Resource(self.s3_from_user)
+        self.assertEqual(S3Resource(self.s3_from_user).s3, s3_resource.s3)
+        thread_resources = []
+        thread = threading.Thread(target=lambda: thread_resources.append(S3Resource(self.s3_from_user)))
+        thread.start()
+        thread.join(5)
+        self.assertNotEqual(thread_resources[0].s3, s3_resource.s3)
+        self.assertEqual(mock_boto3.session.Session.call_count, 2)
+
+
 class S3BucketUtilTestCase(S3DeliveryTestBase):
     @patch('switchboard.s3_util.S3Resource')
     def test_user_owns_bucket(self, mock_s3_resource):
@@ -327,7 +520,7 @@ class S3BucketUtilTestCase(S3DeliveryTestBase):
     def test_get_objects_manifest(self, mock_s3_resource):
         mock_last_modified = Mock()
         mock_last_modified.isoformat.return_value = '2001-01-01 12:30'
-        mock_s3_resource.return_value.get_objects_for_bucket.return_value = [
+        mock_s3_resource.return_value.iter_objects_for_bucket.return_value = iter([
             Mock(
                 key='file1.txt',
                 metadata={'md5':'123'},
@@ -337,12 +530,12 @@ class S3BucketUtilTestCase(S3DeliveryTestBase):
                 content_type='text/plain',
                 version_id='1233'
             )
-        ]
+        ])
 
         s3_bucket_util = S3BucketUtil(self.endpoint, self.to_user)
         objects_manifest = s3_bucket_util.get_objects_manifest(bucket_name='test1')
 
-        mock_s3_resource.return_value.get_objects_for_bucket.assert_called_with('test1')
+        mock_s3_resource.return_value.iter_objects_for_bucket.assert_called_with('test1')
         self.assertEqual(objects_manifest, [
             {
                 'key': 'file1.txt',
@@ -502,14 +695,16 @@ class SendDeliveryOperationTestCase(S3DeliveryTestBase):
 
     @patch('switchboard.s3_util.S3BucketUtil')
     def test_record_object_manifest_step(self, mock_s3_bucket_util):
-        mock_s3_bucket_util.return_value.get_objects_manifest.return_value = [{'key': '123'}]
+        mock_s3_bucket_util.return_value.iter_objects_manifest.return_value = iter([{'key': '123'}])
 
         operation = SendDeliveryOperation(self.s3_delivery.id, 'http://someurl.com')
         operation.background_funcs = Mock()
         operation.record_object_manifest_step()
 
         self.s3_delivery.refresh_from_db()
-        self.assertEqual(self.s3_delivery.manifest.content, [{'key': '123'}])
+        self.assertEqual(self.s3_delivery.manifest.chunked, True)
+        self.assertEqual(self.s3_delivery.manifest.entry_count, 1)
+        self.assertEqual(list(self.s3_delivery.manifest.iter_entries()), [{'key': '123'}])
         operation.background_funcs.give_agent_permission.assert_called_with(self.s3_delivery.id, 'http://someurl.com')
 
     @patch('switchboard.s3_util.S3DeliveryUtil')